@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from api.program import combine_extracts, partition_applications_by_year, process_program_applications
+from constants import BACKFILL_WORKERS
+from instrumentation import record_rows, traced
+import multiprocessing
+import time
+
+
+def extract_fiscal_year(fiscal_year, applications, program):
+    """
+    Worker process: extract one fiscal year without prompting.
+
+    Returns the year, its DataFrames, the raw payloads they were built from and the time taken.
+    """
+    started = time.perf_counter()
+    payloads = []
+    investment_df, people_info_df, voucher_company_df = process_program_applications(
+        applications, program, interactive=False, payloads=payloads
+    )
+    return fiscal_year, investment_df, people_info_df, voucher_company_df, payloads, time.perf_counter() - started
+
+
+@traced()
+def extract_backfill(responses, fiscal_years, program, max_workers=BACKFILL_WORKERS, payloads=None):
+    """
+    Extract several fiscal years from one fetched application list, one worker process per year.
+
+    Workers never prompt; unmapped provinces and regions are resolved here afterwards. The years
+    are combined and deduplicated so the whole backfill loads as one batch. Spans inside the
+    workers are not reported; this one covers the whole extraction. Raw payloads are appended
+    to payloads if a list is given.
+    """
+    partitions = partition_applications_by_year(responses, fiscal_years)
+    record_rows(sum(len(applications) for applications in partitions.values()))
+    for fiscal_year in fiscal_years:
+        if not partitions[fiscal_year]:
+            print(f"⏭️  {fiscal_year}: no applications")
+
+    started = time.perf_counter()
+    extracted = {}
+    # Spawned rather than forked, so workers don't inherit an active --profile profiler (its
+    # tracemalloc tracing and possibly held locks) without the sampler thread that goes with it
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(extract_fiscal_year, fiscal_year, applications, program)
+                   for fiscal_year, applications in partitions.items() if applications]
+        for done, future in enumerate(as_completed(futures), 1):
+            fiscal_year, investment_df, people_info_df, voucher_company_df, year_payloads, seconds = future.result()
+            extracted[fiscal_year] = (investment_df, people_info_df, voucher_company_df)
+            if payloads is not None:
+                payloads.extend(year_payloads)
+            print(f"✅ [{done}/{len(futures)}] {fiscal_year}: {len(investment_df)} application(s) extracted in {seconds:.1f}s")
+
+    print(f"Extracted {len(extracted)} fiscal year(s) of {program['name']} in {time.perf_counter() - started:.1f}s")
+
+    # Fiscal year labels sort oldest first, so newer data wins the dedupe
+    return combine_extracts([extracted[fiscal_year] for fiscal_year in sorted(extracted)])
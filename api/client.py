@@ -5,12 +5,21 @@ import threading
 import logging
 from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from constants import HTTP_POOL_SIZE
+from instrumentation import count, record_bytes, traced
 
 load_dotenv()
 
 # Create a lock for thread-safe operations
 token_lock = threading.Lock()
 
+# Token state read from Blob once per process and updated in place by refresh_token
+_api_info = None
+# One pooled HTTP session shared by every request in the process
+_session = None
+_session_lock = threading.Lock()
+
 # --- Azure Blob Configuration ---
 AZURE_STORAGE_CONNECTION_STRING = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
 # Extract the container name to the environment variables to prevent cross-project collisions
@@ -31,8 +40,16 @@ def get_blob_client():
     return blob_service_client.get_blob_client(container=CONTAINER_NAME, blob=BLOB_NAME)
 
 def load_api_info():
-    """Reads the dynamic tokens from Blob and merges with static environment variables."""
+    """
+    Reads the dynamic tokens from Blob and merges with static environment variables.
+
+    The result is cached for the process; refresh_token updates the cached copy in place.
+    """
+    global _api_info
     with token_lock:
+        if _api_info is not None:
+            return _api_info
+
         blob_client = get_blob_client()
         
         try:
@@ -43,7 +60,7 @@ def load_api_info():
             raise
 
         # Merge the static secrets from App Settings with the dynamic tokens from Blob
-        return {
+        _api_info = {
             "api": {
                 "client_id": os.environ.get("CLIENT_ID"),
                 "client_secret": os.environ.get("CLIENT_SECRET"),
@@ -52,6 +69,7 @@ def load_api_info():
                 "access_token": dynamic_state.get("access_token")
             }
         }
+        return _api_info
 
 def refresh_token(api_info):
     """Refreshes the token via SMA and saves the new dynamic state back to Blob Storage."""
@@ -90,16 +108,39 @@ def refresh_token(api_info):
         return api_info
 
 def get_session(api_info):
-    session = requests.Session()
-    session.headers = {'Authorization': f"Bearer {api_info['api']['access_token']}"}
-    return session
+    """Return the shared session, pooling up to HTTP_POOL_SIZE connections, with the current bearer token."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount('https://', adapter)
+        _session.headers['Authorization'] = f"Bearer {api_info['api']['access_token']}"
+        return _session
+
+def reset_session():
+    """Drop the shared session; forked worker processes must not reuse the parent's sockets."""
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_session)
+
+def get_page(session, url, params):
+    """GET one page, counting the request and the bytes received."""
+    response = session.get(url, params=params)
+    count('http.requests')
+    count('http.bytes', len(response.content))
+    record_bytes(len(response.content))
+    return response.json()
 
+@traced('get_paginated')
 def get_paginated(session, base_url, endpoint, params):
     if params is None:
         params = {}
     responses = []
     try:
-        response = session.get(f"{base_url}{endpoint}", params=params).json()
+        response = get_page(session, f"{base_url}{endpoint}", params)
     except json.decoder.JSONDecodeError:
         return None
         
@@ -109,5 +150,5 @@ def get_paginated(session, base_url, endpoint, params):
     responses.append(response)
     for page in range(2, response.get("num_pages", 1) + 1):
         params['page'] = page
-        responses.append(session.get(f"{base_url}{endpoint}", params=params).json())
+        responses.append(get_page(session, f"{base_url}{endpoint}", params))
     return responses
\ No newline at end of file
@@ -0,0 +1,111 @@
+from constants import numeric_columns
+import pandas as pd
+
+EMAIL_PATTERN = r'([\w\.-]+@[\w\.-]+\.\w+)'
+APPLICATION_DATE_FORMATS = ["%Y-%m-%dT%H:%M:%S"]
+DECISION_DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"]
+# '/' is normalized to '-' first; month-first matches how SQL Server read these strings before
+INCORPORATION_DATE_FORMATS = ["%Y-%m-%d", "%m-%d-%Y"]
+
+
+def is_blank(values):
+    """True where a raw value is missing or only whitespace; blanks are not counted as unparseable."""
+    return values.isna() | values.astype('string').str.strip().eq('').fillna(True)
+
+
+def count_unparseable(counts, column, raw, parsed):
+    failed = int((~is_blank(raw) & parsed.isna()).sum())
+    if failed:
+        counts[column] = counts.get(column, 0) + failed
+
+
+def parse_money(values):
+    """'$1,250.00' -> 1250.0 for a whole column; anything else becomes NaN."""
+    text = values.astype('string').str.replace(r'[,$]', '', regex=True).str.strip()
+    # Back to object first so the result is plain float64 rather than a nullable dtype
+    return pd.to_numeric(text.astype(object), errors='coerce')
+
+
+def parse_dates(values, formats, iso_fallback=False):
+    """Parse a column trying each format in turn on the values still unparsed, then optionally ISO 8601."""
+    text = values.astype('string').str.strip()
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for date_format in formats + (['ISO8601'] if iso_fallback else []):
+        pending = parsed.isna() & text.notna() & text.ne('')
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(text[pending], format=date_format, errors='coerce')
+    return parsed
+
+
+def extract_emails(values):
+    """Pull the first email address out of each free-text answer, lowercased; None where there is none."""
+    emails = values.astype('string').str.strip().str.lower().str.extract(EMAIL_PATTERN, expand=False)
+    return emails.astype(object).where(emails.notna(), None)
+
+
+def coerce_investments(investment_df, counts):
+    if investment_df.empty:
+        return investment_df
+
+    for column in ['AmtRqstd', 'AmtAwarded']:
+        parsed = parse_money(investment_df[column])
+        count_unparseable(counts, column, investment_df[column], parsed)
+        investment_df[column] = parsed.fillna(0.0)
+
+    # Leverage is a quarter of the award, as before
+    leverage = investment_df['AmtAwarded'].where(investment_df['AmtAwarded'] > 0, 0.0) / 4
+    investment_df['TotalLevAmt'] = leverage
+    investment_df['PrivSectorLev'] = leverage
+
+    for column, formats, iso_fallback in [('ApplDate', APPLICATION_DATE_FORMATS, False),
+                                          ('DecisionDate', DECISION_DATE_FORMATS, True)]:
+        parsed = parse_dates(investment_df[column], formats, iso_fallback)
+        count_unparseable(counts, column, investment_df[column], parsed)
+        investment_df[column] = parsed
+
+    for column in numeric_columns:
+        parsed = pd.to_numeric(investment_df[column], errors='coerce')
+        count_unparseable(counts, column, investment_df[column], parsed)
+        investment_df[column] = parsed
+
+    investment_df['Email'] = extract_emails(investment_df['Email'])
+    return investment_df
+
+
+def coerce_people(people_info_df, counts):
+    if people_info_df.empty:
+        return people_info_df
+    people_info_df['Email'] = extract_emails(people_info_df['Email'])
+    return people_info_df
+
+
+def coerce_companies(voucher_company_df, counts):
+    if voucher_company_df.empty:
+        return voucher_company_df
+    raw = voucher_company_df['IncorporationDate'].astype('string').str.replace('/', '-', regex=False)
+    parsed = parse_dates(raw, INCORPORATION_DATE_FORMATS)
+    count_unparseable(counts, 'IncorporationDate', raw, parsed)
+    voucher_company_df['IncorporationDate'] = parsed
+    return voucher_company_df
+
+
+def report_unparseable(counts, label=''):
+    if not counts:
+        return
+    details = ', '.join(f"{column}: {count}" for column, count in sorted(counts.items()))
+    print(f"⚠️  Unparseable values{f' in {label}' if label else ''} (loaded as empty, amounts as 0) - {details}")
+
+
+def coerce_extracted(investment_df, people_info_df, voucher_company_df, label=''):
+    """
+    Turn the raw strings collected during extraction into typed columns, one whole column at a time.
+
+    Returns the three DataFrames and {column: count} of non-blank values that could not be parsed.
+    """
+    counts = {}
+    investment_df = coerce_investments(investment_df, counts)
+    people_info_df = coerce_people(people_info_df, counts)
+    voucher_company_df = coerce_companies(voucher_company_df, counts)
+    report_unparseable(counts, label)
+    return investment_df, people_info_df, voucher_company_df, counts
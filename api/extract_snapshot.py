@@ -0,0 +1,103 @@
+from datetime import datetime
+from api.program import apply_batch_schema
+from constants import EXTRACT_SNAPSHOT_DIR
+import json
+import logging
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+logging.basicConfig(level=logging.INFO)
+
+FRAMES = ['investment', 'people_info', 'voucher_company']
+PAYLOAD_COLUMNS = ['Program', 'ApplicationID', 'Application', 'Tasks', 'ApplicationForm']
+
+def snapshot_dir(batch_id, directory=EXTRACT_SNAPSHOT_DIR):
+    return os.path.join(directory, str(batch_id))
+
+def to_arrow(df):
+    """
+    The DataFrame as an Arrow table. Object columns mixing types (a number in one row, text in
+    the next) can't be typed by Arrow, so those are written as text with missing values kept.
+    """
+    df = df.reset_index(drop=True)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].map(lambda value: None if value is None or pd.isna(value) else str(value))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+def payloads_frame(payloads):
+    """One row per application with its raw responses as JSON text."""
+    return pd.DataFrame([{
+        'Program': payload['Program'],
+        'ApplicationID': payload['ApplicationID'],
+        'Application': json.dumps(payload['Application'], default=str),
+        'Tasks': json.dumps(payload['Tasks'], default=str),
+        'ApplicationForm': json.dumps(payload['ApplicationForm'], default=str),
+    } for payload in payloads], columns=PAYLOAD_COLUMNS)
+
+def write_extract_snapshot(batch_id, investment_df, people_info_df, voucher_company_df, payloads,
+                           programs, fiscal_years, directory=EXTRACT_SNAPSHOT_DIR):
+    """
+    Save a batch's extracted DataFrames and raw payloads under extracts/<batch_id>/ and return the path.
+
+    The files are uncompressed Arrow IPC (Feather v2), so --replay can memory-map them instead of
+    reading and decoding them.
+    """
+    path = snapshot_dir(batch_id, directory)
+    os.makedirs(path, exist_ok=True)
+    frames = dict(zip(FRAMES, [investment_df, people_info_df, voucher_company_df]))
+    frames['payloads'] = payloads_frame(payloads)
+    for name, df in frames.items():
+        feather.write_feather(to_arrow(df), os.path.join(path, f"{name}.arrow"), compression='uncompressed')
+
+    manifest = {
+        'batch_id': str(batch_id),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'programs': programs,
+        'fiscal_years': fiscal_years,
+        'rows': {name: len(df) for name, df in frames.items()},
+    }
+    with open(os.path.join(path, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=4)
+    logging.info(f"Wrote extract snapshot to {path}")
+    return path
+
+def read_frame(path):
+    # Strings are still copied into Python objects; numeric and dictionary buffers come from the map
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+def read_extract_snapshot(batch_id_or_path, directory=EXTRACT_SNAPSHOT_DIR):
+    """
+    Load a snapshot written by write_extract_snapshot, given its batch ID or directory.
+
+    Returns (manifest, investment_df, people_info_df, voucher_company_df) with the batch dtypes applied.
+    """
+    path = batch_id_or_path if os.path.isdir(batch_id_or_path) else snapshot_dir(batch_id_or_path, directory)
+    manifest_path = os.path.join(path, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No extract snapshot at {path}")
+
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    investment_df, people_info_df, voucher_company_df = apply_batch_schema(
+        *[read_frame(os.path.join(path, f"{name}.arrow")) for name in FRAMES]
+    )
+    return manifest, investment_df, people_info_df, voucher_company_df
+
+def read_payloads(batch_id_or_path, directory=EXTRACT_SNAPSHOT_DIR):
+    """The raw payloads of a snapshot, decoded back into the dicts SMApply returned."""
+    path = batch_id_or_path if os.path.isdir(batch_id_or_path) else snapshot_dir(batch_id_or_path, directory)
+    df = read_frame(os.path.join(path, 'payloads.arrow'))
+    return [{
+        'Program': row['Program'],
+        'ApplicationID': row['ApplicationID'],
+        'Application': json.loads(row['Application']),
+        'Tasks': json.loads(row['Tasks']),
+        'ApplicationForm': json.loads(row['ApplicationForm']),
+    } for row in df.to_dict('records')]
@@ -1,78 +1,105 @@
-from database.get import get_company_id_by_name, get_person_id_by_email 
-from database.insert import insert_into_company_asgmt, insert_into_project_asgmt
+from database.get import get_company_ids_by_name, get_existing_assignments, get_person_ids_by_email
+from database.insert import insert_assignments
 from database.connection import connect_to_db
-from api.utils import assignment_exists, safe_int
+from database.records import investment_links
+from api.utils import safe_int
+from instrumentation import record_rows, traced
 
 
+def normalize_link_key(value):
+    """Lowercase and trim an email or company name so lookups match the way the database collation does."""
+    if not isinstance(value, str):
+        return ""
+    return value.strip().lower()
+
+
+def build_link_ids(sources, key_column):
+    """Build {normalized key: id} from (DataFrame, id column) pairs; earlier sources take priority."""
+    ids = {}
+    for df, id_column in sources:
+        if df.empty or id_column not in df.columns or key_column not in df.columns:
+            continue
+        for key, entity_id in zip(df[key_column], df[id_column]):
+            key = normalize_link_key(key)
+            entity_id = safe_int(entity_id)
+            if key and entity_id is not None:
+                ids.setdefault(key, entity_id)
+    return ids
+
+
+def collect_new_links(refnums, keys, ids, linked):
+    """Return the (RefNum, id) pairs that are resolvable and not linked yet, without repeats."""
+    new_links = []
+    for refnum, key in zip(refnums, keys):
+        entity_id = ids.get(key)
+        if entity_id is None:
+            continue
+        link = (refnum, entity_id)
+        if link not in linked:
+            linked.add(link)
+            new_links.append(link)
+    return new_links
+
+
+@traced()
 def process_join_tables(investment_df,
                         people_insert_df, people_skip_df, people_update_df,
                         company_insert_df, company_skip_df, company_update_df,
                         batch_id, loaded_at):
+    """
+    Link each investment to its person and company in ProjectAsgmt / CompanyAsgmt.
+
+    IDs come from the load outcome first (generated IDs of inserted rows, then the skip and
+    update frames), then from one batched lookup for whatever is left. Existing links for the
+    batch are fetched in one query and only new links are inserted, all in a single transaction.
+    """
+    if investment_df.empty:
+        return
+
+    record_rows(len(investment_df))
+    links = investment_links(investment_df)
+    refnums = [link.RefNum for link in links]
+    emails = [normalize_link_key(link.Email) for link in links]
+    company_names = [normalize_link_key(link.CompanyName) for link in links]
+
+    person_ids = build_link_ids([
+        (people_insert_df, "_inserted_id"),
+        (people_skip_df, "_matched_existing_id"),
+        (people_update_df, "_update_target_id"),
+    ], "Email")
+    company_ids = build_link_ids([
+        (company_insert_df, "_inserted_id"),
+        (company_skip_df, "_matched_existing_id"),
+        (company_update_df, "_update_target_id"),
+    ], "CompanyName")
+
     conn = connect_to_db(False)
     if not conn:
         print("Unable to connect to DB for join table inserts.")
         return
 
     try:
-        linked_people = set()   # (refnum, person_id)
-        linked_companies = set()  # (refnum, company_id)
-
-        for _, investment in investment_df.iterrows():
-            refnum = investment["RefNum"]
-
-            # ---- Handle People ----
-            email = str(investment.get("Email", "")).strip().lower()
-            person_id = None
-
-            # check skip df
-            if not people_skip_df.empty and "_matched_existing_id" in people_skip_df.columns:
-                match_skip = people_skip_df[people_skip_df.get("Email", "").str.lower() == email]
-                if not match_skip.empty:
-                    person_id = safe_int(match_skip["_matched_existing_id"].iloc[0])
-
-            # check update df
-            if person_id is None and not people_update_df.empty and "_update_target_id" in people_update_df.columns:
-                match_update = people_update_df[people_update_df.get("Email", "").str.lower() == email]
-                if not match_update.empty:
-                    person_id = safe_int(match_update["_update_target_id"].iloc[0])
-
-            # fallback lookup
-            if person_id is None and email:
-                pid = get_person_id_by_email(email, conn)
-                if pid:
-                    person_id = safe_int(pid)
-
-            # insert only if not already linked
-            if person_id is not None:
-                key = (refnum, person_id)
-                if key not in linked_people and not assignment_exists("staging.ProjectAsgmt", refnum, person_id, conn):
-                    insert_into_project_asgmt(refnum, person_id, batch_id, loaded_at, conn)
-                    linked_people.add(key)
-
-            # ---- Handle Companies ----
-            company_name = str(investment.get("CompanyName", "")).strip()
-            company_id = None
-
-            if not company_skip_df.empty and "_matched_existing_id" in company_skip_df.columns:
-                match_skip = company_skip_df[company_skip_df.get("CompanyName", "") == company_name]
-                if not match_skip.empty:
-                    company_id = safe_int(match_skip["_matched_existing_id"].iloc[0])
-
-            if company_id is None and not company_update_df.empty and "_update_target_id" in company_update_df.columns:
-                match_update = company_update_df[company_update_df.get("CompanyName", "") == company_name]
-                if not match_update.empty:
-                    company_id = safe_int(match_update["_update_target_id"].iloc[0])
-
-            if company_id is None and company_name:
-                cid = get_company_id_by_name(company_name, conn)
-                if cid:
-                    company_id = safe_int(cid)
-
-            if company_id is not None:
-                key = (refnum, company_id)
-                if key not in linked_companies and not assignment_exists("staging.CompanyAsgmt", refnum, company_id, conn):
-                    insert_into_company_asgmt(refnum, company_id, batch_id, loaded_at, conn)
-                    linked_companies.add(key)
+        missing_emails = {email for email in emails if email and email not in person_ids}
+        for email, person_id in get_person_ids_by_email(missing_emails, conn).items():
+            person_ids.setdefault(email, safe_int(person_id))
+
+        missing_companies = {name for name in company_names if name and name not in company_ids}
+        for name, company_id in get_company_ids_by_name(missing_companies, conn).items():
+            company_ids.setdefault(name, safe_int(company_id))
+
+        unique_refnums = set(refnums)
+        linked_people = get_existing_assignments("staging.ProjectAsgmt", "PersonID", unique_refnums, conn)
+        linked_companies = get_existing_assignments("staging.CompanyAsgmt", "CompanyID", unique_refnums, conn)
+
+        new_people_links = collect_new_links(refnums, emails, person_ids, linked_people)
+        new_company_links = collect_new_links(refnums, company_names, company_ids, linked_companies)
+
+        # insert_assignments doesn't commit, so both join tables commit together below
+        people_failed = insert_assignments("staging.ProjectAsgmt", new_people_links, batch_id, loaded_at, conn)
+        company_failed = insert_assignments("staging.CompanyAsgmt", new_company_links, batch_id, loaded_at, conn)
+        conn.commit()
 
+        print(f"Linked {len(new_people_links) - len(people_failed)} project assignment(s) and "
+              f"{len(new_company_links) - len(company_failed)} company assignment(s)")
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
@@ -1,5 +1,5 @@
-from datetime import datetime
 from api.utils import choose_region
+from instrumentation import ask
 import os
 import json
 
@@ -16,7 +16,7 @@ def map_selector_of_research(selector_of_research_task, sector_mapping):
     
     return None  #for when no valid mapping was found
 
-def map_city_to_region(city):
+def map_city_to_region(city, interactive=True):
     json_path = 'city_to_region_mapping.json' # Adjust path if necessary
     
     # 1. Load the current mapping from the file
@@ -32,6 +32,10 @@ def map_city_to_region(city):
     if normalized_city in mapping:
         return mapping[normalized_city]
     
+    # Worker processes can't prompt; the parent resolves the region afterwards
+    elif not interactive:
+        return None
+
     # 3. If it doesn't exist, ask the user and save it immediately!
     else:
         region = choose_region(city) # Your existing prompt function
@@ -45,11 +49,13 @@ def map_city_to_region(city):
             
         return region
 
-def map_province(province_index, province_mapping, company_name):
+def map_province(province_index, province_mapping, company_name, interactive=True):
     if province_index in province_mapping:
         return province_mapping[province_index]
+    elif not interactive:
+        return None
     else:
-        return input(f"Enter province for company '{company_name}' (NB, NS, etc.): ").strip().upper()
+        return ask(f"Enter province for company '{company_name}' (NB, NS, etc.): ").strip().upper()
 
 def map_fiscal_year(fiscal_year):
     if fiscal_year == '2024':
@@ -58,20 +64,3 @@ def map_fiscal_year(fiscal_year):
         return '2022-2023'
     else:
         return fiscal_year
-    
-def map_decision_date(decision_date):
-    if not decision_date or str(decision_date).strip() == "":
-        return None
-    
-    decision_date = decision_date.strip()
-    date_formats = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"]
-    
-    for format in date_formats:
-        try:
-            return datetime.strptime(decision_date, format).replace(hour=0, minute=0, second=0, microsecond=0)
-        except ValueError:
-            continue
-    try:
-        return datetime.fromisoformat(decision_date)
-    except ValueError:
-        return None
\ No newline at end of file
@@ -1,7 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
 from api.tasks import get_application_task, get_application_task_ID, get_application_tasks
 from api.tables import get_investment, get_people_info, get_voucher_company
 from api.client import get_paginated, get_session, load_api_info, refresh_token
-from constants import numeric_columns
+from api.coerce import coerce_extracted
+from api.mapping import map_city_to_region, map_province
+from constants import province_mapping
+from database.schema import apply_schema, release_categories
+from instrumentation import record_rows, traced
+from profiling import profile_stage
 import pandas as pd
 
 
@@ -23,6 +29,7 @@ def get_program_ID(name):
             if result['name'].strip().lower() == name.strip().lower():
                 return result['id']
 
+@traced()
 def get_program_applications(id):
     data = load_api_info()
     session = get_session(data)
@@ -54,7 +61,30 @@ def filter_program_applications(responses, fiscal_year):
                 applications.append(result)
     return applications
 
-def process_program_applications(applications):
+def partition_applications_by_year(responses, fiscal_years):
+    """Split application pages into {fiscal year: applications} in one pass, like filter_program_applications per year."""
+    partitions = {fiscal_year: [] for fiscal_year in fiscal_years}
+    for page in responses:
+        for result in page.get('results', []):
+            fiscal_year = None
+            has_refnum = False
+            for custom_field in result.get('custom_fields', []):
+                if custom_field['name'] == 'Fiscal Year' and custom_field['value'] in partitions:
+                    fiscal_year = custom_field['value']
+                if custom_field['name'] == 'NBIF Reference Number' and custom_field['value']:
+                    has_refnum = True
+            if fiscal_year and has_refnum:
+                partitions[fiscal_year].append(result)
+    return partitions
+
+@traced()
+def process_program_applications(applications, program, interactive=True, payloads=None):
+    """
+    Fetch each application's tasks and build the Investment, PeopleInfo and VoucherCompany DataFrames.
+
+    If a payloads list is given, the raw responses each row was built from are appended to it.
+    """
+    record_rows(len(applications))
     investment_data = []
     people_info_data = []
     voucher_company_data = []
@@ -62,17 +92,118 @@ def process_program_applications(applications):
     for application in applications:
         id = application['id']
         tasks = get_application_tasks(id)
-        application_form_id = get_application_task_ID(tasks, 'IVF - Application Form')
+        application_form_id = get_application_task_ID(tasks, program['application_form_task'])
         application_form_task = get_application_task(id, application_form_id)
+        if payloads is not None:
+            payloads.append(application_payload(program, application, tasks, application_form_task))
 
-        investment_data.append(get_investment(application, tasks, application_form_task, id))
-        people_info_data.append(get_people_info(application_form_task))
-        voucher_company_data.append(get_voucher_company(application_form_task))
+        investment_data.append(get_investment(application, tasks, application_form_task, id, program))
+        people_info_data.append(get_people_info(application_form_task, program))
+        if program.get('company_labels'):
+            voucher_company_data.append(get_voucher_company(application_form_task, program, interactive))
 
     investment_df = pd.DataFrame(investment_data)
     people_info_df = pd.DataFrame(people_info_data)
     voucher_company_df = pd.DataFrame(voucher_company_data)
 
-    for col in numeric_columns:
-        investment_df[col] = pd.to_numeric(investment_df[col], errors='coerce')
-    return investment_df, people_info_df, voucher_company_df
\ No newline at end of file
+    with profile_stage('normalize'):
+        investment_df, people_info_df, voucher_company_df, _ = coerce_extracted(
+            investment_df, people_info_df, voucher_company_df, program['research_fund_id']
+        )
+        return apply_batch_schema(investment_df, people_info_df, voucher_company_df)
+
+def application_payload(program, application, tasks, application_form_task):
+    """The raw SMApply responses one application was extracted from."""
+    return {
+        'Program': program['name'],
+        'ApplicationID': application['id'],
+        'Application': application,
+        'Tasks': tasks,
+        'ApplicationForm': application_form_task,
+    }
+
+def apply_batch_schema(investment_df, people_info_df, voucher_company_df):
+    """Give the three batch DataFrames their compact table dtypes."""
+    return (apply_schema(investment_df, 'staging.Investment'),
+            apply_schema(people_info_df, 'staging.PeopleInfo'),
+            apply_schema(voucher_company_df, 'staging.VoucherCompany'))
+
+def resolve_deferred_mappings(voucher_company_df):
+    """Prompt for the provinces and regions non-interactive extraction could not map, asking once per unknown city."""
+    if voucher_company_df.empty:
+        return voucher_company_df
+
+    voucher_company_df = release_categories(voucher_company_df, ['Province', 'Region'])
+    if '_ProvinceIndex' in voucher_company_df.columns:
+        unmapped = voucher_company_df['Province'].isna() & voucher_company_df['_ProvinceIndex'].notna()
+        for index in voucher_company_df.index[unmapped]:
+            voucher_company_df.at[index, 'Province'] = map_province(
+                voucher_company_df.at[index, '_ProvinceIndex'],
+                province_mapping,
+                voucher_company_df.at[index, 'CompanyName']
+            )
+        voucher_company_df = voucher_company_df.drop(columns=['_ProvinceIndex'])
+
+    unmapped = voucher_company_df['Region'].isna() & voucher_company_df['City'].notna()
+    for city in voucher_company_df.loc[unmapped, 'City'].unique():
+        # map_city_to_region saves the answer, so later runs and workers know the city
+        region = map_city_to_region(city)
+        voucher_company_df.loc[unmapped & (voucher_company_df['City'] == city), 'Region'] = region
+
+    return voucher_company_df
+
+def dedupe_by_key(df, key_column):
+    """Keep the last row per key, case-insensitively; rows without a key are all kept."""
+    if df.empty or key_column not in df.columns:
+        return df
+    keys = df[key_column].astype(str).str.strip().str.lower()
+    return df[~keys.duplicated(keep='last') | df[key_column].isna()].reset_index(drop=True)
+
+def combine_extracts(extracts):
+    """
+    Combine (investment, people, company) DataFrames from several extractions into one batch.
+
+    Later extracts win on duplicate RefNum, Email or CompanyName, so pass them oldest first.
+    Mappings deferred by non-interactive extraction are resolved here.
+    """
+    if not extracts:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    investment_df = pd.concat([frames[0] for frames in extracts], ignore_index=True)
+    people_info_df = pd.concat([frames[1] for frames in extracts], ignore_index=True)
+    voucher_company_df = pd.concat([frames[2] for frames in extracts], ignore_index=True)
+
+    voucher_company_df = resolve_deferred_mappings(voucher_company_df)
+
+    investment_df = dedupe_by_key(investment_df, 'RefNum')
+    people_info_df = dedupe_by_key(people_info_df, 'Email')
+    voucher_company_df = dedupe_by_key(voucher_company_df, 'CompanyName')
+    # Concatenating categoricals with different categories falls back to object, so cast again
+    return apply_batch_schema(investment_df, people_info_df, voucher_company_df)
+
+def extract_program(program, fiscal_year, interactive=True, payloads=None):
+    """Fetch and extract one program's applications for a fiscal year."""
+    program_id = get_program_ID(program['name'])
+    if program_id is None:
+        print(f"❌ Program not found: {program['name']}")
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    responses = get_program_applications(program_id)
+    applications = filter_program_applications(responses, fiscal_year)
+    print(f"📥 {program['name']}: {len(applications)} application(s) for {fiscal_year}")
+    return process_program_applications(applications, program, interactive, payloads)
+
+def extract_programs(programs, fiscal_year, payloads=None):
+    """
+    Extract several programs concurrently, one thread each, and combine them into one batch.
+
+    The threads share the token cache and HTTP session pool. They don't prompt; unmapped
+    provinces and regions are asked for once all programs are in.
+    """
+    if len(programs) == 1:
+        return extract_program(programs[0], fiscal_year, payloads=payloads)
+
+    with ThreadPoolExecutor(max_workers=len(programs), thread_name_prefix='program-extract') as executor:
+        futures = [executor.submit(extract_program, program, fiscal_year, False, payloads) for program in programs]
+        extracts = [future.result() for future in futures]
+    return combine_extracts(extracts)
@@ -1,46 +1,36 @@
-from datetime import datetime
 from api.tasks import get_application_task, get_application_task_ID, get_task_value
-from api.mapping import map_fiscal_year, map_province, map_city_to_region, map_decision_date, map_selector_of_research
+from api.mapping import map_fiscal_year, map_province, map_city_to_region, map_selector_of_research
 from constants import sector_mapping, province_mapping
-from api.utils import clean_email, clean_value
 
 
-def get_investment(application, tasks, application_form_task, id):
+def get_labeled_values(application_form_task, labels):
+    """Read {column: form label} from an application form task into {column: response}."""
+    return {column: get_task_value(application_form_task, label) for column, label in labels.items()}
+
+
+def get_investment(application, tasks, application_form_task, id, program):
+    """Collect one application's investment fields as raw answers; api.coerce types them per column."""
     if not application:
         print(f"Skipping empty application: {id}")
         return None
 
-    research_fund_id = 'IVF'
-    application_title = get_task_value(application_form_task, 'Project Information: | Title of Project:')
-    executive_summary = get_task_value(application_form_task, 'Executive Summary:')
-    amount_requested = clean_value(get_task_value(application_form_task, 'Requested Contribution from NBIF:'))
+    research_fund_id = program['research_fund_id']
+    answers = get_labeled_values(application_form_task, program['investment_labels'])
+    application_title = answers.get('ApplTitle')
+    executive_summary = answers.get('ExecSum')
+    amount_requested = answers.get('AmtRqstd')
 
-    selector_of_research_id = get_application_task_ID(tasks, 'Select Sector of Research')
+    selector_of_research_id = get_application_task_ID(tasks, program['sector_task'])
     selector_of_research_task = get_application_task(id, selector_of_research_id)
     sector = map_selector_of_research(selector_of_research_task, sector_mapping)
     
-    created_at = application.get('created_at')
-    application_date = None
-    if created_at:
-        try:
-            application_date = datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S")
-        except (ValueError, TypeError):
-            print(f"Unexpected created_at format for application {id}: {created_at}")
-
+    application_date = application.get('created_at')
     decision = application.get('decision') or {}
-    awarded = decision.get('awarded')
-    amount_awarded = 0.0
-    if awarded:
-        try:
-            amount_awarded = clean_value(str(awarded))
-        except Exception as e:
-            print(f"Could not clean awarded value for application {id}: {awarded} ({e})")
-
-    total_leverage_amount = amount_awarded / 4 if amount_awarded > 0 else 0.00
+    amount_awarded = decision.get('awarded')
 
     refnum = ''
     fiscal_year = ''
-    decision_date = ''
+    decision_date = None
     for custom_field in application.get('custom_fields') or []:
         name = custom_field.get('name')
         value = custom_field.get('value')
@@ -49,8 +39,7 @@ def get_investment(application, tasks, application_form_task, id):
         elif name == 'Fiscal Year':
             fiscal_year = map_fiscal_year(value)
         elif name == 'Current Date for NOD':
-            if value:
-                decision_date = map_decision_date(value)
+            decision_date = value
     
     investment = {
         'RefNum': refnum,
@@ -62,8 +51,8 @@ def get_investment(application, tasks, application_form_task, id):
         'DecisionDate': decision_date,
         'AmtRqstd': amount_requested,
         'AmtAwarded': amount_awarded,
-        'TotalLevAmt': total_leverage_amount,
-        'PrivSectorLev': total_leverage_amount,
+        'TotalLevAmt': None,  # derived from AmtAwarded during coercion
+        'PrivSectorLev': None,
         'FedLeverage': None,
         'OtherLeverage': None,
         'FTE': None,
@@ -73,24 +62,19 @@ def get_investment(application, tasks, application_form_task, id):
     }
 
     #Appending email and company name for inserting records into assignment tables
-    email_response = get_task_value(application_form_task, 'Researcher Information: | PI E-mail Address:').strip().lower()
-    email = clean_email(email_response)
-    company_name = get_task_value(application_form_task, 'Company Information: | Company Name:')
-    investment['Email'] = email
-    investment['CompanyName'] = company_name
+    investment['Email'] = get_task_value(application_form_task, program['people_labels']['Email'])
+    company_labels = program.get('company_labels')
+    investment['CompanyName'] = get_task_value(application_form_task, company_labels['CompanyName']) if company_labels else None
 
     return investment
     
-def get_people_info(application_form_task):
-    last_name = get_task_value(application_form_task, 'Researcher Information: | PI Last Name:')
-    first_name = get_task_value(application_form_task, 'Researcher Information: | Principal Investigator (PI) First Name:')
-    email_response = get_task_value(application_form_task, 'Researcher Information: | PI E-mail Address:').strip().lower()
-    email = clean_email(email_response)
+def get_people_info(application_form_task, program):
+    answers = get_labeled_values(application_form_task, program['people_labels'])
 
     people_info = {
-        'LastName': last_name,
-        'FirstName': first_name,
-        'Email': email,
+        'LastName': answers.get('LastName'),
+        'FirstName': answers.get('FirstName'),
+        'Email': answers.get('Email'),
         'Phone': None,
         'Note': None,
         'CommOptOut': None
@@ -98,17 +82,18 @@ def get_people_info(application_form_task):
 
     return people_info
 
-def get_voucher_company(application_form_task):
-    company_name = get_task_value(application_form_task, 'Company Information: | Company Name:')
-    address = get_task_value(application_form_task, 'Company Information: | Company Street Address:')
-    city = get_task_value(application_form_task, 'Company Information: | City:')
-    province_index = get_task_value(application_form_task, 'Company Information: | Province:')
-    postal_code = get_task_value(application_form_task, 'Company Information: | Postal Code:')
-    incorporation_date = get_task_value(application_form_task, 'Company Information: | Date of Incorporation:').replace('/', '-')
+def get_voucher_company(application_form_task, program, interactive=True):
+    answers = get_labeled_values(application_form_task, program['company_labels'])
+    company_name = answers.get('CompanyName')
+    address = answers.get('Address')
+    city = answers.get('City')
+    province_index = answers.get('Province')
+    postal_code = answers.get('PostalCode')
+    incorporation_date = answers.get('IncorporationDate')
 
     
-    province = map_province(province_index, province_mapping, company_name)
-    region = map_city_to_region(city)
+    province = map_province(province_index, province_mapping, company_name, interactive)
+    region = map_city_to_region(city, interactive)
 
     voucher_company = {
         'CompanyName': company_name,
@@ -121,4 +106,8 @@ def get_voucher_company(application_form_task):
         'Region': region
     }
 
+    # Keep the raw answer so an unmapped province can still be resolved after extraction
+    if province is None and not interactive:
+        voucher_company['_ProvinceIndex'] = province_index
+
     return voucher_company
\ No newline at end of file
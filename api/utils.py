@@ -1,18 +1,9 @@
 import pandas as pd
-import re
 import time
 import sys
 import readchar
 from constants import banner, years, regions
-
-def assignment_exists(table_name, refnum, entity_id, conn):
-    """Check if an association already exists in the join table."""
-    cursor = conn.cursor()
-    if table_name == "staging.ProjectAsgmt":
-        cursor.execute("SELECT 1 FROM staging.ProjectAsgmt WHERE RefNum = ? AND PersonID = ?", (refnum, entity_id))
-    else:
-        cursor.execute("SELECT 1 FROM staging.CompanyAsgmt WHERE RefNum = ? AND CompanyID = ?", (refnum, entity_id))
-    return cursor.fetchone() is not None
+from instrumentation import human_wait
 
 def safe_int(val):
     """Convert to int if it's a real number, otherwise return None."""
@@ -29,30 +20,6 @@ def remove_duplicates(df):
     df.drop_duplicates(inplace=True)
     return df
 
-def clean_email(email_response):
-    if not email_response or not isinstance(email_response, str):
-        return None
-    
-    # Common regex for email detection
-    email_pattern = r'[\w\.-]+@[\w\.-]+\.\w+'
-    email = re.search(email_pattern, email_response)
-    if email:
-        return email.group(0).lower().strip()
-    return None
-
-def clean_value(string_value):
-    if string_value is None:
-        return 0.0
-    if isinstance(string_value, (int, float)):
-        return float(string_value)
-    try:
-        s = str(string_value)
-        for old, new in [(",", ""), ("$", "")]:
-            s = s.replace(old, new)
-        return float(s)
-    except (ValueError, TypeError):
-        return 0.0
-
 def print_intro():
     banner
     for char in banner:
@@ -68,7 +35,8 @@ def choose_fiscal_year():
     while True:
         print(f"\rSelect year: {years[index]}  ", end="", flush=True)
         
-        key = readchar.readkey()
+        with human_wait():
+            key = readchar.readkey()
         
         if key == readchar.key.RIGHT or key == readchar.key.DOWN or key == " ":
             index = (index + 1) % len(years)
@@ -84,7 +52,8 @@ def choose_region(city):
     while True:
         print(f"\rEnter region for city '{city}': {regions[index]}  ", end="", flush=True)
         
-        key = readchar.readkey()
+        with human_wait():
+            key = readchar.readkey()
         
         if key == readchar.key.RIGHT or key == readchar.key.DOWN or key == " ":
             index = (index + 1) % len(regions)
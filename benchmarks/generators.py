@@ -0,0 +1,164 @@
+"""Synthetic staging data for the benchmarks: companies, people and investments that look like SMApply extracts."""
+import random
+import uuid
+from datetime import datetime
+import pandas as pd
+
+WORDS = ['Atlantic', 'Maritime', 'Fundy', 'Bay', 'River', 'Digital', 'Ocean', 'Forest', 'Bio', 'Labs',
+         'Energy', 'Data', 'North', 'Harbour', 'Valley', 'Green', 'Smart', 'Coastal', 'Precision', 'Agri',
+         'Acadian', 'Tidal', 'Spruce', 'Granite', 'Lobster', 'Maple', 'Quantum', 'Nova', 'Aurora', 'Summit']
+SUFFIXES = ['Inc.', 'Inc', 'Ltd.', 'Limited', 'Corp.', 'Corporation', 'Technologies', 'Solutions',
+            'Group', 'Holdings', 'Co.', 'Enterprises', '']
+# How applicants write a trade name next to the legal one
+OPERATING_FORMS = ['{legal} dba {trade}', '{legal}, operating as {trade}', '{legal} doing business as {trade}',
+                   'Operating business name: {trade}, {legal}']
+FIRST_NAMES = ['Anne', 'Luc', 'Marie', 'Paul', 'Chloe', 'Owen', 'Julie', 'Marc', 'Sarah', 'Pierre',
+               'Nathalie', 'Andre', 'Emily', 'Daniel', 'Sophie', 'Kevin', 'Josee', 'Ryan', 'Monique', 'Eric']
+LAST_NAMES = ['LeBlanc', 'Cormier', 'Gallant', 'Richard', 'Arsenault', 'Doucet', 'Smith', 'MacDonald',
+              'Robichaud', 'Landry', 'Thibodeau', 'Savoie', 'Boudreau', 'MacLean', 'Goguen', 'Comeau']
+TITLES = ['', '', '', '', 'Dr. ', 'Mr. ', 'Ms. ']
+# The lists above are the common words; most names start with a word of their own instead, so
+# blocking on the first word is about as selective as on a real registry
+COMMON_WORD_RATE = 0.1
+COMMON_LAST_NAME_RATE = 0.3
+# English letter frequencies (%), for made-up words that spread over prefixes and Soundex codes like real ones
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+LETTER_WEIGHTS = [8.2, 1.5, 2.8, 4.3, 12.7, 2.2, 2.0, 6.1, 7.0, 0.15, 0.8, 4.0, 2.4,
+                  6.7, 7.5, 1.9, 0.1, 6.0, 6.3, 9.1, 2.8, 1.0, 2.4, 0.15, 2.0, 0.07]
+EMAIL_DOMAINS = ['gmail.com', 'outlook.com', 'unb.ca', 'umoncton.ca', 'nbif.ca', 'example.com']
+CITIES = ['Moncton', 'Fredericton', 'Saint John', 'Bathurst', 'Dieppe', 'Miramichi', 'Edmundston', 'Sackville']
+# Share of records with one typo, about what free-text application forms show
+TYPO_RATE = 0.05
+
+
+def add_typo(text, rng):
+    """One keyboard slip: drop, repeat, swap or replace a character."""
+    if len(text) < 3:
+        return text
+    position = rng.randrange(1, len(text) - 1)
+    kind = rng.choice(['drop', 'repeat', 'swap', 'replace'])
+    if kind == 'drop':
+        return text[:position] + text[position + 1:]
+    if kind == 'repeat':
+        return text[:position] + text[position] + text[position:]
+    if kind == 'swap':
+        return text[:position - 1] + text[position] + text[position - 1] + text[position + 1:]
+    return text[:position] + rng.choice('abcdefghijklmnopqrstuvwxyz') + text[position + 1:]
+
+
+def maybe_typo(text, rate, rng):
+    return add_typo(text, rng) if rng.random() < rate else text
+
+
+def made_up_word(rng):
+    return ''.join(rng.choices(LETTERS, LETTER_WEIGHTS, k=rng.randint(4, 9))).capitalize()
+
+
+def distinctive_word(common_words, rate, rng):
+    """A word from common_words `rate` of the time, otherwise a made-up one."""
+    return rng.choice(common_words) if rng.random() < rate else made_up_word(rng)
+
+
+def company_name(rng):
+    legal = f"{distinctive_word(WORDS, COMMON_WORD_RATE, rng)} {rng.choice(WORDS)} {rng.choice(SUFFIXES)}".strip()
+    if rng.random() < 0.1:
+        trade = f"{distinctive_word(WORDS, COMMON_WORD_RATE, rng)} {rng.choice(WORDS)}"
+        return rng.choice(OPERATING_FORMS).format(legal=legal, trade=trade)
+    return legal
+
+
+def synthetic_companies(rows, seed=0):
+    """Existing VoucherCompany rows: legal names with suffixes, some with dba / operating-as trade names."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'CompanyID': range(1, rows + 1),
+        'CompanyName': [company_name(rng) for _ in range(rows)],
+        'Address': [f"{rng.randint(1, 999)} Main St" for _ in range(rows)],
+        'City': [rng.choice(CITIES) for _ in range(rows)],
+        'Province': ['NB'] * rows,
+        'PostalCode': [f"E{rng.randint(1, 9)}A {rng.randint(1, 9)}B{rng.randint(1, 9)}" for _ in range(rows)],
+        'Country': ['Canada'] * rows,
+        'Region': [rng.choice(['SE', 'NW', 'Central', 'SW', 'NE']) for _ in range(rows)],
+    })
+
+
+def synthetic_people(rows, seed=0):
+    """Existing PeopleInfo rows with unique emails."""
+    rng = random.Random(seed)
+    first_names = [rng.choice(FIRST_NAMES) for _ in range(rows)]
+    last_names = [distinctive_word(LAST_NAMES, COMMON_LAST_NAME_RATE, rng) for _ in range(rows)]
+    return pd.DataFrame({
+        'PersonID': range(1, rows + 1),
+        'FirstName': first_names,
+        'LastName': last_names,
+        'Email': [f"{first.lower()}.{last.lower()}{i}@{rng.choice(EMAIL_DOMAINS)}"
+                  for i, (first, last) in enumerate(zip(first_names, last_names))],
+        'Phone': [f"506-555-{rng.randint(0, 9999):04d}" for _ in range(rows)],
+    })
+
+
+def company_batch(existing_df, rows, overlap=0.3, typo_rate=TYPO_RATE, seed=1):
+    """
+    A batch of incoming companies: `overlap` of them re-submit an existing company, with a
+    different suffix or a typo now and then; the rest are new. '_source_id' holds the CompanyID
+    a re-submission came from, None for new companies.
+    """
+    rng = random.Random(seed)
+    names, sources = [], []
+    for _ in range(rows):
+        if len(existing_df) and rng.random() < overlap:
+            position = rng.randrange(len(existing_df))
+            name = existing_df['CompanyName'].iat[position]
+            if rng.random() < 0.3:
+                name = f"{name} {rng.choice(SUFFIXES)}".strip()
+            names.append(maybe_typo(name, typo_rate, rng))
+            sources.append(int(existing_df['CompanyID'].iat[position]))
+        else:
+            names.append(company_name(rng))
+            sources.append(None)
+    batch = synthetic_companies(rows, seed).drop(columns=['CompanyID'])
+    batch['CompanyName'] = names
+    batch['_source_id'] = sources
+    return batch
+
+
+def people_batch(existing_df, rows, overlap=0.3, typo_rate=TYPO_RATE, seed=1):
+    """
+    A batch of incoming people: `overlap` of them are existing people who may have mistyped their
+    name or email, or signed with a title; the rest are new. '_source_id' holds the PersonID a
+    returning person came from, None for new people.
+    """
+    rng = random.Random(seed)
+    batch = synthetic_people(rows, seed + len(existing_df)).drop(columns=['PersonID'])
+    batch['Email'] = [email.replace('@', f"{len(existing_df) + i}@", 1) for i, email in enumerate(batch['Email'])]
+    batch['_source_id'] = None
+    for i in range(rows):
+        if len(existing_df) and rng.random() < overlap:
+            existing = existing_df.iloc[rng.randrange(len(existing_df))]
+            batch.at[i, 'FirstName'] = rng.choice(TITLES) + maybe_typo(existing['FirstName'], typo_rate, rng)
+            batch.at[i, 'LastName'] = maybe_typo(existing['LastName'], typo_rate, rng)
+            batch.at[i, 'Email'] = maybe_typo(existing['Email'], typo_rate, rng)
+            batch.at[i, '_source_id'] = int(existing['PersonID'])
+    return batch
+
+
+def investment_batch(people_df, companies_df, rows, seed=1):
+    """Investments linking to people and companies by Email and CompanyName, as extraction produces them."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'RefNum': [f"BENCH-{seed}-{i:07d}" for i in range(rows)],
+        'ApplTitle': [f"Project {i}" for i in range(rows)],
+        'FiscalYear': [rng.choice(['2022-2023', '2023-2024', '2024-2025']) for _ in range(rows)],
+        'ResearchFundID': ['IVF'] * rows,
+        'AmtRqstd': [float(rng.randint(5, 50) * 1000) for _ in range(rows)],
+        'Email': [people_df['Email'].iat[rng.randrange(len(people_df))] for _ in range(rows)],
+        'CompanyName': [companies_df['CompanyName'].iat[rng.randrange(len(companies_df))] for _ in range(rows)],
+    })
+
+
+def stamp(df, batch_id=None, loaded_at=None):
+    """Add BatchID/LoadedAt the way sync does before writing."""
+    df = df.copy()
+    df['BatchID'] = batch_id or uuid.uuid4()
+    df['LoadedAt'] = loaded_at or datetime.now()
+    return df
@@ -0,0 +1,99 @@
+"""
+Per-row cost of iterating batch and existing-record DataFrames, before and after the record types.
+
+    python -m benchmarks.row_iteration --rows 100000
+
+"Before" is the iterrows() code the dedup and sync modules used to run; "after" is the current code.
+"""
+from difflib import SequenceMatcher
+from database.normalize import normalize_company_name, normalize_person_name
+from database.records import company_records, person_records
+from database.similar import find_similar_companies, find_similar_people
+from database.utils import extract_operating_name
+from benchmarks.generators import synthetic_companies, synthetic_people
+import argparse
+import time
+
+
+def similar_companies_before(new_company, existing_df, similarity_threshold=0.8):
+    new_normalized = normalize_company_name(extract_operating_name(new_company['CompanyName']))
+    similar = []
+    for _, existing in existing_df.iterrows():
+        existing_normalized = normalize_company_name(extract_operating_name(existing['CompanyName']))
+        similarity = SequenceMatcher(None, new_normalized, existing_normalized).ratio()
+        if similarity >= similarity_threshold:
+            similar.append({'company_id': existing['CompanyID'], 'similarity': similarity,
+                            'address': existing.get('Address', ''), 'city': existing.get('City', '')})
+    return similar
+
+
+def similar_people_before(new_person, existing_df, similarity_threshold=0.8):
+    new_email = new_person['Email'].strip().lower()
+    new_normalized = normalize_person_name(new_person['FirstName'] + new_person['LastName'])
+    similar = []
+    for _, existing in existing_df.iterrows():
+        existing_email = existing.get('Email').strip().lower()
+        existing_normalized = normalize_person_name(existing['FirstName'] + existing['LastName'])
+        if new_email == existing_email:
+            similarity = 1.0
+        else:
+            similarity = SequenceMatcher(None, new_normalized, existing_normalized).ratio()
+        if similarity >= similarity_threshold:
+            similar.append({'person_id': existing['PersonID'], 'similarity': similarity})
+    return similar
+
+
+def per_row(label, rows, run):
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+    print(f"  {label:<48} {seconds:8.2f}s  {seconds / rows * 1e6:8.2f} µs/row")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--new-records', type=int, default=5,
+                        help="New records matched against the existing rows (the per-record loop)")
+    args = parser.parse_args()
+
+    companies = synthetic_companies(args.rows)
+    people = synthetic_people(args.rows)
+    new_companies = synthetic_companies(args.new_records, seed=1).to_dict('records')
+    new_people = synthetic_people(args.new_records, seed=1).to_dict('records')
+    scored_rows = args.rows * args.new_records
+
+    print(f"Row iteration over {args.rows} row(s)")
+    before = per_row("iterrows(), field access", args.rows,
+                     lambda: [(row['CompanyID'], row['CompanyName'], row['City']) for _, row in companies.iterrows()])
+    after = per_row("itertuples(), field access", args.rows,
+                    lambda: [(row.CompanyID, row.CompanyName, row.City) for row in companies.itertuples(index=False)])
+    print(f"  {'':<48} {before / after:8.1f}x")
+    before = per_row("iterrows(), dict per row", args.rows, lambda: [row.to_dict() for _, row in companies.iterrows()])
+    after = per_row("to_dict('records')", args.rows, lambda: companies.to_dict('records'))
+    print(f"  {'':<48} {before / after:8.1f}x")
+
+    print(f"\nDuplicate scoring, {args.new_records} new record(s) x {args.rows} existing row(s)")
+    before = per_row("companies, iterrows + normalize per comparison", scored_rows,
+                     lambda: [similar_companies_before(company, companies) for company in new_companies])
+
+    def companies_after():
+        existing = company_records(companies)
+        return [find_similar_companies(company, existing) for company in new_companies]
+
+    after = per_row("companies, CompanyRecords built once", scored_rows, companies_after)
+    print(f"  {'':<48} {before / after:8.1f}x")
+    before = per_row("people, iterrows + normalize per comparison", scored_rows,
+                     lambda: [similar_people_before(person, people) for person in new_people])
+
+    def people_after():
+        existing = person_records(people)
+        return [find_similar_people(person, existing) for person in new_people]
+
+    after = per_row("people, PersonRecords built once", scored_rows, people_after)
+    print(f"  {'':<48} {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Benchmark the dedup and load paths against a local SQLite staging database.
+
+    python -m benchmarks.suite --sizes 1000 10000 100000 1000000
+
+Every size gets a fresh database with that many existing companies and people. Each run appends
+one JSON line to the history file, so numbers can be compared across commits. The
+get_blocking_candidates case also records the share of the table it read (candidate_ratio) and
+the share of re-submitted companies among the candidates (recall).
+"""
+from benchmarks.generators import (company_batch, investment_batch, people_batch, stamp,
+                                   synthetic_companies, synthetic_people)
+from constants import TABLE_CONFIGS
+from database.blocking import backfill_blocking_keys, get_blocking_candidates
+from database.connection import close_pool, connect_to_db, use_backend
+from database.get import get_existing_records_with_ids
+from database.insert import build_param_rows, insert_new_records, split_insert_update
+from database.normalize import normalize_company_name
+from database.records import company_records, person_records
+from database.similar import find_similar_companies, find_similar_people
+from api.joins import process_join_tables
+from contextlib import redirect_stdout
+from datetime import datetime
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import uuid
+import pandas as pd
+
+CASES = ['normalize_company_name', 'find_similar_companies', 'find_similar_people',
+         'split_insert_update', 'get_existing_records_with_ids', 'get_blocking_candidates',
+         'insert_new_records', 'process_join_tables']
+DEFAULT_HISTORY = os.path.join('benchmarks', 'history.jsonl')
+
+
+def timed(run, repeat=1):
+    """Best wall time of `repeat` runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def preload(table_name, df):
+    """Write existing rows, IDs included, straight into a staging table."""
+    config = TABLE_CONFIGS[table_name]
+    columns = [config['id_column']] + [col for col in config['columns'] if col in df.columns]
+    conn = connect_to_db(False)
+    try:
+        with conn.cursor() as cursor:
+            cursor.fast_executemany = True
+            cursor.executemany(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                               build_param_rows(df, columns))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def quietly(run):
+    """Run without the per-row progress prints, which would dominate the timings."""
+    def wrapper():
+        with redirect_stdout(io.StringIO()):
+            return run()
+    return wrapper
+
+
+def run_size(size, batch, score_batch, cases, repeat, directory):
+    """Run the selected cases against `size` existing rows and return their results."""
+    use_backend('sqlite', os.path.join(directory, f"bench_{size}.sqlite3"))
+    companies = synthetic_companies(size)
+    people = synthetic_people(size)
+    new_companies = company_batch(companies, batch)
+    new_people = people_batch(people, batch)
+    # The existing row each re-submitted company came from, kept out of the frames the cases load
+    company_sources = new_companies.pop('_source_id')
+    new_people = new_people.drop(columns=['_source_id'])
+    results = []
+
+    def record(case, seconds, rows, batch_rows=batch, **extra):
+        results.append({'case': case, 'existing_rows': size, 'batch_rows': batch_rows, 'seconds': round(seconds, 6),
+                        'rows': rows, 'us_per_row': round(seconds / rows * 1e6, 3) if rows else None, **extra})
+        print(f"  {case:<30} {size:>9} {seconds:10.3f}s {results[-1]['us_per_row']:12.3f} µs/row"
+              + ''.join(f"  {key} {value}" for key, value in extra.items()))
+
+    if 'normalize_company_name' in cases:
+        names = companies['CompanyName'].tolist()
+        record('normalize_company_name', timed(lambda: [normalize_company_name(name) for name in names], repeat), size)
+
+    # Scoring compares every batch record with every existing row, so it uses a smaller batch
+    if 'find_similar_companies' in cases:
+        def score_companies():
+            existing = company_records(companies)
+            return [find_similar_companies(company, existing, 0.75)
+                    for company in new_companies.head(score_batch).to_dict('records')]
+        record('find_similar_companies', timed(score_companies, repeat), size * score_batch, score_batch)
+
+    if 'find_similar_people' in cases:
+        def score_people():
+            existing = person_records(people)
+            return [find_similar_people(person, existing, 0.75)
+                    for person in new_people.head(score_batch).to_dict('records')]
+        record('find_similar_people', timed(score_people, repeat), size * score_batch, score_batch)
+
+    if 'split_insert_update' in cases:
+        record('split_insert_update',
+               timed(lambda: split_insert_update(new_companies.copy(), companies, 'CompanyName'), repeat), batch)
+
+    if {'get_existing_records_with_ids', 'get_blocking_candidates', 'insert_new_records',
+        'process_join_tables'} & set(cases):
+        preload('staging.VoucherCompany', companies)
+        preload('staging.PeopleInfo', people)
+
+    def fetch(read):
+        conn = connect_to_db(False)
+        try:
+            return read(conn)
+        finally:
+            conn.close()
+
+    # The two ways of reading existing companies for duplicate matching: the whole table, or
+    # only the rows sharing a blocking key with the batch
+    if 'get_existing_records_with_ids' in cases:
+        record('get_existing_records_with_ids', timed(quietly(lambda: fetch(
+            lambda conn: get_existing_records_with_ids('staging.VoucherCompany', conn=conn))), repeat), batch)
+
+    if 'get_blocking_candidates' in cases:
+        # Preloaded rows have no match keys yet; filling them in is a one-off, so it isn't timed
+        fetch(lambda conn: backfill_blocking_keys('staging.VoucherCompany', conn))
+        read = quietly(lambda: fetch(lambda conn: get_blocking_candidates('staging.VoucherCompany', new_companies, conn)))
+        seconds = timed(read, repeat)
+        # How much of the table blocking reads, and how many re-submitted companies it still finds
+        candidate_ids = set(read()['CompanyID'].tolist())
+        resubmitted = [int(source) for source in company_sources.dropna()]
+        record('get_blocking_candidates', seconds, batch,
+               candidates=len(candidate_ids), candidate_ratio=round(len(candidate_ids) / size, 4),
+               recall=round(sum(source in candidate_ids for source in resubmitted) / len(resubmitted), 4)
+               if resubmitted else None)
+
+    if 'insert_new_records' in cases:
+        insert_df = stamp(new_companies)
+
+        def insert():
+            conn = connect_to_db(False)
+            try:
+                return insert_new_records(insert_df, 'staging.VoucherCompany', conn)
+            finally:
+                conn.close()
+        record('insert_new_records', timed(quietly(insert)), batch)
+
+    if 'process_join_tables' in cases:
+        investments = investment_batch(people, companies, batch)
+        empty = pd.DataFrame()
+        record('process_join_tables', timed(quietly(lambda: process_join_tables(
+            investments, empty, empty, empty, empty, empty, empty, uuid.uuid4(), datetime.now()))), batch)
+
+    close_pool()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_history(path, results, args):
+    entry = {
+        'run_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'backend': 'sqlite',
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as file:
+        file.write(json.dumps(entry) + '\n')
+    print(f"\nAppended {len(results)} result(s) to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Existing rows per staging table (1M-row scoring takes a while)")
+    parser.add_argument('--batch', type=int, default=1000, help="Incoming rows per batch for the load cases")
+    parser.add_argument('--score-batch', type=int, default=20,
+                        help="Incoming rows scored against every existing row in the find_similar cases")
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per in-memory case; the best is kept")
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help=f"History file (default {DEFAULT_HISTORY})")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='nbif-bench-') as directory:
+        for size in args.sizes:
+            print(f"\n{size} existing row(s), batch of {args.batch} (scoring {args.score_batch})")
+            results.extend(run_size(size, args.batch, args.score_batch, args.cases, args.repeat, directory))
+    append_history(args.history, results, args)
+
+
+if __name__ == "__main__":
+    main()
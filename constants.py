@@ -1,3 +1,5 @@
+import os
+
 numeric_columns = ['FedLeverage', 'OtherLeverage', 'FTE', 'PTE']
 
 sector_mapping = {
@@ -76,28 +78,162 @@ TABLE_CONFIGS = {
             'ApplDate', 'DecisionDate', 'AmtRqstd', 'AmtAwarded', 'TotalLevAmt',
             'PrivSectorLev', 'FedLeverage', 'OtherLeverage', 'FTE', 'PTE',
             'NBIFSectorID', 'Notes', 'BatchID', 'LoadedAt'
-        ]
+        ],
+        # Compact dtypes for the batch DataFrame; text columns not listed stay as they are
+        'dtypes': {
+            'FiscalYear': 'category', 'ResearchFundID': 'category', 'NBIFSectorID': 'category',
+            'ApplDate': 'datetime64[ns]', 'DecisionDate': 'datetime64[ns]',
+            'AmtRqstd': 'float64', 'AmtAwarded': 'float64', 'TotalLevAmt': 'float64',
+            'PrivSectorLev': 'float64', 'FedLeverage': 'float64', 'OtherLeverage': 'float64',
+            'FTE': 'float64', 'PTE': 'float64',
+            'BatchID': 'category', 'LoadedAt': 'datetime64[ns]'
+        }
     },
     'staging.VoucherCompany': {
         'unique_column': 'CompanyName',
+        'id_column': 'CompanyID',
         'filter_column': None,
+        'match_columns': ['CompanyID', 'CompanyName', 'Address', 'City', 'Province'],
         'columns': [
             'CompanyName', 'Address', 'City', 'Province',
             'PostalCode', 'Country', 'Region', 'IncorporationDate',
+            'MatchName', 'BlockPrefix', 'BlockPhonetic', 'BlockTrigram',
             'BatchID', 'LoadedAt'
-        ]
+        ],
+        'dtypes': {
+            'Province': 'category', 'Country': 'category', 'Region': 'category',
+            'IncorporationDate': 'datetime64[ns]',
+            'BatchID': 'category', 'LoadedAt': 'datetime64[ns]'
+        }
     }
     ,
     'staging.PeopleInfo': {
         'unique_column': 'Email',
+        'id_column': 'PersonID',
         'filter_column': None,
+        'match_columns': ['PersonID', 'LastName', 'FirstName', 'Email'],
         'columns': [
             'LastName', 'FirstName', 'Email', 'Phone', 
-            'Note', 'CommOptOut', 'BatchID', 'LoadedAt'
-        ]
+            'Note', 'CommOptOut',
+            'MatchName', 'BlockPrefix', 'BlockPhonetic', 'BlockTrigram',
+            'BatchID', 'LoadedAt'
+        ],
+        'dtypes': {
+            'CommOptOut': 'category',
+            'BatchID': 'category', 'LoadedAt': 'datetime64[ns]'
+        }
+    }
+}
+
+# IDs attached while resolving duplicates and loading; nullable so unresolved rows stay empty
+RESOLVED_ID_DTYPES = {
+    '_inserted_id': 'Int64',
+    '_matched_existing_id': 'Int64',
+    '_update_target_id': 'Int64'
+}
+
+# SMApply programs the loader can extract. Label maps go from staging column to the form question
+# label in the program's application form task; the generic extractors in api/tables.py read them.
+PROGRAM_CONFIGS = {
+    'IVF': {
+        'name': 'Innovation Voucher Fund',
+        'research_fund_id': 'IVF',
+        'application_form_task': 'IVF - Application Form',
+        'sector_task': 'Select Sector of Research',
+        'investment_labels': {
+            'ApplTitle': 'Project Information: | Title of Project:',
+            'ExecSum': 'Executive Summary:',
+            'AmtRqstd': 'Requested Contribution from NBIF:'
+        },
+        'people_labels': {
+            'LastName': 'Researcher Information: | PI Last Name:',
+            'FirstName': 'Researcher Information: | Principal Investigator (PI) First Name:',
+            'Email': 'Researcher Information: | PI E-mail Address:'
+        },
+        'company_labels': {
+            'CompanyName': 'Company Information: | Company Name:',
+            'Address': 'Company Information: | Company Street Address:',
+            'City': 'Company Information: | City:',
+            'Province': 'Company Information: | Province:',
+            'PostalCode': 'Company Information: | Postal Code:',
+            'IncorporationDate': 'Company Information: | Date of Incorporation:'
+        }
     }
 }
 
+# Connections kept open per host by the shared SMApply HTTP session
+HTTP_POOL_SIZE = 16
+
+# Resolution bands for unattended dedup: best match at or above auto_link_threshold is
+# linked to the existing record, below auto_insert_threshold is inserted as new, and
+# anything in between is written to the review queue.
+DEDUP_POLICY = {
+    'auto_link_threshold': 0.95,
+    'auto_insert_threshold': 0.8
+}
+
+REVIEW_QUEUE_DIR = 'review_queue'
+
+# Number of records the background dedup scorer may compute ahead of the prompt loop
+SCORING_LOOKAHEAD = 8
+
+# Rows sent per executemany round trip by the bulk insert path
+INSERT_CHUNK_SIZE = 1000
+
+# Keys per IN (...) lookup; SQL Server allows at most 2100 parameters per statement
+LOOKUP_CHUNK_SIZE = 1000
+
+# Where audit mode writes before/after snapshots of ID-based updates
+UPDATE_AUDIT_DIR = 'audit'
+
+# Where each run writes its timing report, one JSON file per batch_id
+RUN_REPORT_DIR = 'run_reports'
+
+# Where each batch's extracted DataFrames and raw SMApply payloads are kept for --replay
+EXTRACT_SNAPSHOT_DIR = 'extracts'
+
+# --profile: allocation sites listed per stage, and seconds between stack samples for the flamegraph
+PROFILE_TOP_N = 25
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# Columns stamped on every load; they are ignored when deciding whether a row changed
+LOAD_METADATA_COLUMNS = ['BatchID', 'LoadedAt']
+
+# Rows pulled per fetchmany call when streaming existing records
+FETCH_BATCH_SIZE = 5000
+
+# Columns used to scope the existing-record fetch to a batch when scoped_fetch is on.
+# Fuzzy matches that share none of these values with the batch are not considered.
+DEDUP_FETCH_KEYS = {
+    'staging.PeopleInfo': ['Email', 'LastName'],
+    'staging.VoucherCompany': ['CompanyName', 'City']
+}
+
+# Match keys derived from the name on every write to people and companies (see database/blocking.py),
+# once python main.py --build-blocking-keys has added the columns. Like the load metadata, they are
+# ignored when deciding whether a row changed.
+BLOCKING_KEY_COLUMNS = ['MatchName', 'BlockPrefix', 'BlockPhonetic', 'BlockTrigram']
+BLOCKING_PREFIX_LENGTH = 4
+
+# Columns blocked_fetch looks up the batch's values in: existing rows sharing none of them with a
+# batch row are not scored against it. Email catches people whose name changed completely.
+BLOCKING_FETCH_KEYS = {
+    'staging.PeopleInfo': ['Email', 'BlockPrefix', 'BlockPhonetic', 'BlockTrigram'],
+    'staging.VoucherCompany': ['BlockPrefix', 'BlockPhonetic', 'BlockTrigram']
+}
+
+# Local SQLite copy of the tables used for duplicate matching, refreshed incrementally from LoadedAt.
+# One file per database is kept next to this path (see database/snapshot.py snapshot_path).
+SNAPSHOT_DB_PATH = os.getenv("SNAPSHOT_DB_PATH", os.path.join('snapshot', 'staging_snapshot.sqlite3'))
+
+# Database the loaders talk to: 'azure' (Azure SQL over pyodbc) or 'sqlite' (a local file with
+# the same staging schema, for offline runs and benchmarks)
+DB_BACKEND = os.getenv("DB_BACKEND", "azure")
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", os.path.join('local', 'staging.sqlite3'))
+
+# Worker processes used to extract fiscal years in parallel during a backfill
+BACKFILL_WORKERS = 4
+
 years = [
     "2026",
     "2025",
@@ -0,0 +1,343 @@
+from datetime import date, datetime
+from decimal import Decimal
+from constants import BLOCKING_KEY_COLUMNS, DB_BACKEND, LOCAL_DB_PATH
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+import numpy as np
+import pandas as pd
+import pyodbc
+
+logging.basicConfig(level=logging.INFO)
+
+# Errors either backend raises for failed statements or broken connections
+DB_ERRORS = (pyodbc.Error, sqlite3.Error)
+
+_backend = {'name': DB_BACKEND, 'path': LOCAL_DB_PATH}
+_initialized_paths = set()
+_schema_lock = threading.Lock()
+
+# The staging schema as the loaders use it. IDs are INTEGER PRIMARY KEY so they are generated
+# like IDENTITY columns, and text keys compare case-insensitively like the server collation.
+LOCAL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS staging.Investment (
+        RefNum TEXT COLLATE NOCASE PRIMARY KEY,
+        ApplTitle TEXT,
+        ExecSum TEXT,
+        FiscalYear TEXT,
+        ResearchFundID TEXT,
+        ApplDate TIMESTAMP,
+        DecisionDate TIMESTAMP,
+        AmtRqstd REAL,
+        AmtAwarded REAL,
+        TotalLevAmt REAL,
+        PrivSectorLev REAL,
+        FedLeverage REAL,
+        OtherLeverage REAL,
+        FTE REAL,
+        PTE REAL,
+        NBIFSectorID TEXT,
+        Notes TEXT,
+        BatchID TEXT COLLATE NOCASE,
+        LoadedAt TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS staging.VoucherCompany (
+        CompanyID INTEGER PRIMARY KEY,
+        CompanyName TEXT COLLATE NOCASE,
+        Address TEXT,
+        City TEXT COLLATE NOCASE,
+        Province TEXT,
+        PostalCode TEXT,
+        Country TEXT,
+        Region TEXT,
+        IncorporationDate TIMESTAMP,
+        MatchName TEXT,
+        BlockPrefix TEXT,
+        BlockPhonetic TEXT,
+        BlockTrigram TEXT,
+        BatchID TEXT COLLATE NOCASE,
+        LoadedAt TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS staging.PeopleInfo (
+        PersonID INTEGER PRIMARY KEY,
+        LastName TEXT COLLATE NOCASE,
+        FirstName TEXT COLLATE NOCASE,
+        Email TEXT COLLATE NOCASE,
+        Phone TEXT,
+        Note TEXT,
+        CommOptOut TEXT,
+        MatchName TEXT,
+        BlockPrefix TEXT,
+        BlockPhonetic TEXT,
+        BlockTrigram TEXT,
+        BatchID TEXT COLLATE NOCASE,
+        LoadedAt TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS staging.ProjectAsgmt (
+        RefNum TEXT COLLATE NOCASE NOT NULL,
+        PersonID INTEGER NOT NULL,
+        Participation TEXT,
+        PersonTitle TEXT,
+        BatchID TEXT COLLATE NOCASE,
+        LoadedAt TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS staging.CompanyAsgmt (
+        RefNum TEXT COLLATE NOCASE NOT NULL,
+        CompanyID INTEGER NOT NULL,
+        BatchID TEXT COLLATE NOCASE,
+        LoadedAt TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS staging.BatchPreImage (
+        PreImageID INTEGER PRIMARY KEY,
+        BatchID TEXT COLLATE NOCASE NOT NULL,
+        TableName TEXT NOT NULL,
+        KeyColumn TEXT NOT NULL,
+        KeyValue TEXT NOT NULL,
+        PreImage TEXT NULL,
+        CapturedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# Columns added to the schema after local databases were first created; older files get them on open
+LOCAL_ADDED_COLUMNS = {
+    'VoucherCompany': BLOCKING_KEY_COLUMNS,
+    'PeopleInfo': BLOCKING_KEY_COLUMNS,
+}
+
+LOCAL_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS staging.IX_Investment_ResearchFundID ON Investment (ResearchFundID)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_Investment_LoadedAt ON Investment (LoadedAt)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_VoucherCompany_CompanyName ON VoucherCompany (CompanyName)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_VoucherCompany_City ON VoucherCompany (City)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_VoucherCompany_LoadedAt ON VoucherCompany (LoadedAt)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_PeopleInfo_Email ON PeopleInfo (Email)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_PeopleInfo_LastName ON PeopleInfo (LastName)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_PeopleInfo_LoadedAt ON PeopleInfo (LoadedAt)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_ProjectAsgmt_RefNum ON ProjectAsgmt (RefNum, PersonID)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_CompanyAsgmt_RefNum ON CompanyAsgmt (RefNum, CompanyID)",
+    "CREATE INDEX IF NOT EXISTS staging.IX_BatchPreImage_BatchID ON BatchPreImage (BatchID, TableName)",
+] + [
+    f"CREATE INDEX IF NOT EXISTS staging.IX_{table}_{col} ON {table} ({col})"
+    for table, columns in LOCAL_ADDED_COLUMNS.items() for col in columns
+]
+
+def set_backend(name, path=None):
+    """Switch the backend for the rest of the process. Use connection.use_backend so the pool is emptied too."""
+    if name not in ('azure', 'sqlite'):
+        raise ValueError(f"Unknown database backend: {name}")
+    _backend['name'] = name
+    if path:
+        _backend['path'] = path
+
+def is_local_backend():
+    return _backend['name'] == 'sqlite'
+
+def local_db_path():
+    return _backend['path']
+
+def temp_table_name(name):
+    """Session temp table name for the current backend, e.g. #upsert_source or temp.upsert_source."""
+    return f"temp.{name}" if is_local_backend() else f"#{name}"
+
+# With autocommit off the ODBC driver runs the session with IMPLICIT_TRANSACTIONS ON: reading a
+# table opens the transaction that commit() ends. BEGIN TRANSACTION would open that one and nest a
+# second inside it, which commit() leaves open for the pool's rollback to throw away.
+OPEN_TRANSACTION_SQL = "DECLARE @opened INT; IF @@TRANCOUNT = 0 SELECT TOP (1) @opened = 1 FROM staging.Investment"
+
+def savepoint_sql(name):
+    """
+    Statement marking a savepoint. SQL Server won't open a transaction for SAVE TRANSACTION
+    (Msg 628), so a read opens the implicit one first if none is open; SQLite's SAVEPOINT opens its own.
+    """
+    if is_local_backend():
+        return f"SAVEPOINT {name}"
+    return f"{OPEN_TRANSACTION_SQL}; SAVE TRANSACTION {name}"
+
+def rollback_to_savepoint_sql(name):
+    return f"ROLLBACK TO SAVEPOINT {name}" if is_local_backend() else f"ROLLBACK TRANSACTION {name}"
+
+def create_temp_table_sql(table_name, temp_name, select_list):
+    """Statement creating an empty temp table from a select list over table_name."""
+    if is_local_backend():
+        return f"CREATE TEMP TABLE {temp_name} AS SELECT {', '.join(select_list)} FROM {table_name} WHERE 0"
+    return f"SELECT TOP 0 {', '.join(select_list)} INTO {temp_name} FROM {table_name}"
+
+def key_text_expression(expression):
+    """A key column rendered as text, the way BatchPreImage.KeyValue stores it."""
+    if is_local_backend():
+        return f"CAST({expression} AS TEXT)"
+    return f"CONVERT(NVARCHAR(450), {expression})"
+
+def epoch_seconds_expression(expression, local=None):
+    """Whole seconds since 1970 of a datetime column, computed alike by both backends (local defaults to the current one)."""
+    if is_local_backend() if local is None else local:
+        return f"CAST(strftime('%s', {expression}) AS INTEGER)"
+    return f"DATEDIFF_BIG(SECOND, '19700101', {expression})"
+
+def row_hash(*values):
+    """SQLite stand-in for HASHBYTES over a FOR JSON row: NULLs and positions stay distinct."""
+    return hashlib.sha256(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+def to_timestamp(value):
+    return datetime.fromisoformat(value.decode('utf-8'))
+
+# sqlite3 looks adapters up by exact type, so subclasses like pd.Timestamp need their own entry
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+sqlite3.register_adapter(pd.Timestamp, lambda value: value.isoformat(sep=' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(uuid.UUID, str)
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(np.float32, float)
+sqlite3.register_adapter(np.bool_, bool)
+sqlite3.register_converter('TIMESTAMP', to_timestamp)
+
+class LocalCursor:
+    """
+    sqlite3 cursor with the parts of the pyodbc cursor API the loaders use.
+
+    Parameters may be passed as varargs or one sequence, and leaving a `with` block without an
+    error commits, both as in pyodbc. fast_executemany is accepted and ignored.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = conn.raw.cursor()
+        self.fast_executemany = False
+
+    def execute(self, query, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._conn.begin()
+        self._cursor.execute(query, tuple(params))
+        return self
+
+    def executemany(self, query, rows):
+        self._conn.begin()
+        self._cursor.executemany(query, rows)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._conn.commit()
+        self.close()
+
+class LocalConnection:
+    """
+    A SQLite connection shaped like a pyodbc one.
+
+    The database file is attached as the `staging` schema so table names match the server.
+    Transactions are begun explicitly on the first statement unless autocommit is set.
+    """
+
+    def __init__(self, path, autocommit):
+        self.raw = sqlite3.connect(':memory:', isolation_level=None, timeout=30,
+                                   detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self.raw.execute("ATTACH DATABASE ? AS staging", (path,))
+        self.raw.execute("PRAGMA staging.journal_mode = WAL")
+        self.raw.create_function('row_hash', -1, row_hash, deterministic=True)
+        self.autocommit = autocommit
+
+    def begin(self):
+        # IMMEDIATE takes the write lock up front, so concurrent loaders wait on the busy timeout
+        # instead of failing when a read transaction cannot be upgraded to a write
+        if not self.autocommit and not self.raw.in_transaction:
+            self.raw.execute("BEGIN IMMEDIATE")
+
+    def cursor(self):
+        return LocalCursor(self)
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def close(self):
+        self.raw.close()
+
+def create_local_schema(conn):
+    """Create the staging tables and indexes in a local database if they do not exist yet."""
+    for statement in LOCAL_SCHEMA:
+        conn.raw.execute(statement)
+    for table, columns in LOCAL_ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.raw.execute(f"PRAGMA staging.table_info({table})")}
+        for col in columns:
+            if col not in existing:
+                conn.raw.execute(f"ALTER TABLE staging.{table} ADD COLUMN {col} TEXT")
+    for statement in LOCAL_INDEXES:
+        conn.raw.execute(statement)
+
+def open_local_connection(autocommit, path=None):
+    path = path or local_db_path()
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = LocalConnection(path, autocommit)
+        with _schema_lock:
+            if path not in _initialized_paths:
+                create_local_schema(conn)
+                _initialized_paths.add(path)
+                logging.info(f"Using local database {path}")
+        return conn
+    except sqlite3.Error as e:
+        logging.error(f"Error opening local database {path}: {e}")
+        return None
+
+def backup_local_db(directory):
+    """Copy the local database file into directory with the sqlite3 backup API and return the file name."""
+    path = local_db_path()
+    backup_file = os.path.splitext(os.path.basename(path))[0] + '_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.sqlite3'
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(os.path.join(directory, backup_file))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return backup_file
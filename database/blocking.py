@@ -0,0 +1,221 @@
+from constants import BLOCKING_FETCH_KEYS, BLOCKING_KEY_COLUMNS, BLOCKING_PREFIX_LENGTH, TABLE_CONFIGS
+from database.backend import DB_ERRORS, is_local_backend, temp_table_name
+from database.get import existing_record_columns, fetch_columnar
+from database.normalize import normalize_person_name
+from database.records import column_values, full_name, normalized_company_name
+import logging
+import unicodedata
+import zlib
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+BLOCKING_TABLES = ['staging.VoucherCompany', 'staging.PeopleInfo']
+BATCH_KEYS = 'batch_blocking_keys'
+# Server column sizes; MatchName is the normalized name, the block keys are a few characters
+KEY_COLUMN_SIZES = {'MatchName': 450, 'BlockPrefix': 16, 'BlockPhonetic': 8, 'BlockTrigram': 16}
+
+SOUNDEX_CODES = {letter: digit for letters, digit in [
+    ('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6')
+] for letter in letters}
+
+def add_blocking_columns(conn):
+    """
+    Migration adding the match key columns and their indexes to people and companies if missing.
+    Run by --build-blocking-keys only, never while a batch loads.
+    """
+    # The local backend adds them with the rest of the staging schema
+    if is_local_backend():
+        return
+    with conn.cursor() as cursor:
+        for table_name in BLOCKING_TABLES:
+            for col in BLOCKING_KEY_COLUMNS:
+                cursor.execute(f"IF COL_LENGTH('{table_name}', '{col}') IS NULL "
+                               f"ALTER TABLE {table_name} ADD {col} NVARCHAR({KEY_COLUMN_SIZES[col]}) NULL")
+            # A separate batch per index, so the columns exist by the time it compiles
+            for col in BLOCKING_KEY_COLUMNS:
+                index_name = f"IX_{table_name.split('.')[-1]}_{col}"
+                cursor.execute(f"""
+                    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{index_name}' AND object_id = OBJECT_ID('{table_name}'))
+                        CREATE INDEX {index_name} ON {table_name} ({col})
+                """)
+    conn.commit()
+
+def has_blocking_columns(cursor, table_name):
+    """Whether add_blocking_columns has run against table_name."""
+    if is_local_backend():
+        return True
+    cursor.execute(f"SELECT COL_LENGTH('{table_name}', '{BLOCKING_KEY_COLUMNS[-1]}')")
+    return cursor.fetchone()[0] is not None
+
+def write_columns(cursor, table_name):
+    """The table's configured columns, less the match keys while the table has none to write to."""
+    columns = TABLE_CONFIGS[table_name]['columns']
+    if table_name not in BLOCKING_TABLES or has_blocking_columns(cursor, table_name):
+        return columns
+    return [col for col in columns if col not in BLOCKING_KEY_COLUMNS]
+
+def soundex(word):
+    """American Soundex of a word (Robert -> R163), ignoring accents; '' if it has no letters."""
+    word = unicodedata.normalize('NFKD', word or '').lower()
+    letters = [letter for letter in word if 'a' <= letter <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W don't separate letters with the same code; vowels do
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+def trigram_signature(text):
+    """
+    The trigram of text with the smallest CRC32, a one-value MinHash: two names share it
+    with about the probability that a trigram from either of them is in both.
+    """
+    text = text.replace(' ', '')
+    if len(text) < 3:
+        return text or None
+    trigrams = {text[i:i + 3] for i in range(len(text) - 2)}
+    return min(trigrams, key=lambda trigram: zlib.crc32(trigram.encode('utf-8')))
+
+def match_keys(match_name, block_word):
+    """
+    (MatchName, BlockPrefix, BlockPhonetic, BlockTrigram) of a normalized name. The prefix and
+    Soundex code come from block_word, the most distinctive part of the name.
+    """
+    compact = block_word.replace(' ', '')
+    return (match_name[:KEY_COLUMN_SIZES['MatchName']], compact[:BLOCKING_PREFIX_LENGTH] or None,
+            soundex(block_word) or None, trigram_signature(match_name))
+
+def company_match_keys(company_name):
+    # Normalized the way find_similar_companies compares names
+    match_name = normalized_company_name(company_name)
+    return match_keys(match_name, match_name.split(' ')[0])
+
+def person_match_keys(first_name, last_name):
+    # Normalized the way find_similar_people compares names; first names are too common to block on
+    match_name = normalize_person_name(full_name(first_name, last_name))
+    last_name = normalize_person_name(last_name) if isinstance(last_name, str) else ''
+    return match_keys(match_name, last_name or match_name)
+
+def blocking_key_rows(df, table_name):
+    """The match keys of every row of df, as (MatchName, BlockPrefix, BlockPhonetic, BlockTrigram) tuples."""
+    if table_name == 'staging.VoucherCompany':
+        return [company_match_keys(name) for name in column_values(df, 'CompanyName')]
+    return [person_match_keys(first_name, last_name)
+            for first_name, last_name in zip(column_values(df, 'FirstName'), column_values(df, 'LastName'))]
+
+def with_blocking_keys(df, table_name):
+    """Copy of df with the table's match keys computed from its names; frames of other tables are returned as they are."""
+    if table_name not in BLOCKING_TABLES or df.empty:
+        return df
+    df = df.copy()
+    keys = list(zip(*blocking_key_rows(df, table_name)))
+    for col, values in zip(BLOCKING_KEY_COLUMNS, keys):
+        df[col] = list(values)
+    return df
+
+def backfill_blocking_keys(table_name, conn):
+    """
+    Fill in the match keys of rows written without them (before the columns existed, by another
+    tool, or restored from an older pre-image) and recompute the keys of rows whose name changed
+    since they were stored, e.g. renamed by a writer that doesn't keep them. Returns the number
+    of rows written.
+    """
+    config = TABLE_CONFIGS[table_name]
+    id_column = config['id_column']
+    name_columns = ['CompanyName'] if table_name == 'staging.VoucherCompany' else ['FirstName', 'LastName']
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT {id_column}, {', '.join(name_columns + BLOCKING_KEY_COLUMNS)} FROM {table_name}")
+        existing = fetch_columnar(cursor)
+        if existing.empty:
+            return 0
+
+        stored = zip(*(column_values(existing, col) for col in BLOCKING_KEY_COLUMNS))
+        rows = [keys + (entity_id,) for keys, stored_keys, entity_id in
+                zip(blocking_key_rows(existing, table_name), stored, existing[id_column].tolist())
+                if keys != stored_keys]
+        if not rows:
+            return 0
+        set_clause = ', '.join(f"{col} = ?" for col in BLOCKING_KEY_COLUMNS)
+        cursor.fast_executemany = True
+        cursor.executemany(f"UPDATE {table_name} SET {set_clause} WHERE {id_column} = ?", rows)
+    conn.commit()
+    logging.info(f"{table_name} - wrote match keys for {len(rows)} row(s)")
+    return len(rows)
+
+def batch_key_values(df, table_name):
+    """Distinct (key column, value) pairs of the batch for the table's BLOCKING_FETCH_KEYS."""
+    keyed = with_blocking_keys(df, table_name)
+    pairs = set()
+    for col in BLOCKING_FETCH_KEYS[table_name]:
+        for value in column_values(keyed, col):
+            if isinstance(value, str) and value.strip():
+                pairs.add((col, value.strip()))
+    return sorted(pairs)
+
+def candidate_query(table_name, columns, source):
+    """
+    One query returning each existing row that shares any BLOCKING_FETCH_KEYS value with the
+    batch, once, plus the rows with no match keys yet, which can't be ruled out.
+
+    The keys are only as fresh as their row's last write through this loader. A name changed by
+    another writer keeps its old keys, so the row is looked up under its old name until
+    --build-blocking-keys recomputes it.
+    """
+    select_list = ', '.join(f"target.{col}" for col in columns)
+    # A UNION of one join per key column lets each branch seek its own index, where OR would scan
+    branches = [
+        f"SELECT {select_list} FROM {table_name} AS target "
+        f"JOIN {source} AS batch ON batch.KeyColumn = '{col}' AND target.{col} = batch.KeyValue"
+        for col in BLOCKING_FETCH_KEYS[table_name]
+    ]
+    branches.append(f"SELECT {select_list} FROM {table_name} AS target WHERE target.MatchName IS NULL")
+    return '\nUNION\n'.join(branches)
+
+def get_blocking_candidates(table_name, df, conn):
+    """
+    Existing people or companies that share a blocking key with a row of df, read with one
+    set-based query: a name prefix, a Soundex code, a trigram signature, or for people the email.
+
+    Only these rows are scored, locally and exactly as before, so a match sharing none of the
+    keys with its batch row is missed. Rows without keys yet are always read; the keys are
+    filled in by --build-blocking-keys, never here.
+    """
+    config = TABLE_CONFIGS.get(table_name)
+    if table_name not in BLOCKING_TABLES:
+        logging.error(f"Blocking keys are not kept for table: {table_name}")
+        return None
+
+    columns = existing_record_columns(table_name, config)
+    pairs = batch_key_values(df, table_name)
+    if not pairs:
+        return pd.DataFrame(columns=columns)
+
+    source = temp_table_name(BATCH_KEYS)
+    text_type = 'TEXT' if is_local_backend() else 'NVARCHAR(450) COLLATE DATABASE_DEFAULT'
+    try:
+        with conn.cursor() as cursor:
+            if not has_blocking_columns(cursor, table_name):
+                logging.error(f"{table_name} has no match keys yet; run python main.py --build-blocking-keys first")
+                return None
+            cursor.execute(f"DROP TABLE IF EXISTS {source}")
+            cursor.execute(f"CREATE TABLE {source} (KeyColumn {text_type}, KeyValue {text_type})")
+            cursor.fast_executemany = True
+            cursor.executemany(f"INSERT INTO {source} (KeyColumn, KeyValue) VALUES (?, ?)", pairs)
+            cursor.execute(candidate_query(table_name, columns, source))
+            candidates = fetch_columnar(cursor)
+            cursor.execute(f"DROP TABLE IF EXISTS {source}")
+    except DB_ERRORS as e:
+        logging.error(f"Error fetching blocking candidates from {table_name}: {e}")
+        return None
+
+    logging.info(f"{table_name} - {len(candidates)} candidate(s) share a blocking key with {len(df)} batch row(s)")
+    return candidates
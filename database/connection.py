@@ -1,8 +1,14 @@
+from contextlib import contextmanager
 from datetime import datetime
 import logging
 import os
+import threading
+import time
 import pyodbc
+from database.backend import (DB_ERRORS, OPEN_TRANSACTION_SQL, backup_local_db, is_local_backend, local_db_path,
+                              open_local_connection, rollback_to_savepoint_sql, savepoint_sql, set_backend)
 from dotenv import load_dotenv
+from instrumentation import record_rows, span
 import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
@@ -14,8 +20,18 @@ db_user = os.getenv("AZURE_DB_USERNAME")
 db_password = os.getenv("AZURE_DB_PASSWORD")
 db_driver = os.getenv("AZURE_DB_DRIVER")
 db_backup_dir = os.getenv("DB_BACKUP_DIR")
+db_pool_size = int(os.getenv("AZURE_DB_POOL_SIZE", "4"))
+db_pool_recycle_seconds = int(os.getenv("AZURE_DB_POOL_RECYCLE_SECONDS", "300"))
 
-def connect_to_db(autocommit):
+# Idle connections kept for reuse, as (connection, released_at) pairs
+_pool = []
+_pool_lock = threading.Lock()
+# The BatchTransaction every connect_to_db call shares while batch_transaction() is active
+_batch = None
+
+def open_connection(autocommit):
+    if is_local_backend():
+        return open_local_connection(autocommit)
     try:
         conn_args = {
             "driver": db_driver,
@@ -33,9 +49,274 @@ def connect_to_db(autocommit):
     except pyodbc.Error as e:
         logging.error(f"Error connecting to database: {e}")
         return None
+
+def checkout_connection(autocommit):
+    """Take an idle connection from the pool, or open a new one if none is fresh enough."""
+    while True:
+        with _pool_lock:
+            if not _pool:
+                break
+            conn, released_at = _pool.pop()
+        # Azure SQL drops idle sessions; don't hand out ones that sat too long
+        if time.monotonic() - released_at > db_pool_recycle_seconds:
+            close_quietly(conn)
+            continue
+        try:
+            conn.autocommit = autocommit
+            return conn
+        except DB_ERRORS:
+            close_quietly(conn)
+
+    return open_connection(autocommit)
+
+def release_connection(conn):
+    """Return a connection to the pool, discarding anything it left uncommitted."""
+    try:
+        if not conn.autocommit:
+            conn.rollback()
+    except DB_ERRORS:
+        close_quietly(conn)
+        return
+
+    with _pool_lock:
+        if len(_pool) < db_pool_size:
+            _pool.append((conn, time.monotonic()))
+            return
+    close_quietly(conn)
+
+def close_quietly(conn):
+    try:
+        conn.close()
+    except DB_ERRORS:
+        pass
+
+def close_pool():
+    """Close every idle pooled connection, e.g. at the end of a run."""
+    with _pool_lock:
+        idle = [conn for conn, _ in _pool]
+        _pool.clear()
+    for conn in idle:
+        close_quietly(conn)
+
+def statement_span(query):
+    """Span name for a SQL statement, by its leading keyword, e.g. sql.MERGE."""
+    words = query.split(None, 1)
+    return f"sql.{words[0].upper()}" if words else "sql"
+
+class TimedCursor:
+    """Cursor wrapper that times every statement in a sql.<KEYWORD> span; executemany rows count as rows."""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def execute(self, query, *params):
+        with span(statement_span(query)):
+            self._cursor.execute(query, *params)
+        return self
+
+    def executemany(self, query, rows):
+        with span(statement_span(query)):
+            record_rows(len(rows))
+            self._cursor.executemany(query, rows)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._cursor.__exit__(exc_type, exc_value, traceback)
+
+class PooledConnection:
+    """A database connection whose close() hands it back to the pool instead of closing it."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return TimedCursor(self._conn.cursor())
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            release_connection(self._conn)
+
+class BatchCursor:
+    """
+    Cursor wrapper used inside a batch.
+
+    pyodbc cursors commit when a `with` block exits; this one only closes, so the batch
+    stays a single transaction.
+    """
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._cursor.close()
+
+class BatchConnection:
+    """
+    The shared connection handed out inside batch_transaction().
+
+    commit() and close() are deferred to the end of the batch. rollback() only undoes the
+    current stage (back to its savepoint) and marks the batch as failed.
+    """
+
+    def __init__(self, batch):
+        self._batch = batch
+
+    def __getattr__(self, name):
+        return getattr(self._batch.conn, name)
+
+    def cursor(self):
+        return BatchCursor(TimedCursor(self._batch.conn.cursor()))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rollback(self):
+        self._batch.rollback_stage()
+
+class BatchTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+        self.stage = None
+        self.failed_stages = []
+
+    def execute(self, statement):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    def rollback_stage(self):
+        if self.stage:
+            self.execute(rollback_to_savepoint_sql(self.stage))
+        else:
+            self.conn.rollback()
+        self.failed_stages.append(self.stage or 'batch')
+
+def use_backend(name, path=None):
+    """Point every later connect_to_db call at another backend, e.g. use_backend('sqlite', 'bench.sqlite3')."""
+    close_pool()
+    set_backend(name, path)
+
+def begin_transaction(conn):
+    """
+    Open a transaction on conn unless one is already open, the one commit() ends. On SQL Server
+    that is the driver's implicit transaction, opened by a read (see OPEN_TRANSACTION_SQL).
+    """
+    if is_local_backend():
+        conn.begin()
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(OPEN_TRANSACTION_SQL)
+    finally:
+        cursor.close()
+
+def database_identity():
+    """Names the database connect_to_db reaches, for files cached per database."""
+    if is_local_backend():
+        return f"sqlite:{os.path.abspath(local_db_path())}"
+    return f"azure:{db_host}/{db_name}"
+
+def connect_to_db(autocommit):
+    """
+    Get a database connection, reusing pooled connections where possible.
+
+    Callers close() it as before; that returns it to the pool. Inside batch_transaction()
+    every call shares the batch's single connection and transaction.
+    """
+    if _batch is not None:
+        return BatchConnection(_batch)
+
+    conn = checkout_connection(autocommit)
+    return PooledConnection(conn) if conn else None
+
+@contextmanager
+def batch_transaction():
+    """
+    Run everything inside the block as one transaction on one connection.
+
+    The batch commits once at the end, and rolls back entirely if the block raises or any
+    stage rolled back its own work.
+    """
+    global _batch
+    conn = checkout_connection(False)
+    if not conn:
+        raise ConnectionError("Could not connect to DB for the batch transaction")
+
+    batch = BatchTransaction(conn)
+    _batch = batch
+    try:
+        # The first stage starts with a savepoint, which SQL Server won't mark outside a transaction
+        begin_transaction(conn)
+        yield batch
+        if batch.failed_stages:
+            raise RuntimeError(f"Batch stage(s) failed: {', '.join(batch.failed_stages)}")
+        conn.commit()
+        logging.info("Batch committed")
+    except BaseException:
+        conn.rollback()
+        logging.error("Batch rolled back, nothing from this run was kept")
+        raise
+    finally:
+        _batch = None
+        release_connection(conn)
+
+@contextmanager
+def batch_stage(name):
+    """Mark a stage of the batch with a savepoint. Does nothing outside batch_transaction()."""
+    batch = _batch
+    if batch is None:
+        yield
+        return
+
+    batch.execute(savepoint_sql(name))
+    previous, batch.stage = batch.stage, name
+    try:
+        yield
+    finally:
+        batch.stage = previous
     
 def backup_db():
-    conn = connect_to_db(True)
+    if is_local_backend():
+        print(f"✅ Local database backed up to {backup_local_db(db_backup_dir)}")
+        return
+
+    # BACKUP DATABASE cannot run inside a transaction, so bypass the pool and any batch
+    conn = open_connection(True)
     if conn:
         try:
             with conn.cursor() as cursor:
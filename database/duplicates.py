@@ -1,5 +1,31 @@
+from constants import SCORING_LOOKAHEAD
+from contextlib import contextmanager
+from database.records import company_records, person_records
+from database.review import queue_for_review
 from database.similar import find_similar_companies, find_similar_people
+from instrumentation import ask, human_wait, record_rows, traced
 import pandas as pd
+import queue
+import threading
+
+_SCORING_DONE = object()
+# Held by one table's interactive duplicate resolution at a time when tables sync concurrently
+_prompt_lock = threading.Lock()
+
+
+@contextmanager
+def prompt_phase(interactive):
+    """Serialize interactive duplicate resolution across threads; unattended runs don't wait."""
+    if not interactive:
+        yield
+        return
+    # Waiting for another table's prompts to finish is operator time too, already counted there
+    with human_wait(charge_run=False):
+        _prompt_lock.acquire()
+    try:
+        yield
+    finally:
+        _prompt_lock.release()
 
 
 def format_row(label, name, contact, id_val="", similarity=""):
@@ -80,98 +106,83 @@ def print_company_duplicate(new_company, similar):
     print("-" * 100)
 
 
-def handle_company_duplicates(df, existing_df, interactive=True, similarity_threshold=0.8):
+def score_in_background(df, existing, find_similar, similarity_threshold, lookahead=SCORING_LOOKAHEAD):
+    """
+    Yield (record, similar) pairs scored by a worker thread that runs ahead of the caller.
+
+    Records are plain dicts, one per row of df; existing is what find_similar matches against.
+    The worker keeps up to `lookahead` scored records in a bounded queue, so while the
+    operator is deciding on one record the next comparisons are already computed.
+    """
+    scored = queue.Queue(maxsize=lookahead)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                scored.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker():
+        try:
+            for record in df.to_dict('records'):
+                similar = find_similar(record, existing, similarity_threshold)
+                if not put((record, similar)):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SCORING_DONE)
+
+    thread = threading.Thread(target=worker, name="dedup-scoring", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = scored.get()
+            if item is _SCORING_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Unblock the worker if the caller stopped early (e.g. Ctrl+C at a prompt)
+        stop.set()
+        thread.join()
+
+
+def resolve_by_policy(similar, policy):
+    """Place the best match of a record into the auto-link, auto-insert or review band."""
+    best_similarity = similar[0]['similarity']
+    if best_similarity >= policy['auto_link_threshold']:
+        return 'link'
+    if best_similarity < policy['auto_insert_threshold']:
+        return 'insert'
+    return 'review'
+
+
+@traced()
+def handle_company_duplicates(df, existing_df, interactive=True, similarity_threshold=0.8,
+                              policy=None, review_queue=None):
     insert_companies, skip_companies, update_companies = [], [], []
+    record_rows(len(df))
 
-    for _, new_company in df.iterrows():
-        similar = find_similar_companies(new_company, existing_df, similarity_threshold)
+    existing = company_records(existing_df)
+    for new_company, similar in score_in_background(df, existing, find_similar_companies, similarity_threshold):
 
         if not similar:
             print(f"✅ Auto-inserting (no matches above {similarity_threshold}): '{new_company['CompanyName']}'")
             insert_companies.append(new_company)
             continue
 
-        if interactive:
-            print_company_duplicate(new_company, similar)
-
-            choice_made = False
-            while not choice_made:
-                choice = input(
-                    "\nWhat would you like to do?\n"
-                    "1. Insert as new company\n"
-                    "2. Skip (it's a duplicate)\n"
-                    "3. Update existing record\n"
-                    "4. Show more details\n"
-                    "Enter choice (1-4): "
-                ).strip()
-
-                if choice == '1':
-                    insert_companies.append(new_company)
-                    choice_made = True
-
-                elif choice == '2':
-                    if len(similar) == 1:
-                        selected_match = similar[0]
-                    else:
-                        print("\nWhich existing company is this a duplicate of?")
-                        for i, match in enumerate(similar[:3], 1):
-                            print(f"   {i}. '{match['existing_company']}' [ID: {match['company_id']}]")
-
-                        while True:
-                            try:
-                                selection = int(input(f"Enter number (1-{min(3, len(similar))}): ").strip())
-                                if 1 <= selection <= min(3, len(similar)):
-                                    selected_match = similar[selection - 1]
-                                    break
-                                else:
-                                    print("Invalid selection. Try again.")
-                            except ValueError:
-                                print("Please enter a valid number.")
-
-                    skip_record = new_company.copy()
-                    skip_record['_matched_existing_id'] = selected_match['company_id']
-                    skip_record['_matched_existing_name'] = selected_match['existing_company']
-                    skip_companies.append(skip_record)
-                    choice_made = True
-
-                elif choice == '3':
-                    if len(similar) == 1:
-                        selected_match = similar[0]
-                    else:
-                        print("\nSelect which existing company to update:")
-                        for i, match in enumerate(similar[:3], 1):
-                            print(f"   {i}. '{match['existing_company']}' [ID: {match['company_id']}]")
-
-                        while True:
-                            try:
-                                selection = int(input(f"Enter number (1-{min(3, len(similar))}): ").strip())
-                                if 1 <= selection <= min(3, len(similar)):
-                                    selected_match = similar[selection - 1]
-                                    break
-                                else:
-                                    print("Invalid selection. Try again.")
-                            except ValueError:
-                                print("Please enter a valid number.")
-
-                    update_record = new_company.copy()
-                    update_record['_update_target_id'] = selected_match['company_id']
-                    update_companies.append(update_record)
-                    print(f"✅ Will update '{selected_match['existing_company']}' (ID: {selected_match['company_id']})")
-                    choice_made = True
-
-                elif choice == '4':
-                    print("\nNew company details:")
-                    for key, value in new_company.items():
-                        print(f"  {key}: {value}")
-
-                    print("\nExisting company details:")
-                    for i, match in enumerate(similar[:3], 1):
-                        print(f"\n  Match {i}: '{match['existing_company']}' [ID: {match['company_id']}]")
-                        for key, value in match.items():
-                            print(f"    {key}: {value}")
-                else:
-                    print("Invalid choice. Please enter 1, 2, 3, or 4.")
+        if policy:
+            decision = resolve_by_policy(similar, policy)
         else:
+            decision = 'review' if interactive else 'link'
+
+        if decision == 'link':
             print(f"⭐️ Auto-skipping potential duplicate: '{new_company['CompanyName']}' "
                   f"(similarity: {similar[0]['similarity']:.2f} with '{similar[0]['existing_company']}')")
 
@@ -179,111 +190,231 @@ def handle_company_duplicates(df, existing_df, interactive=True, similarity_thre
             skip_record['_matched_existing_id'] = similar[0]['company_id']
             skip_record['_matched_existing_name'] = similar[0]['existing_company']
             skip_companies.append(skip_record)
+            continue
+
+        if decision == 'insert':
+            print(f"✅ Auto-inserting (best match {similar[0]['similarity']:.2f} below "
+                  f"{policy['auto_insert_threshold']}): '{new_company['CompanyName']}'")
+            insert_companies.append(new_company)
+            continue
+
+        if not interactive:
+            print(f"📝 Queued for review: '{new_company['CompanyName']}' "
+                  f"(similarity: {similar[0]['similarity']:.2f} with '{similar[0]['existing_company']}')")
+            if review_queue is not None:
+                queue_for_review(review_queue, 'company', new_company, similar)
+            continue
+
+        print_company_duplicate(new_company, similar)
+
+        choice_made = False
+        while not choice_made:
+            choice = ask(
+                "\nWhat would you like to do?\n"
+                "1. Insert as new company\n"
+                "2. Skip (it's a duplicate)\n"
+                "3. Update existing record\n"
+                "4. Show more details\n"
+                "Enter choice (1-4): "
+            ).strip()
+
+            if choice == '1':
+                insert_companies.append(new_company)
+                choice_made = True
+
+            elif choice == '2':
+                if len(similar) == 1:
+                    selected_match = similar[0]
+                else:
+                    print("\nWhich existing company is this a duplicate of?")
+                    for i, match in enumerate(similar[:3], 1):
+                        print(f"   {i}. '{match['existing_company']}' [ID: {match['company_id']}]")
+
+                    while True:
+                        try:
+                            selection = int(ask(f"Enter number (1-{min(3, len(similar))}): ").strip())
+                            if 1 <= selection <= min(3, len(similar)):
+                                selected_match = similar[selection - 1]
+                                break
+                            else:
+                                print("Invalid selection. Try again.")
+                        except ValueError:
+                            print("Please enter a valid number.")
+
+                skip_record = new_company.copy()
+                skip_record['_matched_existing_id'] = selected_match['company_id']
+                skip_record['_matched_existing_name'] = selected_match['existing_company']
+                skip_companies.append(skip_record)
+                choice_made = True
+
+            elif choice == '3':
+                if len(similar) == 1:
+                    selected_match = similar[0]
+                else:
+                    print("\nSelect which existing company to update:")
+                    for i, match in enumerate(similar[:3], 1):
+                        print(f"   {i}. '{match['existing_company']}' [ID: {match['company_id']}]")
+
+                    while True:
+                        try:
+                            selection = int(ask(f"Enter number (1-{min(3, len(similar))}): ").strip())
+                            if 1 <= selection <= min(3, len(similar)):
+                                selected_match = similar[selection - 1]
+                                break
+                            else:
+                                print("Invalid selection. Try again.")
+                        except ValueError:
+                            print("Please enter a valid number.")
+
+                update_record = new_company.copy()
+                update_record['_update_target_id'] = selected_match['company_id']
+                update_companies.append(update_record)
+                print(f"✅ Will update '{selected_match['existing_company']}' (ID: {selected_match['company_id']})")
+                choice_made = True
+
+            elif choice == '4':
+                print("\nNew company details:")
+                for key, value in new_company.items():
+                    print(f"  {key}: {value}")
+
+                print("\nExisting company details:")
+                for i, match in enumerate(similar[:3], 1):
+                    print(f"\n  Match {i}: '{match['existing_company']}' [ID: {match['company_id']}]")
+                    for key, value in match.items():
+                        print(f"    {key}: {value}")
+            else:
+                print("Invalid choice. Please enter 1, 2, 3, or 4.")
 
     return pd.DataFrame(insert_companies), pd.DataFrame(skip_companies), pd.DataFrame(update_companies)
 
 
-def handle_person_duplicates(df, existing_df, interactive=True, similarity_threshold=0.8):
+@traced()
+def handle_person_duplicates(df, existing_df, interactive=True, similarity_threshold=0.8,
+                             policy=None, review_queue=None):
     insert_people, skip_people, update_people = [], [], []
+    record_rows(len(df))
 
-    for _, new_person in df.iterrows():
-        similar = find_similar_people(new_person, existing_df, similarity_threshold)
+    existing = person_records(existing_df)
+    for new_person, similar in score_in_background(df, existing, find_similar_people, similarity_threshold):
+        full_name = f"{new_person.get('FirstName', '')} {new_person.get('LastName', '')}"
 
         if not similar:
-            full_name = f"{new_person.get('FirstName', '')} {new_person.get('LastName', '')}"
             print(f"✅ Auto-inserting (no matches above {similarity_threshold}): '{full_name}'")
             insert_people.append(new_person)
             continue
 
-        if interactive:
-            print_person_duplicate(new_person, similar)
-
-            choice_made = False
-            while not choice_made:
-                choice = input(
-                    "\nWhat would you like to do?\n"
-                    "1. Insert as new person\n"
-                    "2. Skip (it's a duplicate)\n"
-                    "3. Update existing record\n"
-                    "4. Show more details\n"
-                    "Enter choice (1-4): "
-                ).strip()
-
-                if choice == '1':
-                    insert_people.append(new_person)
-                    choice_made = True
-
-                elif choice == '2':
-                    if len(similar) == 1:
-                        selected_match = similar[0]
-                    else:
-                        print("\nWhich existing person is this a duplicate of?")
-                        for i, match in enumerate(similar[:3], 1):
-                            existing_name = f"{match['existing_first_name']} {match['existing_last_name']}"
-                            print(f"   {i}. '{existing_name}' ({match['email']}) [ID: {match['person_id']}]")
-
-                        while True:
-                            try:
-                                selection = int(input(f"Enter number (1-{min(3, len(similar))}): ").strip())
-                                if 1 <= selection <= min(3, len(similar)):
-                                    selected_match = similar[selection - 1]
-                                    break
-                                else:
-                                    print("Invalid selection. Try again.")
-                            except ValueError:
-                                print("Please enter a valid number.")
-
-                    skip_record = new_person.copy()
-                    skip_record['_matched_existing_id'] = selected_match['person_id']
-                    skip_record['_matched_existing_email'] = selected_match['email']
-                    skip_people.append(skip_record)
-                    choice_made = True
-
-                elif choice == '3':
-                    if len(similar) == 1:
-                        selected_match = similar[0]
-                    else:
-                        print("\nSelect which existing person to update:")
-                        for i, match in enumerate(similar[:3], 1):
-                            existing_name = f"{match['existing_first_name']} {match['existing_last_name']}"
-                            print(f"   {i}. '{existing_name}' ({match['email']}) [ID: {match['person_id']}]")
-
-                        while True:
-                            try:
-                                selection = int(input(f"Enter number (1-{min(3, len(similar))}): ").strip())
-                                if 1 <= selection <= min(3, len(similar)):
-                                    selected_match = similar[selection - 1]
-                                    break
-                                else:
-                                    print("Invalid selection. Try again.")
-                            except ValueError:
-                                print("Please enter a valid number.")
-
-                    update_record = new_person.copy()
-                    update_record['_update_target_id'] = selected_match['person_id']
-                    update_people.append(update_record)
-                    print(f"✅ Will update '{selected_match['existing_first_name']} {selected_match['existing_last_name']}' "
-                          f"(ID: {selected_match['person_id']})")
-                    choice_made = True
-
-                elif choice == '4':
-                    print("\nNew person details:")
-                    for key, value in new_person.items():
-                        print(f"  {key}: {value}")
-
-                    print("\nExisting person details:")
-                    for i, match in enumerate(similar[:3], 1):
-                        existing_name = f"{match['existing_first_name']} {match['existing_last_name']}"
-                        print(f"\n  Match {i}: '{existing_name}' [ID: {match['person_id']}]")
-                        for key, value in match.items():
-                            print(f"    {key}: {value}")
-                else:
-                    print("Invalid choice. Please enter 1, 2, 3, or 4.")
+        if policy:
+            decision = resolve_by_policy(similar, policy)
         else:
-            full_name = f"{new_person.get('FirstName', '')} {new_person.get('LastName', '')}"
-            existing_name = f"{similar[0]['existing_first_name']} {similar[0]['existing_last_name']}"
+            decision = 'review' if interactive else 'link'
+
+        existing_name = f"{similar[0]['existing_first_name']} {similar[0]['existing_last_name']}"
+
+        if decision == 'link':
             print(f"⭐️ Auto-skipping potential duplicate: '{full_name}' "
                   f"(similarity: {similar[0]['similarity']:.2f} with '{existing_name}')")
-            skip_people.append(new_person)
+
+            skip_record = new_person.copy()
+            skip_record['_matched_existing_id'] = similar[0]['person_id']
+            skip_record['_matched_existing_email'] = similar[0]['email']
+            skip_people.append(skip_record)
+            continue
+
+        if decision == 'insert':
+            print(f"✅ Auto-inserting (best match {similar[0]['similarity']:.2f} below "
+                  f"{policy['auto_insert_threshold']}): '{full_name}'")
+            insert_people.append(new_person)
+            continue
+
+        if not interactive:
+            print(f"📝 Queued for review: '{full_name}' "
+                  f"(similarity: {similar[0]['similarity']:.2f} with '{existing_name}')")
+            if review_queue is not None:
+                queue_for_review(review_queue, 'person', new_person, similar)
+            continue
+
+        print_person_duplicate(new_person, similar)
+
+        choice_made = False
+        while not choice_made:
+            choice = ask(
+                "\nWhat would you like to do?\n"
+                "1. Insert as new person\n"
+                "2. Skip (it's a duplicate)\n"
+                "3. Update existing record\n"
+                "4. Show more details\n"
+                "Enter choice (1-4): "
+            ).strip()
+
+            if choice == '1':
+                insert_people.append(new_person)
+                choice_made = True
+
+            elif choice == '2':
+                if len(similar) == 1:
+                    selected_match = similar[0]
+                else:
+                    print("\nWhich existing person is this a duplicate of?")
+                    for i, match in enumerate(similar[:3], 1):
+                        existing_name = f"{match['existing_first_name']} {match['existing_last_name']}"
+                        print(f"   {i}. '{existing_name}' ({match['email']}) [ID: {match['person_id']}]")
+
+                    while True:
+                        try:
+                            selection = int(ask(f"Enter number (1-{min(3, len(similar))}): ").strip())
+                            if 1 <= selection <= min(3, len(similar)):
+                                selected_match = similar[selection - 1]
+                                break
+                            else:
+                                print("Invalid selection. Try again.")
+                        except ValueError:
+                            print("Please enter a valid number.")
+
+                skip_record = new_person.copy()
+                skip_record['_matched_existing_id'] = selected_match['person_id']
+                skip_record['_matched_existing_email'] = selected_match['email']
+                skip_people.append(skip_record)
+                choice_made = True
+
+            elif choice == '3':
+                if len(similar) == 1:
+                    selected_match = similar[0]
+                else:
+                    print("\nSelect which existing person to update:")
+                    for i, match in enumerate(similar[:3], 1):
+                        existing_name = f"{match['existing_first_name']} {match['existing_last_name']}"
+                        print(f"   {i}. '{existing_name}' ({match['email']}) [ID: {match['person_id']}]")
+
+                    while True:
+                        try:
+                            selection = int(ask(f"Enter number (1-{min(3, len(similar))}): ").strip())
+                            if 1 <= selection <= min(3, len(similar)):
+                                selected_match = similar[selection - 1]
+                                break
+                            else:
+                                print("Invalid selection. Try again.")
+                        except ValueError:
+                            print("Please enter a valid number.")
+
+                update_record = new_person.copy()
+                update_record['_update_target_id'] = selected_match['person_id']
+                update_people.append(update_record)
+                print(f"✅ Will update '{selected_match['existing_first_name']} {selected_match['existing_last_name']}' "
+                      f"(ID: {selected_match['person_id']})")
+                choice_made = True
+
+            elif choice == '4':
+                print("\nNew person details:")
+                for key, value in new_person.items():
+                    print(f"  {key}: {value}")
+
+                print("\nExisting person details:")
+                for i, match in enumerate(similar[:3], 1):
+                    existing_name = f"{match['existing_first_name']} {match['existing_last_name']}"
+                    print(f"\n  Match {i}: '{existing_name}' [ID: {match['person_id']}]")
+                    for key, value in match.items():
+                        print(f"    {key}: {value}")
+            else:
+                print("Invalid choice. Please enter 1, 2, 3, or 4.")
 
     return pd.DataFrame(insert_people), pd.DataFrame(skip_people), pd.DataFrame(update_people)
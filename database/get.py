@@ -1,41 +1,65 @@
-from constants import TABLE_CONFIGS
+from constants import FETCH_BATCH_SIZE, LOOKUP_CHUNK_SIZE, TABLE_CONFIGS
+from database.backend import DB_ERRORS
+from database.snapshot import read_snapshot, refresh_snapshot
 import pandas as pd
 import logging
-import pyodbc
 
 logging.basicConfig(level=logging.INFO)
 
-def get_existing_records(table_name, filter_value=None, conn=None):
-    """Load existing records from the specified table."""
-    if not conn:
-        return pd.DataFrame()
-    
-    config = TABLE_CONFIGS.get(table_name)
-    if not config:
-        logging.error(f"Unknown table: {table_name}")
-        return pd.DataFrame()
-    
-    try:
-        with conn.cursor() as cursor:
-            unique_column = config['unique_column']
-            filter_column = config['filter_column']
-            
-            if filter_column and filter_value:
-                query = f"SELECT {unique_column} FROM {table_name} WHERE {filter_column} LIKE ?"
-                cursor.execute(query, filter_value)
-            else:
-                query = f"SELECT {unique_column} FROM {table_name}"
-                cursor.execute(query)
-            
-            columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
-            return pd.DataFrame([dict(zip(columns, row)) for row in rows])
-    except pyodbc.Error as e:
-        logging.error(f"Error fetching existing records from {table_name}: {e}")
-        return pd.DataFrame()
-    
-def get_existing_records_with_ids(table_name, filter_value=None, conn=None):
-    """Enhanced version that loads records with their IDs for better duplicate matching."""
+def fetch_columnar(cursor, batch_size=FETCH_BATCH_SIZE):
+    """Stream the current result set with fetchmany straight into per-column lists and build a DataFrame."""
+    columns = [desc[0] for desc in cursor.description]
+    values = [[] for _ in columns]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for column_values, batch_values in zip(values, zip(*rows)):
+            column_values.extend(batch_values)
+    return pd.DataFrame(dict(zip(columns, values)), columns=columns)
+
+def existing_record_columns(table_name, config):
+    """Columns loaded for existing records; people and companies include their IDs for duplicate matching."""
+    return config.get('match_columns', [config['unique_column']])
+
+def fetch_existing(cursor, table_name, config, columns, filter_value=None, keys=None):
+    """
+    Select columns from table_name, optionally filtered on the config's filter_column.
+
+    keys maps column names to the batch's values for them, e.g. {'Email': [...]}. When given, only rows
+    matching at least one key are read, using one chunked IN query per column.
+    """
+    select = f"SELECT {', '.join(columns)} FROM {table_name}"
+    conditions, params = [], []
+    if config['filter_column'] and filter_value:
+        conditions.append(f"{config['filter_column']} = ?")
+        params.append(filter_value)
+
+    if keys is None:
+        cursor.execute(select + (f" WHERE {' AND '.join(conditions)}" if conditions else ""), *params)
+        return fetch_columnar(cursor)
+
+    frames = []
+    for key_column, key_values in keys.items():
+        key_values = {value for value in key_values if value is not None and not pd.isna(value)}
+        for chunk in chunked(key_values):
+            chunk_conditions = conditions + [f"{key_column} IN ({', '.join('?' for _ in chunk)})"]
+            cursor.execute(f"{select} WHERE {' AND '.join(chunk_conditions)}", params + chunk)
+            frames.append(fetch_columnar(cursor))
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    # A row can match several key columns; keep it once
+    return pd.concat(frames, ignore_index=True).drop_duplicates(subset=[columns[0]], ignore_index=True)
+
+def get_existing_records_with_ids(table_name, filter_value=None, conn=None, keys=None,
+                                  use_snapshot=False, full_refresh=False):
+    """
+    Enhanced version that loads records with their IDs for better duplicate matching.
+
+    With use_snapshot, the local snapshot is refreshed incrementally (or rebuilt when
+    full_refresh is set or it fails its consistency check) and the records are read from it.
+    """
     if not conn:
         return pd.DataFrame()
     
@@ -45,47 +69,51 @@ def get_existing_records_with_ids(table_name, filter_value=None, conn=None):
         return pd.DataFrame()
     
     try:
+        if use_snapshot and 'match_columns' in config:
+            refresh_snapshot(table_name, conn, full_refresh)
+            return read_snapshot(table_name, keys)
+
         with conn.cursor() as cursor:
-            if table_name == 'staging.VoucherCompany':
-                # Load company records with CompanyID
-                query = f"SELECT CompanyID, CompanyName, Address, City, Province FROM {table_name}"
-                cursor.execute(query)
-            elif table_name == 'staging.PeopleInfo':
-                # Load person records with PersonID
-                query = f"SELECT PersonID, LastName, FirstName, Email FROM {table_name}"
-                cursor.execute(query)
-            else:
-                # Use original logic for other tables
-                unique_column = config['unique_column']
-                filter_column = config['filter_column']
-                
-                if filter_column and filter_value:
-                    query = f"SELECT {unique_column} FROM {table_name} WHERE {filter_column} LIKE ?"
-                    cursor.execute(query, filter_value)
-                else:
-                    query = f"SELECT {unique_column} FROM {table_name}"
-                    cursor.execute(query)
-            
-            columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
-            return pd.DataFrame([dict(zip(columns, row)) for row in rows])
-    except pyodbc.Error as e:
+            columns = existing_record_columns(table_name, config)
+            return fetch_existing(cursor, table_name, config, columns, filter_value, keys)
+    except DB_ERRORS as e:
         logging.error(f"Error fetching existing records from {table_name}: {e}")
         return pd.DataFrame()
 
-def get_company_id_by_name(company_name, conn):
-    query = "SELECT CompanyID FROM staging.VoucherCompany WHERE CompanyName = ?"
+def chunked(values, chunk_size=LOOKUP_CHUNK_SIZE):
+    """Split values into lists small enough for one IN (...) query."""
+    values = list(values)
+    for start in range(0, len(values), chunk_size):
+        yield values[start:start + chunk_size]
+
+def get_ids_by_keys(table_name, id_column, key_column, keys, conn):
+    """Return {lowercased key: id} for the given keys, using one IN query per chunk. The lowest ID wins on collisions."""
+    ids = {}
     with conn.cursor() as cursor:
-        try:
-            cursor.execute(query, company_name)
-        except Exception as e:
-            print(f"❌ Failed to search for {company_name}: {e}")
-        row = cursor.fetchone()
-        return row[0] if row else None
-
-def get_person_id_by_email(email, conn):
-    query = "SELECT PersonID FROM staging.PeopleInfo WHERE Email = ?"
+        for chunk in chunked(keys):
+            placeholders = ', '.join('?' for _ in chunk)
+            cursor.execute(
+                f"SELECT {key_column}, {id_column} FROM {table_name} "
+                f"WHERE {key_column} IN ({placeholders}) ORDER BY {id_column}",
+                chunk
+            )
+            for key, entity_id in cursor.fetchall():
+                if key is not None:
+                    ids.setdefault(key.strip().lower(), entity_id)
+    return ids
+
+def get_person_ids_by_email(emails, conn):
+    return get_ids_by_keys('staging.PeopleInfo', 'PersonID', 'Email', emails, conn)
+
+def get_company_ids_by_name(company_names, conn):
+    return get_ids_by_keys('staging.VoucherCompany', 'CompanyID', 'CompanyName', company_names, conn)
+
+def get_existing_assignments(table_name, id_column, refnums, conn):
+    """Return the set of (RefNum, id) pairs already linked in a join table for the given RefNums."""
+    pairs = set()
     with conn.cursor() as cursor:
-        cursor.execute(query, email)
-        row = cursor.fetchone()
-        return row[0] if row else None
\ No newline at end of file
+        for chunk in chunked(refnums):
+            placeholders = ', '.join('?' for _ in chunk)
+            cursor.execute(f"SELECT RefNum, {id_column} FROM {table_name} WHERE RefNum IN ({placeholders})", chunk)
+            pairs.update((refnum, entity_id) for refnum, entity_id in cursor.fetchall())
+    return pairs
@@ -1,9 +1,15 @@
-from constants import TABLE_CONFIGS
+from constants import INSERT_CHUNK_SIZE, TABLE_CONFIGS
+from database.backend import (create_temp_table_sql, is_local_backend, rollback_to_savepoint_sql,
+                              savepoint_sql, temp_table_name)
+from database.blocking import with_blocking_keys, write_columns
+from database.rollback import batch_id_of, record_inserted_keys
 import logging
 import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
 
+INSERT_SOURCE = 'insert_source'
+
 def split_insert_update(new_df, existing_df, unique_column):
     """Split dataframe into records to insert and records to update, case-insensitively for strings."""
     if new_df[unique_column].dtype == object:
@@ -27,43 +33,197 @@ def generate_insert_query(table_name, columns):
     column_names = ', '.join(columns)
     return f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})"
 
-def insert_new_records(insert_df, table_name, conn):
-    """Insert new records into the specified table."""
+def build_param_rows(df, columns):
+    """Build executemany parameter tuples column by column, mapping NaN/NA to None."""
+    column_values = []
+    for col in columns:
+        if col in df.columns:
+            values = df[col].astype(object)
+            column_values.append(values.where(values.notna(), None).tolist())
+        else:
+            column_values.append([None] * len(df))
+    return list(zip(*column_values))
+
+def execute_chunked(cursor, query, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Run executemany over rows in chunks and return the (position, row, error) of rows that failed.
+
+    Each chunk runs under a savepoint. A failed chunk is rolled back to the savepoint and split
+    in half until the offending rows are isolated, so good rows still go in as bulk batches.
+    """
+    cursor.fast_executemany = True
+    failed = []
+    pending = [(start, rows[start:start + chunk_size]) for start in range(0, len(rows), chunk_size)]
+    pending.reverse()
+
+    while pending:
+        start, chunk = pending.pop()
+        cursor.execute(savepoint_sql('bulk_chunk'))
+        try:
+            cursor.executemany(query, chunk)
+        except Exception as e:
+            cursor.execute(rollback_to_savepoint_sql('bulk_chunk'))
+            if len(chunk) == 1:
+                failed.append((start, chunk[0], e))
+            else:
+                middle = len(chunk) // 2
+                pending.append((start + middle, chunk[middle:]))
+                pending.append((start, chunk[:middle]))
+
+    return failed
+
+def create_temp_table(cursor, table_name, temp_name, columns, extra_columns=None):
+    """
+    Create an empty session temp table shaped like the given columns of table_name.
+
+    extra_columns maps additional column names to SQL expressions, e.g. {'_RowNum': 'CAST(NULL AS INT)'}.
+    Expressions never inherit IDENTITY, so ID values can be loaded explicitly.
+    """
+    select_list = [f"{expression} AS {name}" for name, expression in (extra_columns or {}).items()]
+    select_list += columns
+    cursor.execute(f"DROP TABLE IF EXISTS {temp_name}")
+    cursor.execute(create_temp_table_sql(table_name, temp_name, select_list))
+
+def load_temp_table(cursor, temp_name, df, columns, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Bulk load df into a temp table created with a leading _RowNum column.
+
+    _RowNum holds each row's position in df so set-based results can be mapped back to it.
+    Returns the (position, row, error) of rows that could not be loaded.
+    """
+    rows = [(position,) + row for position, row in enumerate(build_param_rows(df, columns))]
+    query = generate_insert_query(temp_name, ['_RowNum'] + columns)
+    return execute_chunked(cursor, query, rows, chunk_size)
+
+def generate_insert_with_ids_query(table_name, columns, id_column):
+    """
+    Generate an insert from the temp table that returns each source row's generated ID.
+
+    INSERT ... OUTPUT cannot reference source columns, so a MERGE that never matches is used to
+    pair every INSERTED ID with the _RowNum it came from.
+    """
+    column_names = ', '.join(columns)
+    source_values = ', '.join(f"source.{col}" for col in columns)
+    return f"""
+        MERGE {table_name} AS target
+        USING {temp_table_name(INSERT_SOURCE)} AS source
+        ON 1 = 0
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT ({column_names}) VALUES ({source_values})
+        OUTPUT source._RowNum, INSERTED.{id_column};
+    """
+
+def insert_with_sequential_ids(cursor, table_name, columns, id_column):
+    """
+    Local backend version of the insert above, returning {position: generated id}.
+
+    SQLite gives an INTEGER PRIMARY KEY the current maximum plus one, so rows inserted in
+    _RowNum order inside one write transaction get consecutive IDs after the old maximum.
+    """
+    source = temp_table_name(INSERT_SOURCE)
+    column_names = ', '.join(columns)
+    cursor.execute(f"SELECT COALESCE(MAX({id_column}), 0) FROM {table_name}")
+    last_id = cursor.fetchone()[0]
+    cursor.execute(f"INSERT INTO {table_name} ({column_names}) SELECT {column_names} FROM {source} ORDER BY _RowNum")
+    cursor.execute(f"SELECT _RowNum FROM {source} ORDER BY _RowNum")
+    return {position: last_id + offset for offset, (position,) in enumerate(cursor.fetchall(), start=1)}
+
+def insert_returning_ids(cursor, insert_df, table_name, columns, id_column, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Insert rows through a temp table and return ({position: generated id}, failed rows).
+
+    Returns None for the IDs if the set-based insert failed and was rolled back, so the caller
+    can fall back to the plain chunked insert.
+    """
+    source = temp_table_name(INSERT_SOURCE)
+    create_temp_table(cursor, table_name, source, columns, {'_RowNum': 'CAST(NULL AS INT)'})
+    failed = load_temp_table(cursor, source, insert_df, columns, chunk_size)
+
+    cursor.execute(savepoint_sql('insert_with_ids'))
+    try:
+        if is_local_backend():
+            ids = insert_with_sequential_ids(cursor, table_name, columns, id_column)
+        else:
+            cursor.execute(generate_insert_with_ids_query(table_name, columns, id_column))
+            ids = {position: entity_id for position, entity_id in cursor.fetchall()}
+    except Exception as e:
+        cursor.execute(rollback_to_savepoint_sql('insert_with_ids'))
+        logging.error(f"Set-based insert into {table_name} failed, falling back to chunked inserts: {e}")
+        ids = None
+
+    cursor.execute(f"DROP TABLE IF EXISTS {source}")
+    return ids, failed
+
+def insert_new_records(insert_df, table_name, conn, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Bulk insert new records into the specified table.
+
+    Returns the rows that were inserted. For tables with an id_column in TABLE_CONFIGS the
+    generated IDs are captured with OUTPUT INSERTED and attached as '_inserted_id'.
+    """
     config = TABLE_CONFIGS.get(table_name)
     if not config:
         logging.error(f"Unknown table: {table_name}")
-        return
-    
-    columns = config['columns']
-    insert_query = generate_insert_query(table_name, columns)
+        return insert_df.iloc[0:0]
     
+    id_column = config.get('id_column')
+    ids = None
+    insert_df = with_blocking_keys(insert_df, table_name)
+
     with conn.cursor() as cursor:
-        for _, row in insert_df.iterrows():
-            values = tuple(None if pd.isna(x) else x for x in [row.get(col) for col in columns])
-            try:
-                cursor.execute(insert_query, values)
-            except Exception as e:
-                print(f"❌ Insert failed into {table_name}: {e}\nValues: {values}")
-        conn.commit()
+        columns = write_columns(cursor, table_name)
+        if id_column:
+            ids, failed = insert_returning_ids(cursor, insert_df, table_name, columns, id_column, chunk_size)
+        if ids is None:
+            insert_query = generate_insert_query(table_name, columns)
+            rows = build_param_rows(insert_df, columns)
+            failed = execute_chunked(cursor, insert_query, rows, chunk_size)
 
-def insert_into_project_asgmt(refnum, person_id, batch_id, loaded_at, conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM staging.ProjectAsgmt WHERE RefNum = ? AND PersonID = ?", (refnum, person_id))
-    if cursor.fetchone() is None:
-        cursor.execute(
-            "INSERT INTO staging.ProjectAsgmt (RefNum, PersonID, Participation, PersonTitle, BatchID, LoadedAt) VALUES (?, ?, 'PI', 'F', ?, ?)",
-            (refnum, person_id, batch_id, loaded_at)
-        )
+        # Remember what this batch inserted so rollback_batch can remove it
+        batch_id = batch_id_of(insert_df)
+        if batch_id is not None:
+            failed_positions = {position for position, _, _ in failed}
+            if ids is not None:
+                record_inserted_keys(cursor, batch_id, table_name, id_column, ids.values())
+            else:
+                unique_column = config['unique_column']
+                inserted_keys = [key for position, key in enumerate(insert_df[unique_column])
+                                 if position not in failed_positions]
+                record_inserted_keys(cursor, batch_id, table_name, unique_column, inserted_keys)
         conn.commit()
-        print(f"Linked {refnum} to PersonID: {person_id}")
 
-def insert_into_company_asgmt(refnum, company_id, batch_id, loaded_at, conn):
+    for _, values, e in failed:
+        print(f"❌ Insert failed into {table_name}: {e}\nValues: {values}")
+    if failed:
+        logging.error(f"{table_name} - {len(failed)} of {len(insert_df)} row(s) failed to insert")
+
+    failed_positions = {position for position, _, _ in failed}
+    inserted_df = insert_df.iloc[[i for i in range(len(insert_df)) if i not in failed_positions]].copy()
+    if ids is not None:
+        inserted_df['_inserted_id'] = [ids.get(position) for position in range(len(insert_df))
+                                       if position not in failed_positions]
+    return inserted_df
+
+ASSIGNMENT_INSERT_QUERIES = {
+    'staging.ProjectAsgmt': "INSERT INTO staging.ProjectAsgmt (RefNum, PersonID, Participation, PersonTitle, BatchID, LoadedAt) VALUES (?, ?, 'PI', 'F', ?, ?)",
+    'staging.CompanyAsgmt': "INSERT INTO staging.CompanyAsgmt (RefNum, CompanyID, BatchID, LoadedAt) VALUES (?, ?, ?, ?)",
+}
+
+def insert_assignments(table_name, links, batch_id, loaded_at, conn):
+    """
+    Bulk insert (RefNum, id) links into a join table inside the caller's open transaction.
+    The caller commits; a `with` cursor would commit each table's links on its own.
+    """
+    if not links:
+        return []
+
+    rows = [(refnum, entity_id, batch_id, loaded_at) for refnum, entity_id in links]
     cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM staging.CompanyAsgmt WHERE RefNum = ? AND CompanyID = ?", (refnum, company_id))
-    if cursor.fetchone() is None:
-        cursor.execute(
-            "INSERT INTO staging.CompanyAsgmt (RefNum, CompanyID, BatchID, LoadedAt) VALUES (?, ?, ?, ?)",
-            (refnum, company_id, batch_id, loaded_at)
-        )
-        conn.commit()
-        print(f"Linked {refnum} to CompanyID: {company_id}")
\ No newline at end of file
+    try:
+        failed = execute_chunked(cursor, ASSIGNMENT_INSERT_QUERIES[table_name], rows)
+    finally:
+        cursor.close()
+
+    for _, values, e in failed:
+        print(f"❌ Link failed into {table_name}: {e}\nValues: {values}")
+    return failed
@@ -0,0 +1,75 @@
+from typing import NamedTuple
+from database.normalize import normalize_company_name, normalize_person_name
+from database.utils import extract_operating_name
+
+
+class CompanyRecord(NamedTuple):
+    """An existing VoucherCompany row as duplicate matching needs it, with its name normalized once."""
+    CompanyID: object
+    CompanyName: object
+    Address: object
+    City: object
+    Province: object
+    normalized: str
+
+
+class PersonRecord(NamedTuple):
+    """An existing PeopleInfo row as duplicate matching needs it, with its name and email normalized once."""
+    PersonID: object
+    FirstName: object
+    LastName: object
+    Email: object
+    email_key: str
+    normalized: str
+
+
+class InvestmentLink(NamedTuple):
+    """The columns of an Investment row that link it to its person and company."""
+    RefNum: object
+    Email: object
+    CompanyName: object
+
+
+def column_values(df, column, default=None):
+    """A column as a plain list, or default for every row if the DataFrame doesn't have it."""
+    if column in df.columns:
+        return df[column].tolist()
+    return [default] * len(df)
+
+
+def email_key(email):
+    return email.strip().lower() if isinstance(email, str) else ""
+
+
+def full_name(first_name, last_name):
+    return (first_name if isinstance(first_name, str) else "") + (last_name if isinstance(last_name, str) else "")
+
+
+def normalized_company_name(company_name):
+    return normalize_company_name(extract_operating_name(company_name))
+
+
+def company_records(df):
+    """Build CompanyRecords from a DataFrame of existing companies, a column at a time."""
+    names = column_values(df, 'CompanyName')
+    return [
+        CompanyRecord(*values, normalized_company_name(values[1]))
+        for values in zip(column_values(df, 'CompanyID'), names, column_values(df, 'Address', ''),
+                          column_values(df, 'City', ''), column_values(df, 'Province', ''))
+    ]
+
+
+def person_records(df):
+    """Build PersonRecords from a DataFrame of existing people, a column at a time."""
+    return [
+        PersonRecord(person_id, first_name, last_name, email, email_key(email),
+                     normalize_person_name(full_name(first_name, last_name)))
+        for person_id, first_name, last_name, email in zip(
+            column_values(df, 'PersonID'), column_values(df, 'FirstName'),
+            column_values(df, 'LastName'), column_values(df, 'Email', ''))
+    ]
+
+
+def investment_links(df):
+    return [InvestmentLink(*values) for values in zip(
+        column_values(df, 'RefNum'), column_values(df, 'Email'), column_values(df, 'CompanyName'))]
@@ -0,0 +1,202 @@
+from datetime import datetime
+from api.joins import process_join_tables
+from constants import REVIEW_QUEUE_DIR
+from database.connection import connect_to_db
+from database.insert import insert_new_records
+from database.records import column_values, email_key
+from database.schema import apply_schema
+from database.update import update_existing_records_by_id
+import json
+import logging
+import os
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+REVIEW_ENTITIES = {
+    'person': {
+        'id_key': 'person_id',
+        'name_keys': ['existing_first_name', 'existing_last_name'],
+        'matched_label': ('_matched_existing_email', 'email'),
+    },
+    'company': {
+        'id_key': 'company_id',
+        'name_keys': ['existing_company'],
+        'matched_label': ('_matched_existing_name', 'existing_company'),
+    },
+}
+
+def to_json_value(value):
+    """Convert a DataFrame cell into something json.dump can write."""
+    if value is None:
+        return None
+    if isinstance(value, (list, dict)):
+        return value
+    if pd.isna(value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+def queue_for_review(review_queue, entity, record, similar):
+    """Append an unresolved duplicate and its best candidates to the review queue."""
+    spec = REVIEW_ENTITIES[entity]
+    candidates = []
+    for match in similar[:3]:
+        candidates.append({
+            'id': to_json_value(match[spec['id_key']]),
+            'name': ' '.join(str(match[key]) for key in spec['name_keys']).strip(),
+            'similarity': round(match['similarity'], 4),
+            'match': {key: to_json_value(value) for key, value in match.items()},
+        })
+
+    review_queue.append({
+        'entity': entity,
+        'record': {key: to_json_value(value) for key, value in record.items()},
+        'candidates': candidates,
+        # Reviewers fill in decision (insert / skip / update) and may change target_id
+        'decision': '',
+        'target_id': candidates[0]['id'],
+    })
+
+def write_review_queue(review_queue, batch_id, loaded_at, investment_df, directory=REVIEW_QUEUE_DIR):
+    """Write the review queue for a batch to a JSON file and return its path."""
+    if not review_queue:
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"review_{batch_id}.json")
+
+    link_columns = [col for col in ['RefNum', 'Email', 'CompanyName'] if col in investment_df.columns]
+    links = [
+        {col: to_json_value(value) for col, value in zip(link_columns, row)}
+        for row in investment_df[link_columns].itertuples(index=False)
+    ]
+
+    with open(path, 'w') as file:
+        json.dump({
+            'batch_id': str(batch_id),
+            'loaded_at': loaded_at.isoformat(),
+            'links': links,
+            'items': review_queue,
+        }, file, indent=4)
+
+    logging.info(f"Wrote {len(review_queue)} record(s) for review to {path}")
+    return path
+
+def split_review_decisions(items, entity):
+    """
+    Turn reviewed items for one entity into insert, skip and update DataFrames. Each row keeps
+    the position of its item in '_review_item', so it can be marked applied once written.
+    """
+    matched_column, matched_key = REVIEW_ENTITIES[entity]['matched_label']
+    insert_records, skip_records, update_records = [], [], []
+
+    for position, item in enumerate(items):
+        if item['entity'] != entity or item.get('applied_at'):
+            continue
+
+        decision = str(item.get('decision') or '').strip().lower()
+        record = dict(item['record'])
+        record['_review_item'] = position
+        target_id = item.get('target_id')
+
+        if decision == 'insert':
+            insert_records.append(record)
+        elif decision in ('skip', 'update'):
+            if target_id is None:
+                print(f"⚠️  No target_id for reviewed {entity} record, leaving it in the queue")
+                continue
+            target = next((c for c in item['candidates'] if c['id'] == target_id), None)
+            if decision == 'skip':
+                record['_matched_existing_id'] = target_id
+                record[matched_column] = target['match'].get(matched_key) if target else None
+                skip_records.append(record)
+            else:
+                record['_update_target_id'] = target_id
+                update_records.append(record)
+
+    return pd.DataFrame(insert_records), pd.DataFrame(skip_records), pd.DataFrame(update_records)
+
+def mark_applied(items, frames):
+    """Stamp applied_at on the items whose rows came back from the writes in frames."""
+    applied_at = datetime.now().isoformat()
+    for df in frames:
+        for position in column_values(df, '_review_item'):
+            items[int(position)]['applied_at'] = applied_at
+
+def apply_review_decisions(path):
+    """Apply reviewed decisions from a review queue file in one batch and link them to their investments."""
+    with open(path, 'r') as file:
+        review = json.load(file)
+
+    items = review['items']
+    people_insert_df, people_skip_df, people_update_df = split_review_decisions(items, 'person')
+    company_insert_df, company_skip_df, company_update_df = split_review_decisions(items, 'company')
+
+    resolved = sum(len(df) for df in [
+        people_insert_df, people_skip_df, people_update_df,
+        company_insert_df, company_skip_df, company_update_df
+    ])
+    if resolved == 0:
+        print(f"No reviewed decisions to apply in {path}")
+        return
+
+    # The queue holds dates and IDs as JSON strings and numbers; cast them back before writing
+    people_insert_df, people_skip_df, people_update_df = (
+        apply_schema(df, 'staging.PeopleInfo') for df in [people_insert_df, people_skip_df, people_update_df])
+    company_insert_df, company_skip_df, company_update_df = (
+        apply_schema(df, 'staging.VoucherCompany') for df in [company_insert_df, company_skip_df, company_update_df])
+
+    conn = connect_to_db(False)
+    if not conn:
+        logging.error("Could not connect to DB")
+        return
+
+    try:
+        if not people_insert_df.empty:
+            people_insert_df = insert_new_records(people_insert_df, 'staging.PeopleInfo', conn)
+        if not people_update_df.empty:
+            people_update_df = update_existing_records_by_id(people_update_df, 'staging.PeopleInfo', conn)
+        if not company_insert_df.empty:
+            company_insert_df = insert_new_records(company_insert_df, 'staging.VoucherCompany', conn)
+        if not company_update_df.empty:
+            company_update_df = update_existing_records_by_id(company_update_df, 'staging.VoucherCompany', conn)
+    finally:
+        conn.close()
+
+    # Only link the investments whose person or company was resolved in this review
+    resolved_emails = set()
+    for df in [people_insert_df, people_skip_df, people_update_df]:
+        resolved_emails.update(email_key(email) for email in column_values(df, 'Email'))
+    resolved_emails.discard("")
+    resolved_companies = set()
+    for df in [company_insert_df, company_skip_df, company_update_df]:
+        resolved_companies.update(name for name in column_values(df, 'CompanyName') if isinstance(name, str))
+
+    links_df = pd.DataFrame(review['links'])
+    if not links_df.empty:
+        # Links written before a batch had emails or company names may lack either column
+        links_df = links_df[[
+            email_key(email) in resolved_emails or company in resolved_companies
+            for email, company in zip(column_values(links_df, 'Email'), column_values(links_df, 'CompanyName'))
+        ]]
+        process_join_tables(
+            links_df,
+            people_insert_df, people_skip_df, people_update_df,
+            company_insert_df, company_skip_df, company_update_df,
+            review['batch_id'], datetime.fromisoformat(review['loaded_at'])
+        )
+
+    # Only rows that came back written are marked; the rest stay in the queue to apply again
+    applied = [people_insert_df, people_skip_df, people_update_df,
+               company_insert_df, company_skip_df, company_update_df]
+    mark_applied(items, applied)
+    with open(path, 'w') as file:
+        json.dump(review, file, indent=4)
+
+    pending = sum(1 for item in items if not item.get('applied_at'))
+    logging.info(f"Applied {sum(len(df) for df in applied)} of {resolved} reviewed decision(s) from {path}, "
+                 f"{pending} still pending")
@@ -0,0 +1,185 @@
+from constants import TABLE_CONFIGS
+from database.backend import is_local_backend, key_text_expression
+from database.blocking import write_columns
+from database.connection import connect_to_db, open_connection
+from database.snapshot import invalidate_snapshot
+import logging
+import threading
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+PRE_IMAGE_TABLE = 'staging.BatchPreImage'
+ASSIGNMENT_TABLES = ['staging.ProjectAsgmt', 'staging.CompanyAsgmt']
+
+_pre_image_table_ready = False
+_pre_image_table_lock = threading.Lock()
+
+def create_pre_image_table(cursor):
+    cursor.execute(f"""
+        IF OBJECT_ID('{PRE_IMAGE_TABLE}') IS NULL
+        BEGIN
+            CREATE TABLE {PRE_IMAGE_TABLE} (
+                PreImageID BIGINT IDENTITY(1, 1) PRIMARY KEY,
+                BatchID UNIQUEIDENTIFIER NOT NULL,
+                TableName NVARCHAR(128) NOT NULL,
+                KeyColumn NVARCHAR(128) NOT NULL,
+                KeyValue NVARCHAR(450) NOT NULL,
+                PreImage NVARCHAR(MAX) NULL,  -- NULL: the batch inserted this row
+                CapturedAt DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+            );
+            CREATE INDEX IX_BatchPreImage_BatchID ON {PRE_IMAGE_TABLE} (BatchID, TableName);
+        END
+    """)
+
+def prepare_pre_image_table():
+    """
+    Create the shadow table holding pre-images of rows a batch touched, once per process.
+
+    The DDL runs on a connection of its own, outside the pool and any batch transaction, and
+    is committed before the flag is set, so a batch that rolls back can't take the table with it.
+    """
+    global _pre_image_table_ready
+    # The local backend creates it with the rest of the staging schema
+    if is_local_backend():
+        return
+    with _pre_image_table_lock:
+        if _pre_image_table_ready:
+            return
+        conn = open_connection(False)
+        if not conn:
+            logging.error("Could not connect to DB to create the pre-image table")
+            return
+        try:
+            cursor = conn.cursor()
+            create_pre_image_table(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+        _pre_image_table_ready = True
+
+def batch_id_of(df):
+    """The BatchID stamped on a batch DataFrame, or None if it has none."""
+    if 'BatchID' not in df.columns or df.empty:
+        return None
+    batch_id = df['BatchID'].iloc[0]
+    return None if pd.isna(batch_id) else batch_id
+
+def pre_image_expression(table_name):
+    """Expression rendering the target row as JSON for the pre-image column."""
+    if is_local_backend():
+        config = TABLE_CONFIGS[table_name]
+        columns = ([config['id_column']] if config.get('id_column') else []) + config['columns']
+        pairs = ', '.join(f"'{col}', target.{col}" for col in columns)
+        return f"json_object({pairs})"
+    return "(SELECT target.* FOR JSON PATH, WITHOUT_ARRAY_WRAPPER, INCLUDE_NULL_VALUES)"
+
+def capture_pre_images(cursor, batch_id, table_name, key_column, source_sql):
+    """
+    Copy the current state of rows the batch is about to change into the shadow table.
+
+    source_sql is the FROM/JOIN/WHERE text selecting those rows, with the table aliased as target.
+    """
+    prepare_pre_image_table()
+    cursor.execute(f"""
+        INSERT INTO {PRE_IMAGE_TABLE} (BatchID, TableName, KeyColumn, KeyValue, PreImage)
+        SELECT ?, ?, ?, {key_text_expression(f'target.{key_column}')}, {pre_image_expression(table_name)}
+        {source_sql}
+    """, batch_id, table_name, key_column)
+
+def record_inserted_keys(cursor, batch_id, table_name, key_column, keys):
+    """Remember the keys of rows the batch inserted so rollback_batch can delete them."""
+    keys = [key for key in keys if key is not None]
+    if not keys:
+        return
+    prepare_pre_image_table()
+    rows = [(batch_id, table_name, key_column, str(key)) for key in keys]
+    cursor.fast_executemany = True
+    cursor.executemany(f"""
+        INSERT INTO {PRE_IMAGE_TABLE} (BatchID, TableName, KeyColumn, KeyValue, PreImage)
+        VALUES (?, ?, ?, ?, NULL)
+    """, rows)
+
+def restore_table(cursor, batch_id, table_name):
+    """Delete the rows the batch inserted into table_name and restore the rows it changed."""
+    columns = write_columns(cursor, table_name)
+
+    for key_column in key_columns_for(cursor, batch_id, table_name):
+        key_text = key_text_expression(f"target.{key_column}")
+        cursor.execute(f"""
+            DELETE FROM {table_name}
+            WHERE {key_text_expression(key_column)} IN (
+                SELECT KeyValue FROM {PRE_IMAGE_TABLE}
+                WHERE BatchID = ? AND TableName = ? AND KeyColumn = ? AND PreImage IS NULL
+            )
+        """, batch_id, table_name, key_column)
+        deleted = cursor.rowcount
+
+        # A key the batch inserted is gone now, so only keys it found existing are restored;
+        # the earliest pre-image of a key is its state before the batch started
+        earliest_images = f"""(
+            SELECT KeyValue, PreImage,
+                ROW_NUMBER() OVER (PARTITION BY KeyValue ORDER BY PreImageID) AS _ImageRank
+            FROM {PRE_IMAGE_TABLE}
+            WHERE BatchID = ? AND TableName = ? AND KeyColumn = ? AND PreImage IS NOT NULL
+        )"""
+        if is_local_backend():
+            set_clause = ', '.join(f"{col} = json_extract(pre.PreImage, '$.{col}')" for col in columns)
+            cursor.execute(f"""
+                UPDATE {table_name} AS target
+                SET {set_clause}
+                FROM {earliest_images} AS pre
+                WHERE pre.KeyValue = {key_text} AND pre._ImageRank = 1
+            """, batch_id, table_name, key_column)
+        else:
+            json_columns = ', '.join(f"{col} NVARCHAR(MAX) '$.{col}'" for col in columns)
+            set_clause = ', '.join(f"target.{col} = image.{col}" for col in columns)
+            cursor.execute(f"""
+                UPDATE target
+                SET {set_clause}
+                FROM {table_name} AS target
+                JOIN {earliest_images} AS pre
+                    ON pre.KeyValue = {key_text} AND pre._ImageRank = 1
+                CROSS APPLY OPENJSON(pre.PreImage) WITH ({json_columns}) AS image
+            """, batch_id, table_name, key_column)
+        logging.info(f"{table_name} - deleted {deleted} inserted row(s), restored {cursor.rowcount} changed row(s)")
+
+def key_columns_for(cursor, batch_id, table_name):
+    cursor.execute(f"SELECT DISTINCT KeyColumn FROM {PRE_IMAGE_TABLE} WHERE BatchID = ? AND TableName = ?",
+                   batch_id, table_name)
+    return [row[0] for row in cursor.fetchall()]
+
+def rollback_batch(batch_id):
+    """
+    Undo everything a batch loaded, using the pre-images captured while it ran.
+
+    Join-table links stamped with the BatchID are deleted first, then rows the batch inserted,
+    then changed rows are restored to their pre-images, all in one transaction. Restored rows
+    keep their old LoadedAt, so the local snapshot is invalidated afterwards.
+    """
+    prepare_pre_image_table()
+    conn = connect_to_db(False)
+    if not conn:
+        logging.error("Could not connect to DB")
+        return False
+
+    try:
+        with conn.cursor() as cursor:
+            for table_name in ASSIGNMENT_TABLES:
+                cursor.execute(f"DELETE FROM {table_name} WHERE BatchID = ?", batch_id)
+                logging.info(f"{table_name} - removed {cursor.rowcount} link(s)")
+
+            for table_name in TABLE_CONFIGS:
+                restore_table(cursor, batch_id, table_name)
+
+            cursor.execute(f"DELETE FROM {PRE_IMAGE_TABLE} WHERE BatchID = ?", batch_id)
+        conn.commit()
+        invalidate_snapshot()
+        print(f"✅ Batch {batch_id} rolled back")
+        return True
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Rollback of batch {batch_id} failed, nothing was changed: {e}")
+        return False
+    finally:
+        conn.close()
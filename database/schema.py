@@ -0,0 +1,49 @@
+from constants import RESOLVED_ID_DTYPES, TABLE_CONFIGS
+import logging
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+def apply_schema(df, table_name):
+    """
+    Cast a batch DataFrame to the compact dtypes configured for its table.
+
+    Low-cardinality and per-batch constant columns become categoricals, dates datetime64 and
+    the IDs attached during dedup nullable integers. Columns not in the schema are left alone,
+    and a column that won't cast keeps its dtype rather than failing the batch.
+    """
+    if df.empty:
+        return df
+    dtypes = {**TABLE_CONFIGS[table_name].get('dtypes', {}), **RESOLVED_ID_DTYPES}
+    for col, dtype in dtypes.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        try:
+            df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"{table_name}.{col} kept as {df[col].dtype}, could not cast to {dtype}: {e}")
+    return df
+
+def release_categories(df, columns):
+    """Turn categorical columns back into object so values outside their categories can be assigned."""
+    return df.astype({col: object for col in columns if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype)})
+
+def frame_memory(df):
+    """Deep memory footprint of a DataFrame in bytes, counting the Python objects it holds."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def memory_report(frames):
+    """
+    Print the footprint of each batch DataFrame with its schema dtypes against all-object columns,
+    the way the frames were laid out before the schema layer. frames maps a label to a DataFrame.
+    """
+    total_before = total_after = 0
+    print("📦 Batch memory (all-object -> schema dtypes):")
+    for label, df in frames.items():
+        before = frame_memory(df.astype(object))
+        after = frame_memory(df)
+        total_before += before
+        total_after += after
+        print(f"   {label}: {len(df)} row(s), {before / 1024:.1f} KiB -> {after / 1024:.1f} KiB")
+    saved = 100 * (1 - total_after / total_before) if total_before else 0
+    print(f"   Total: {total_before / 1024:.1f} KiB -> {total_after / 1024:.1f} KiB ({saved:.0f}% smaller)")
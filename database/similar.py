@@ -1,74 +1,69 @@
+import pandas as pd
 from difflib import SequenceMatcher
-from database.normalize import normalize_company_name, normalize_person_name
-from database.utils import extract_operating_name
+from database.normalize import normalize_person_name
+from database.records import company_records, email_key, full_name, normalized_company_name, person_records
 
 
-def find_similar_companies(new_company, existing_df, similarity_threshold=0.8):
-    """Find similar companies and return their IDs."""
-    if existing_df.empty:
+def find_similar_companies(new_company, existing, similarity_threshold=0.8):
+    """
+    Find similar companies and return their IDs.
+
+    existing is a DataFrame of existing companies or the CompanyRecords built from one; pass the
+    records when matching many companies so each existing name is only normalized once.
+    """
+    if isinstance(existing, pd.DataFrame):
+        existing = company_records(existing)
+    if not existing:
         return []
     
-    new_operating = extract_operating_name(new_company['CompanyName'])
-    new_normalized = normalize_company_name(new_operating)
+    new_normalized = normalized_company_name(new_company['CompanyName'])
     
     similar_companies = []
     
-    for _, existing in existing_df.iterrows():
-        existing_operating = extract_operating_name(existing['CompanyName'])
-        existing_normalized = normalize_company_name(existing_operating)
-        
-        similarity = SequenceMatcher(None, new_normalized, existing_normalized).ratio()
-        # if 'dot' in existing_normalized:
-        #     print('New Normalized:' + new_normalized)
-        #     print('Existing Normalized:' + existing_normalized)
-        #     print('Similarity: ' + str(similarity))
+    for company in existing:
+        similarity = SequenceMatcher(None, new_normalized, company.normalized).ratio()
         
         if similarity >= similarity_threshold:
             similar_companies.append({
-                'company_id': existing['CompanyID'],
-                'existing_company': existing['CompanyName'],
+                'company_id': company.CompanyID,
+                'existing_company': company.CompanyName,
                 'similarity': similarity,
-                'address': existing.get('Address', ''),
-                'city': existing.get('City', ''),
-                'province': existing.get('Province', '')
+                'address': company.Address,
+                'city': company.City,
+                'province': company.Province
             })
     
     return sorted(similar_companies, key=lambda x: x['similarity'], reverse=True)
 
-def find_similar_people(new_person, existing_df, similarity_threshold=0.8):
-    """Find similar people and return their IDs."""
-    if existing_df.empty:
+def find_similar_people(new_person, existing, similarity_threshold=0.8):
+    """
+    Find similar people and return their IDs.
+
+    existing is a DataFrame of existing people or the PersonRecords built from one.
+    """
+    if isinstance(existing, pd.DataFrame):
+        existing = person_records(existing)
+    if not existing:
         return []
     
-    # SAFELY EXTRACT NEW EMAIL
-    raw_new_email = new_person.get('Email')
-    new_email = raw_new_email.strip().lower() if isinstance(raw_new_email, str) else ""
-    
-    new_full_name = new_person['FirstName'] + new_person['LastName']
-    new_normalized = normalize_person_name(new_full_name)
+    new_email = email_key(new_person.get('Email'))
+    new_normalized = normalize_person_name(full_name(new_person['FirstName'], new_person['LastName']))
 
     similar_people = []
     
-    for _, existing in existing_df.iterrows():
-        # SAFELY EXTRACT EXISTING EMAIL
-        raw_existing_email = existing.get('Email')
-        existing_email = raw_existing_email.strip().lower() if isinstance(raw_existing_email, str) else ""
-        
-        existing_full_name = existing['FirstName'] + existing['LastName']
-        existing_normalized = normalize_person_name(existing_full_name)
-
-        if new_email and existing_email and new_email == existing_email:
+    for person in existing:
+        if new_email and person.email_key and new_email == person.email_key:
             similarity = 1.0
         else:
-            similarity = SequenceMatcher(None, new_normalized, existing_normalized).ratio()
+            similarity = SequenceMatcher(None, new_normalized, person.normalized).ratio()
         
         if similarity >= similarity_threshold:
             similar_people.append({
-                'person_id': existing['PersonID'],  # Store the ID!
-                'existing_last_name': existing['LastName'],
-                'existing_first_name': existing['FirstName'],
+                'person_id': person.PersonID,  # Store the ID!
+                'existing_last_name': person.LastName,
+                'existing_first_name': person.FirstName,
                 'similarity': similarity,
-                'email': existing.get('Email', ''),
+                'email': person.Email,
             })
     
-    return sorted(similar_people, key=lambda x: x['similarity'], reverse=True)
\ No newline at end of file
+    return sorted(similar_people, key=lambda x: x['similarity'], reverse=True)
@@ -0,0 +1,167 @@
+from datetime import datetime
+from constants import FETCH_BATCH_SIZE, SNAPSHOT_DB_PATH, TABLE_CONFIGS
+from database.backend import epoch_seconds_expression
+from database.connection import database_identity
+import hashlib
+import logging
+import os
+import sqlite3
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+def local_table_name(table_name):
+    """staging.PeopleInfo -> PeopleInfo"""
+    return table_name.split('.')[-1]
+
+def snapshot_columns(table_name):
+    """Columns kept in the snapshot: the match columns plus LoadedAt for incremental refresh."""
+    return TABLE_CONFIGS[table_name]['match_columns'] + ['LoadedAt']
+
+def snapshot_path(base=SNAPSHOT_DB_PATH):
+    """
+    The snapshot file of the database connect_to_db reaches, e.g. snapshot/staging_snapshot_1f0c2a9e.sqlite3,
+    so a --local-db run and an Azure run never match against each other's rows.
+    """
+    root, extension = os.path.splitext(base)
+    return f"{root}_{hashlib.sha1(database_identity().encode('utf-8')).hexdigest()[:8]}{extension}"
+
+def connect_to_snapshot(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Concurrent table syncs may refresh different tables of the same file at once
+    snapshot = sqlite3.connect(path, timeout=60)
+    snapshot.execute("""
+        CREATE TABLE IF NOT EXISTS snapshot_meta (
+            table_name TEXT PRIMARY KEY,
+            high_water TEXT,
+            refreshed_at TEXT
+        )
+    """)
+    return snapshot
+
+def ensure_snapshot_table(snapshot, table_name):
+    config = TABLE_CONFIGS[table_name]
+    column_defs = [f"{config['id_column']} INTEGER PRIMARY KEY"]
+    column_defs += [f"{col}" for col in snapshot_columns(table_name) if col != config['id_column']]
+    snapshot.execute(f"CREATE TABLE IF NOT EXISTS {local_table_name(table_name)} ({', '.join(column_defs)})")
+
+def to_snapshot_value(value):
+    """sqlite3 stores datetimes as ISO strings; keep the format fixed so high-water comparisons work."""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+def pull_rows(cursor, snapshot, table_name, since=None):
+    """Stream rows from the server into the snapshot and return (row count, newest LoadedAt)."""
+    columns = snapshot_columns(table_name)
+    query = f"SELECT {', '.join(columns)} FROM {table_name}"
+    if since is not None:
+        # >= so rows written in the same instant as the previous high water are not missed
+        cursor.execute(query + " WHERE LoadedAt >= ?", since)
+    else:
+        cursor.execute(query)
+
+    upsert = (f"INSERT OR REPLACE INTO {local_table_name(table_name)} ({', '.join(columns)}) "
+              f"VALUES ({', '.join('?' for _ in columns)})")
+    loaded_at_position = columns.index('LoadedAt')
+    pulled, high_water = 0, since
+
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            break
+        snapshot.executemany(upsert, [tuple(to_snapshot_value(value) for value in row) for row in rows])
+        pulled += len(rows)
+        for row in rows:
+            loaded_at = row[loaded_at_position]
+            if loaded_at is not None and (high_water is None or loaded_at > high_water):
+                high_water = loaded_at
+
+    return pulled, high_water
+
+def consistency_query(table_name, from_table, local=None):
+    id_column = TABLE_CONFIGS[table_name]['id_column']
+    return (f"SELECT COUNT(*), MAX({id_column}), SUM({epoch_seconds_expression('LoadedAt', local)}) "
+            f"FROM {from_table}")
+
+def snapshot_is_consistent(cursor, snapshot, table_name):
+    """
+    Compare row count, max ID and a sum over LoadedAt with the server. The count and max ID catch
+    deletes; the LoadedAt sum catches rows the high water missed because they were written under an
+    earlier LoadedAt, by a run that committed late or by a rollback restoring pre-images.
+    """
+    cursor.execute(consistency_query(table_name, table_name))
+    server = tuple(cursor.fetchone())
+    local = tuple(snapshot.execute(consistency_query(table_name, local_table_name(table_name), local=True)).fetchone())
+    if server != local:
+        logging.warning(f"Snapshot of {table_name} is out of sync (server count/max ID/LoadedAt sum {server}, local {local})")
+        return False
+    return True
+
+def refresh_snapshot(table_name, conn, full_refresh=False, path=None):
+    """
+    Bring the local snapshot of table_name up to date.
+
+    Pulls only rows with LoadedAt at or after the stored high water, unless full_refresh is
+    set, the snapshot is new, or the consistency check fails, in which case it is rebuilt.
+    """
+    snapshot = connect_to_snapshot(path or snapshot_path())
+    try:
+        ensure_snapshot_table(snapshot, table_name)
+        meta = snapshot.execute("SELECT high_water FROM snapshot_meta WHERE table_name = ?", (table_name,)).fetchone()
+        since = datetime.fromisoformat(meta[0]) if meta and meta[0] and not full_refresh else None
+
+        with conn.cursor() as cursor:
+            if since is None:
+                snapshot.execute(f"DELETE FROM {local_table_name(table_name)}")
+            pulled, high_water = pull_rows(cursor, snapshot, table_name, since)
+
+            if since is not None and not snapshot_is_consistent(cursor, snapshot, table_name):
+                snapshot.execute(f"DELETE FROM {local_table_name(table_name)}")
+                pulled, high_water = pull_rows(cursor, snapshot, table_name)
+                since = None
+
+        snapshot.execute(
+            "INSERT OR REPLACE INTO snapshot_meta (table_name, high_water, refreshed_at) VALUES (?, ?, ?)",
+            (table_name, to_snapshot_value(high_water), datetime.now().isoformat(sep=' '))
+        )
+        snapshot.commit()
+        logging.info(f"Snapshot of {table_name} {'rebuilt' if since is None else 'refreshed'}: {pulled} row(s) pulled")
+    finally:
+        snapshot.close()
+
+def invalidate_snapshot(path=None):
+    """
+    Forget the high water of every table so the next refresh rebuilds the snapshot. Needed when
+    rows change without a newer LoadedAt, e.g. rows restored to their pre-images by rollback_batch.
+    """
+    path = path or snapshot_path()
+    if not os.path.exists(path):
+        return
+    snapshot = connect_to_snapshot(path)
+    try:
+        snapshot.execute("DELETE FROM snapshot_meta")
+        snapshot.commit()
+    finally:
+        snapshot.close()
+    logging.info(f"Snapshot {path} invalidated, it will be rebuilt on the next --snapshot run")
+
+def read_snapshot(table_name, keys=None, path=None):
+    """Read the match columns of table_name from the local snapshot, optionally only rows matching keys."""
+    columns = TABLE_CONFIGS[table_name]['match_columns']
+    snapshot = connect_to_snapshot(path or snapshot_path())
+    try:
+        ensure_snapshot_table(snapshot, table_name)
+        df = pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {local_table_name(table_name)}", snapshot)
+    finally:
+        snapshot.close()
+
+    if keys is None:
+        return df
+
+    # Match keys case-insensitively like the server collation does
+    matches = pd.Series(False, index=df.index)
+    for key_column, key_values in keys.items():
+        lowered = {str(value).lower() for value in key_values if value is not None and not pd.isna(value)}
+        matches |= df[key_column].astype(str).str.lower().isin(lowered)
+    return df[matches].reset_index(drop=True)
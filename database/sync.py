@@ -1,128 +1,232 @@
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import pandas as pd
-from constants import TABLE_CONFIGS
-from database.connection import connect_to_db
-from database.duplicates import handle_company_duplicates, handle_person_duplicates
-from database.get import get_existing_records, get_existing_records_with_ids
-from database.insert import insert_new_records, split_insert_update
-from database.update import update_existing_records, update_existing_records_by_id
+from constants import DEDUP_FETCH_KEYS, TABLE_CONFIGS
+from database.blocking import get_blocking_candidates
+from database.connection import batch_stage, connect_to_db
+from database.duplicates import handle_company_duplicates, handle_person_duplicates, prompt_phase
+from database.get import get_existing_records_with_ids
+from database.insert import insert_new_records
+from database.records import column_values
+from database.rollback import prepare_pre_image_table
+from database.schema import apply_schema
+from database.update import audit_file_path, update_existing_records_by_id
+from database.upsert import upsert_records
+from instrumentation import record_rows, traced
+from profiling import profile_stage
 
 logging.basicConfig(level=logging.INFO)
 
-def sync_with_database(df, table_name, filter_value=None, batch_id=None, loaded_at=None):
+def stamp_batch(df, table_name, batch_id, loaded_at):
+    """Copy of df carrying the batch's BatchID and LoadedAt, with the table's dtypes applied."""
+    df = df.copy()
+    df['BatchID'] = batch_id
+    df['LoadedAt'] = loaded_at
+    return apply_schema(df, table_name)
+
+@traced()
+def sync_with_database(df, table_name, batch_id=None, loaded_at=None):
     """
     Sync dataframe with the specified database table.
     
     Args:
         df: DataFrame containing the data to sync
         table_name: Name of the table to sync with ('Investment' or 'VoucherCompany')
-        filter_value: Optional filter value (e.g., research_fund_id for Investment table)
+
+    Returns:
+        DataFrame of per-row outcomes (INSERT / UPDATE / DUPLICATE / FAILED) indexed like df.
     """
     config = TABLE_CONFIGS.get(table_name)
     if not config:
         logging.error(f"Unknown table: {table_name}")
-        return
+        return pd.DataFrame()
     
-    df = df.copy()
-    df['BatchID'] = batch_id
-    df['LoadedAt'] = loaded_at
+    df = stamp_batch(df, table_name, batch_id, loaded_at)
+    record_rows(len(df))
     
     conn = connect_to_db(False)
-    if conn:
-        try:
-            existing_df = get_existing_records(table_name, filter_value, conn)
-            unique_column = config['unique_column']
-            insert_df, update_df = split_insert_update(df, existing_df, unique_column)
-            
-            insert_new_records(insert_df, table_name, conn)
-            update_existing_records(update_df, table_name, conn)
-            
-            logging.info(f"{table_name} - Inserted: {len(insert_df)}, Updated: {len(update_df)}")
-        finally:
-            conn.close()
-    else:
+    if not conn:
         logging.error("Could not connect to DB")
+        return pd.DataFrame()
+
+    try:
+        outcomes = upsert_records(df, table_name, conn)
+    finally:
+        conn.close()
+
+    counts = outcomes['_action'].value_counts() if not outcomes.empty else {}
+    logging.info(f"{table_name} - Inserted: {counts.get('INSERT', 0)}, Changed: {counts.get('UPDATE', 0)}, "
+                 f"Unchanged: {counts.get('UNCHANGED', 0)}, Duplicate keys: {counts.get('DUPLICATE', 0)}, "
+                 f"Failed: {counts.get('FAILED', 0)}")
+    return outcomes
 
 # Convenience functions for backward compatibility and ease of use
-def sync_investment_data(df, research_fund_id, batch_id, loaded_at):
+@traced()
+def sync_investment_data(df, batch_id, loaded_at):
     """Convenience function to sync Investment data."""
-    sync_with_database(df, 'staging.Investment', research_fund_id, batch_id, loaded_at)
+    return sync_with_database(df, 'staging.Investment', batch_id, loaded_at)
 
-def sync_voucher_company_data(df, batch_id, loaded_at, interactive=True, similarity_threshold=0.8):
-    """Enhanced version with ID-based duplicate detection and updates."""
+def dedup_fetch_keys(df, table_name):
+    """The batch's values for the DEDUP_FETCH_KEYS columns of a table."""
+    return {col: df[col].dropna().unique().tolist() for col in DEDUP_FETCH_KEYS[table_name] if col in df.columns}
 
-    df = df.copy()
-    df['BatchID'] = batch_id
-    df['LoadedAt'] = loaded_at
+def load_existing_snapshot(table_name, keys=None, use_snapshot=False, full_refresh=False, blocked_df=None):
+    """
+    Read the existing records used for duplicate matching and release the connection right away.
 
+    With blocked_df, only the rows sharing a blocking key with its rows are read.
+    """
     conn = connect_to_db(False)
-    if conn:
-        try:
-            existing_df = get_existing_records_with_ids('staging.VoucherCompany', conn=conn)
-            
-            # Handle duplicates with ID storage  
-            insert_df, skip_df, update_df = handle_company_duplicates(
-                df, existing_df, interactive, similarity_threshold
-            )
-            
-            if not insert_df.empty:
-                print(f"[DEBUG] Preparing to insert {len(insert_df)} new VoucherCompany rows")
-                insert_new_records(insert_df, 'staging.VoucherCompany', conn)
-            
-            if not update_df.empty:
-                update_existing_records_by_id(update_df, 'staging.VoucherCompany', conn)  # Use ID-based updates
-            
-            logging.info(f"VoucherCompany - Inserted: {len(insert_df)}, "
-                        f"Skipped: {len(skip_df)}, Updated: {len(update_df)}")
-            
-            if not skip_df.empty:
-                logging.info("Skipped companies (potential duplicates):")
-                for _, company in skip_df.iterrows():
-                    logging.info(f"  - {company['CompanyName']}")
-                    
-        finally:
-            conn.close()
-            return insert_df, skip_df, update_df
-    else:
+    if not conn:
         logging.error("Could not connect to DB")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-    
-def sync_people_info_data(df, batch_id, loaded_at, interactive=True, similarity_threshold=0.8):
-    """Enhanced version with ID-based duplicate detection and updates."""
+        return None
 
-    df = df.copy()
-    df['BatchID'] = batch_id
-    df['LoadedAt'] = loaded_at
+    try:
+        if blocked_df is not None:
+            return get_blocking_candidates(table_name, blocked_df, conn)
+        return get_existing_records_with_ids(table_name, conn=conn, keys=keys,
+                                             use_snapshot=use_snapshot, full_refresh=full_refresh)
+    finally:
+        conn.close()
+
+def write_resolved_records(table_name, insert_df, update_df, audit_path=None):
+    """
+    Write the outcome of an offline dedup session in one short-lived connection.
+
+    Returns the inserted rows with their generated IDs in '_inserted_id'.
+    """
+    if insert_df.empty and update_df.empty:
+        return insert_df
+
+    # Dedup rebuilds these from row Series, which drops the dtypes
+    insert_df = apply_schema(insert_df, table_name)
+    update_df = apply_schema(update_df, table_name)
 
     conn = connect_to_db(False)
-    if conn:
-        try:
-            existing_df = get_existing_records_with_ids('staging.PeopleInfo', conn=conn)
-            
-            # Handle duplicates with ID storage
-            insert_df, skip_df, update_df = handle_person_duplicates(
-                df, existing_df, interactive, similarity_threshold
-            )
-            
-            if not insert_df.empty:
-                print(f"[DEBUG] Preparing to insert {len(insert_df)} new PeopleInfo rows")
-                insert_new_records(insert_df, 'staging.PeopleInfo', conn)
-            
-            if not update_df.empty:
-                update_existing_records_by_id(update_df, 'staging.PeopleInfo', conn)  # Use ID-based updates
-            
-            logging.info(f"PeopleInfo - Inserted: {len(insert_df)}, "
-                        f"Skipped: {len(skip_df)}, Updated: {len(update_df)}")
-            
-            if not skip_df.empty:
-                logging.info("Skipped people (potential duplicates):")
-                for _, person in skip_df.iterrows():
-                    full_name = f"{person.get('FirstName', '')} {person.get('LastName', '')}"
-                    logging.info(f"  - {full_name}")
-                    
-        finally:
-            conn.close()
-            return insert_df, skip_df, update_df
-    else:
+    if not conn:
         logging.error("Could not connect to DB")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
\ No newline at end of file
+        return insert_df
+
+    try:
+        if not insert_df.empty:
+            print(f"[DEBUG] Preparing to insert {len(insert_df)} new {table_name} rows")
+            insert_df = insert_new_records(insert_df, table_name, conn)
+
+        if not update_df.empty:
+            update_existing_records_by_id(update_df, table_name, conn, audit_path)  # Use ID-based updates
+    finally:
+        conn.close()
+
+    return apply_schema(insert_df, table_name)
+
+@traced()
+def sync_voucher_company_data(df, batch_id, loaded_at, interactive=True, similarity_threshold=0.8,
+                              policy=None, review_queue=None, audit=False,
+                              scoped_fetch=False, use_snapshot=False, full_refresh=False, blocked_fetch=False):
+    """
+    Enhanced version with ID-based duplicate detection and updates.
+
+    The connection is only held for the snapshot read and the final write, never while
+    the operator is resolving duplicates. With audit=True, before/after snapshots of
+    updated rows are written to the audit directory. With scoped_fetch=True, only existing
+    rows sharing a DEDUP_FETCH_KEYS value with the batch are read. With use_snapshot=True,
+    existing rows come from the local snapshot after an incremental refresh. With
+    blocked_fetch=True, only rows sharing a blocking key with the batch are read, in one query.
+    """
+
+    df = stamp_batch(df, 'staging.VoucherCompany', batch_id, loaded_at)
+    record_rows(len(df))
+
+    keys = dedup_fetch_keys(df, 'staging.VoucherCompany') if scoped_fetch else None
+    existing_df = load_existing_snapshot('staging.VoucherCompany', keys, use_snapshot, full_refresh,
+                                         df if blocked_fetch else None)
+    if existing_df is None:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    # Handle duplicates with ID storage (offline, no open connection)
+    with prompt_phase(interactive), profile_stage('dedup'):
+        insert_df, skip_df, update_df = handle_company_duplicates(
+            df, existing_df, interactive, similarity_threshold, policy, review_queue
+        )
+
+    audit_path = audit_file_path('staging.VoucherCompany', batch_id) if audit else None
+    insert_df = write_resolved_records('staging.VoucherCompany', insert_df, update_df, audit_path)
+
+    logging.info(f"VoucherCompany - Inserted: {len(insert_df)}, "
+                f"Skipped: {len(skip_df)}, Updated: {len(update_df)}")
+
+    if not skip_df.empty:
+        logging.info("Skipped companies (potential duplicates):")
+        for company_name in skip_df['CompanyName']:
+            logging.info(f"  - {company_name}")
+
+    return insert_df, skip_df, update_df
+    
+@traced()
+def sync_people_info_data(df, batch_id, loaded_at, interactive=True, similarity_threshold=0.8,
+                          policy=None, review_queue=None, audit=False,
+                          scoped_fetch=False, use_snapshot=False, full_refresh=False, blocked_fetch=False):
+    """
+    Enhanced version with ID-based duplicate detection and updates.
+
+    The connection is only held for the snapshot read and the final write, never while
+    the operator is resolving duplicates. With audit=True, before/after snapshots of
+    updated rows are written to the audit directory. With scoped_fetch=True, only existing
+    rows sharing a DEDUP_FETCH_KEYS value with the batch are read. With use_snapshot=True,
+    existing rows come from the local snapshot after an incremental refresh. With
+    blocked_fetch=True, only rows sharing a blocking key with the batch are read, in one query.
+    """
+
+    df = stamp_batch(df, 'staging.PeopleInfo', batch_id, loaded_at)
+    record_rows(len(df))
+
+    keys = dedup_fetch_keys(df, 'staging.PeopleInfo') if scoped_fetch else None
+    existing_df = load_existing_snapshot('staging.PeopleInfo', keys, use_snapshot, full_refresh,
+                                         df if blocked_fetch else None)
+    if existing_df is None:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    # Handle duplicates with ID storage (offline, no open connection)
+    with prompt_phase(interactive), profile_stage('dedup'):
+        insert_df, skip_df, update_df = handle_person_duplicates(
+            df, existing_df, interactive, similarity_threshold, policy, review_queue
+        )
+
+    audit_path = audit_file_path('staging.PeopleInfo', batch_id) if audit else None
+    insert_df = write_resolved_records('staging.PeopleInfo', insert_df, update_df, audit_path)
+
+    logging.info(f"PeopleInfo - Inserted: {len(insert_df)}, "
+                f"Skipped: {len(skip_df)}, Updated: {len(update_df)}")
+
+    if not skip_df.empty:
+        logging.info("Skipped people (potential duplicates):")
+        for first_name, last_name in zip(column_values(skip_df, 'FirstName', ''), column_values(skip_df, 'LastName', '')):
+            logging.info(f"  - {first_name} {last_name}")
+
+    return insert_df, skip_df, update_df
+
+def profiled_sync(sync):
+    with profile_stage('sync'):
+        return sync()
+
+def run_table_syncs(syncs, concurrent=True):
+    """
+    Run independent table syncs and return {stage name: result}.
+
+    syncs maps a stage name to a callable taking no arguments. With concurrent=True each runs
+    on its own thread, and so on its own pooled connection; interactive duplicate prompts still
+    take turns through prompt_phase. Otherwise they run one after another, each in its own
+    batch_stage, which batch_transaction() needs because its stages share one connection.
+    """
+    # One-time schema setup, committed on its own connection before any sync writes
+    prepare_pre_image_table()
+    if not concurrent:
+        results = {}
+        for name, sync in syncs.items():
+            with batch_stage(name):
+                results[name] = profiled_sync(sync)
+        return results
+
+    with ThreadPoolExecutor(max_workers=len(syncs), thread_name_prefix='table-sync') as executor:
+        futures = {name: executor.submit(profiled_sync, sync) for name, sync in syncs.items()}
+        return {name: future.result() for name, future in futures.items()}
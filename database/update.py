@@ -1,133 +1,186 @@
+from datetime import datetime
 import logging
+import os
 import pandas as pd
-from constants import TABLE_CONFIGS
+from constants import TABLE_CONFIGS, UPDATE_AUDIT_DIR
+from database.backend import is_local_backend, temp_table_name
+from database.blocking import with_blocking_keys, write_columns
+from database.insert import create_temp_table, load_temp_table
+from database.rollback import batch_id_of, capture_pre_images
+from database.utils import business_columns, row_hash_expression
 
 logging.basicConfig(level=logging.INFO)
 
-def update_existing_records(update_df, table_name, conn):
+UPDATE_SOURCE = 'update_source'
+
+def audit_file_path(table_name, batch_id, directory=UPDATE_AUDIT_DIR):
+    """Return the CSV path that audit mode writes before/after snapshots to for a table and batch."""
+    return os.path.join(directory, f"{table_name.replace('.', '_')}_{batch_id}.csv")
+
+def ranked_update_source():
+    """The update temp table with the last row per target ID ranked first."""
+    return f"""(
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY _update_target_id ORDER BY _RowNum DESC) AS _KeyRank
+            FROM {temp_table_name(UPDATE_SOURCE)}
+        )"""
+
+def generate_update_by_id_query(table_name, columns, id_column, audit=False):
     """
-    Enhanced update function that handles updates based on the _update_target field.
+    Generate one set-based UPDATE from the update temp table, optionally returning before/after rows.
+
+    Targets whose business columns already hash the same as the incoming row are not touched.
+    The local backend has no OUTPUT clause, so audit is ignored there (see select_audited_rows).
     """
-    if update_df.empty:
-        return
-        
-    config = TABLE_CONFIGS.get(table_name)
-    if not config:
-        logging.error(f"Unknown table: {table_name}")
-        return
-    
-    columns = config['columns']
-    unique_column = config['unique_column']
-    
-    with conn.cursor() as cursor:
-        for _, row in update_df.iterrows():
-            # Use _update_target to identify which record to update
-            target_value = row.get('_update_target')
-            if not target_value:
-                continue
-                
-            # Build the SET clause for all columns except the unique column
-            set_clauses = []
-            update_values = []
-            
-            for col in columns:
-                if col != unique_column:  # Don't update the unique identifier
-                    set_clauses.append(f"{col} = ?")
-                    value = row.get(col)
-                    update_values.append(None if pd.isna(value) else value)
-            
-            if not set_clauses:
-                continue
-                
-            set_clause = ', '.join(set_clauses)
-            update_query = f"UPDATE {table_name} SET {set_clause} WHERE {unique_column} = ?"
-            
-            try:
-                cursor.execute(update_query, update_values + [target_value])
-                print(f"✅ Updated {table_name} record: {target_value}")
-            except Exception as e:
-                logging.error(f"Error updating {table_name} record {target_value}: {e}")
-        
-        conn.commit()
+    hashed_columns = business_columns(table_name)
+    changed = f"{row_hash_expression('source', hashed_columns)} <> {row_hash_expression('target', hashed_columns)}"
+
+    # If several rows target the same ID, the last one in the batch wins
+    if is_local_backend():
+        set_clause = ', '.join(f"{col} = source.{col}" for col in columns)
+        return f"""
+            UPDATE {table_name} AS target
+            SET {set_clause}
+            FROM {ranked_update_source()} AS source
+            WHERE target.{id_column} = source._update_target_id AND source._KeyRank = 1 AND {changed};
+        """
 
-def update_existing_records_by_id(update_df, table_name, conn):
+    set_clause = ', '.join(f"target.{col} = source.{col}" for col in columns)
+    output_clause = "OUTPUT source._RowNum, DELETED.*, INSERTED.*" if audit else ""
+    return f"""
+        UPDATE target
+        SET {set_clause}
+        {output_clause}
+        FROM {table_name} AS target
+        JOIN {ranked_update_source()} AS source
+            ON target.{id_column} = source._update_target_id AND source._KeyRank = 1
+        WHERE {changed};
+    """
+
+def select_audited_rows(cursor, table_name, id_column, changed_only):
+    """Local backend stand-in for OUTPUT: the _RowNum and target row of every ID the update touches."""
+    hashed_columns = business_columns(table_name)
+    changed = f"AND {row_hash_expression('source', hashed_columns)} <> {row_hash_expression('target', hashed_columns)}"
+    cursor.execute(f"""
+        SELECT source._RowNum, target.*
+        FROM {ranked_update_source()} AS source
+        JOIN {table_name} AS target ON target.{id_column} = source._update_target_id
+        WHERE source._KeyRank = 1 {changed if changed_only else ''}
+        ORDER BY source._RowNum
+    """)
+    return cursor.fetchall(), [desc[0] for desc in cursor.description]
+
+def run_audited_local_update(cursor, table_name, columns, id_column):
+    """Run the update on the local backend and return its before/after rows shaped like the OUTPUT rows."""
+    before_rows, names = select_audited_rows(cursor, table_name, id_column, changed_only=True)
+    cursor.execute(generate_update_by_id_query(table_name, columns, id_column))
+    after_rows, _ = select_audited_rows(cursor, table_name, id_column, changed_only=False)
+    after_by_position = {row[0]: row[1:] for row in after_rows}
+    rows = [tuple(row) + tuple(after_by_position[row[0]]) for row in before_rows]
+    return rows, names + names[1:]
+
+def existing_update_targets(cursor, table_name, id_column):
+    """The distinct staged target IDs that exist in table_name."""
+    cursor.execute(f"""
+        SELECT DISTINCT source._update_target_id
+        FROM {temp_table_name(UPDATE_SOURCE)} AS source
+        JOIN {table_name} AS target ON target.{id_column} = source._update_target_id
+    """)
+    return {row[0] for row in cursor.fetchall()}
+
+def write_update_audit(rows, names, audit_path):
+    """Write the OUTPUT source._RowNum, DELETED.*, INSERTED.* rows of an audited update to a CSV file."""
+    # DELETED.* and INSERTED.* return the same column names, so label each half
+    half = (len(names) - 1) // 2
+    labels = ['_RowNum'] + [f"before_{name}" for name in names[1:1 + half]] + [f"after_{name}" for name in names[1 + half:]]
+
+    audit_df = pd.DataFrame.from_records([tuple(row) for row in rows], columns=labels)
+    audit_df.insert(0, 'AuditedAt', datetime.now())
+
+    os.makedirs(os.path.dirname(audit_path) or '.', exist_ok=True)
+    audit_df.to_csv(audit_path, mode='a', index=False, header=not os.path.exists(audit_path))
+    return len(audit_df)
+
+def update_existing_records_by_id(update_df, table_name, conn, audit_path=None):
     """
     Update records using their primary key IDs instead of names/emails.
+
+    All updates for the table are bulk loaded into a temp table and applied with one
+    set-based UPDATE in a single transaction. Pass audit_path to capture before/after
+    rows with OUTPUT DELETED.* / INSERTED.* and append them to that CSV file.
+
+    Returns the rows that were applied: staged, and targeting an ID that exists. Rows whose
+    target already held the same values count as applied. On failure nothing is returned.
     """
     if update_df.empty:
-        return
+        return update_df
         
     config = TABLE_CONFIGS.get(table_name)
     if not config:
         logging.error(f"Unknown table: {table_name}")
-        return
-    
-    columns = config['columns']
+        return update_df.iloc[0:0]
     
     # Determine ID column and table specifics
-    if table_name == 'staging.VoucherCompany':
-        id_column = 'CompanyID'
-    elif table_name == 'staging.PeopleInfo':
-        id_column = 'PersonID'
-    else:
+    id_column = config.get('id_column')
+    if not id_column:
         logging.error(f"ID-based updates not supported for table: {table_name}")
-        return
-    
+        return update_df.iloc[0:0]
+
+    has_target = update_df['_update_target_id'].notna() if '_update_target_id' in update_df.columns \
+        else pd.Series(False, index=update_df.index)
+    if not has_target.all():
+        print(f"⚠️  No target ID found for {(~has_target).sum()} update record(s)")
+    update_df = with_blocking_keys(update_df[has_target], table_name)
+    if update_df.empty:
+        return update_df
+
+    source = temp_table_name(UPDATE_SOURCE)
     with conn.cursor() as cursor:
-        for _, row in update_df.iterrows():
-            # Get the target ID
-            target_id = row.get('_update_target_id')
-            
-            if not target_id:
-                print(f"⚠️  No target ID found for update record")
-                continue
-            
-            print(f"\n=== DEBUG: Updating {table_name} record by ID ===")
-            print(f"Target ID: {target_id}")
-            
-            # Show BEFORE state
-            cursor.execute(f"SELECT * FROM {table_name} WHERE {id_column} = ?", (target_id,))
-            before_record = cursor.fetchone()
-            print(f"BEFORE: {before_record}")
-            
-            # Build the SET clause for all columns
-            set_clauses = []
-            update_values = []
-            
-            print("Fields being updated:")
-            for col in columns:
-                set_clauses.append(f"{col} = ?")
-                value = row.get(col)
-                clean_value = None if pd.isna(value) else value
-                update_values.append(clean_value)
-                print(f"  {col}: {clean_value}")
-            
-            if not set_clauses:
-                continue
-                
-            set_clause = ', '.join(set_clauses)
-            update_query = f"UPDATE {table_name} SET {set_clause} WHERE {id_column} = ?"
-            query_values = update_values + [target_id]
-            
-            print(f"SQL Query: {update_query}")
-            print(f"Query Values: {query_values}")
-            
-            try:
-                cursor.execute(update_query, query_values)
-                affected_rows = cursor.rowcount
-                
-                # Show AFTER state
-                cursor.execute(f"SELECT * FROM {table_name} WHERE {id_column} = ?", (target_id,))
-                after_record = cursor.fetchone()
-                print(f"AFTER: {after_record}")
-                
-                if affected_rows > 0:
-                    print(f"✅ Updated {table_name} record ID {target_id} ({affected_rows} row(s))")
+        try:
+            columns = write_columns(cursor, table_name)
+            create_temp_table(cursor, table_name, source, columns, {
+                '_RowNum': 'CAST(NULL AS INT)',
+                '_update_target_id': 'CAST(NULL AS BIGINT)',
+            })
+            failed = load_temp_table(cursor, source, update_df, ['_update_target_id'] + columns)
+            for _, values, e in failed:
+                logging.error(f"Error staging update for {table_name} record ID {values[1]}: {e}")
+
+            found_targets = existing_update_targets(cursor, table_name, id_column)
+            matched_targets = len(found_targets)
+
+            batch_id = batch_id_of(update_df)
+            if batch_id is not None:
+                hashed_columns = business_columns(table_name)
+                capture_pre_images(cursor, batch_id, table_name, id_column, f"""
+                    FROM {table_name} AS target
+                    JOIN {source} AS source ON target.{id_column} = source._update_target_id
+                    WHERE {row_hash_expression('source', hashed_columns)} <> {row_hash_expression('target', hashed_columns)}
+                """)
+            if audit_path and is_local_backend():
+                audit_rows, audit_names = run_audited_local_update(cursor, table_name, columns, id_column)
+                affected_rows = write_update_audit(audit_rows, audit_names, audit_path)
+            else:
+                cursor.execute(generate_update_by_id_query(table_name, columns, id_column, audit=bool(audit_path)))
+                if audit_path:
+                    affected_rows = write_update_audit(cursor.fetchall(), [desc[0] for desc in cursor.description], audit_path)
                 else:
-                    print(f"⚠️  No rows updated for {table_name} ID {target_id}")
-            except Exception as e:
-                logging.error(f"Error updating {table_name} record ID {target_id}: {e}")
-                print(f"Error details: {e}")
-        
-        print(f"\n=== Committing changes to {table_name} ===")
-        conn.commit()
\ No newline at end of file
+                    affected_rows = cursor.rowcount
+
+            cursor.execute(f"DROP TABLE IF EXISTS {source}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"Error updating {table_name} records by ID, batch rolled back: {e}")
+            return update_df.iloc[0:0]
+
+    unchanged = matched_targets - affected_rows
+    missing = len(update_df) - len(failed) - matched_targets
+    print(f"✅ Updated {table_name} by ID - Changed: {affected_rows}, Unchanged: {unchanged}"
+          + (f", {missing} target ID(s) not found or repeated" if missing > 0 else ""))
+    if audit_path:
+        print(f"📝 Before/after snapshots written to {audit_path}")
+
+    failed_positions = {position for position, _, _ in failed}
+    applied = [position not in failed_positions and int(target_id) in found_targets
+               for position, target_id in enumerate(update_df['_update_target_id'])]
+    return update_df[applied]
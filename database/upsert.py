@@ -0,0 +1,150 @@
+from constants import INSERT_CHUNK_SIZE, TABLE_CONFIGS
+from database.backend import is_local_backend, temp_table_name
+from database.insert import create_temp_table, load_temp_table
+from database.rollback import batch_id_of, capture_pre_images, record_inserted_keys
+from database.utils import business_columns, row_hash_expression
+import logging
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+UPSERT_SOURCE = 'upsert_source'
+
+def generate_merge_query(table_name, columns, unique_column):
+    """
+    Generate a MERGE from the upsert temp table that reports the action taken for every source row.
+
+    Matched rows are only updated when the hash of their business columns differs, so rows
+    that only carry a new BatchID/LoadedAt are left alone.
+    """
+    update_columns = [col for col in columns if col != unique_column]
+    set_clause = ', '.join(f"target.{col} = source.{col}" for col in update_columns)
+    column_names = ', '.join(columns)
+    source_values = ', '.join(f"source.{col}" for col in columns)
+    hashed_columns = business_columns(table_name)
+
+    # Last occurrence of a key in the batch wins; MERGE may not touch a target row twice
+    return f"""
+        MERGE {table_name} AS target
+        USING (
+            SELECT ranked.*,
+                CASE WHEN existing.{unique_column} IS NULL
+                    OR {row_hash_expression('ranked', hashed_columns)} <> {row_hash_expression('existing', hashed_columns)}
+                THEN 1 ELSE 0 END AS _Changed
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY {unique_column} ORDER BY _RowNum DESC) AS _KeyRank
+                FROM {temp_table_name(UPSERT_SOURCE)}
+            ) AS ranked
+            LEFT JOIN {table_name} AS existing ON existing.{unique_column} = ranked.{unique_column}
+            WHERE ranked._KeyRank = 1
+        ) AS source
+        ON target.{unique_column} = source.{unique_column}
+        WHEN MATCHED AND source._Changed = 1 THEN
+            UPDATE SET {set_clause}
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT ({column_names}) VALUES ({source_values})
+        OUTPUT $action, source._RowNum;
+    """
+
+def upsert_without_merge(cursor, table_name, columns, unique_column):
+    """
+    Local backend version of the MERGE: classify the source rows, then UPDATE and INSERT separately.
+
+    Returns (action, _RowNum) pairs for the rows written, like the MERGE OUTPUT.
+    """
+    update_columns = [col for col in columns if col != unique_column]
+    set_clause = ', '.join(f"{col} = source.{col}" for col in update_columns)
+    column_names = ', '.join(columns)
+    hashed_columns = business_columns(table_name)
+    changed = f"{row_hash_expression('source', hashed_columns)} <> {row_hash_expression('target', hashed_columns)}"
+    ranked = f"""(
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY {unique_column} COLLATE NOCASE ORDER BY _RowNum DESC) AS _KeyRank
+        FROM {temp_table_name(UPSERT_SOURCE)}
+    )"""
+
+    cursor.execute(f"""
+        SELECT CASE WHEN target.{unique_column} IS NULL THEN 'INSERT' ELSE 'UPDATE' END, source._RowNum
+        FROM {ranked} AS source
+        LEFT JOIN {table_name} AS target ON target.{unique_column} = source.{unique_column}
+        WHERE source._KeyRank = 1 AND (target.{unique_column} IS NULL OR {changed})
+    """)
+    outcomes = cursor.fetchall()
+
+    cursor.execute(f"""
+        UPDATE {table_name} AS target
+        SET {set_clause}
+        FROM {ranked} AS source
+        WHERE target.{unique_column} = source.{unique_column} AND source._KeyRank = 1 AND {changed}
+    """)
+    cursor.execute(f"""
+        INSERT INTO {table_name} ({column_names})
+        SELECT {column_names} FROM {ranked} AS source
+        WHERE source._KeyRank = 1
+            AND NOT EXISTS (SELECT 1 FROM {table_name} AS target WHERE target.{unique_column} = source.{unique_column})
+    """)
+    return outcomes
+
+def mark_duplicate_keys(df, unique_column):
+    """Flag every row whose key appears again later in the batch, case-insensitively like the database."""
+    keys = df[unique_column]
+    if keys.dtype == object or pd.api.types.is_string_dtype(keys):
+        keys = keys.str.lower()
+    return keys.duplicated(keep='last').tolist()
+
+def upsert_records(df, table_name, conn, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Insert or update df in table_name with one set-based MERGE keyed on the table's unique column.
+
+    The batch is bulk loaded into a session temp table first. Returns a DataFrame indexed like df
+    with the unique column and an '_action' of INSERT, UPDATE, UNCHANGED (content hash matched the
+    existing row, nothing written), DUPLICATE (a later row in the batch had the same key) or
+    FAILED (the row could not be loaded).
+    """
+    config = TABLE_CONFIGS.get(table_name)
+    if not config:
+        logging.error(f"Unknown table: {table_name}")
+        return pd.DataFrame()
+
+    columns = config['columns']
+    unique_column = config['unique_column']
+    actions = ['DUPLICATE' if duplicate else 'UNCHANGED' for duplicate in mark_duplicate_keys(df, unique_column)]
+
+    source = temp_table_name(UPSERT_SOURCE)
+    with conn.cursor() as cursor:
+        try:
+            create_temp_table(cursor, table_name, source, columns, {'_RowNum': 'CAST(NULL AS INT)'})
+            failed = load_temp_table(cursor, source, df, columns, chunk_size)
+            for position, values, e in failed:
+                print(f"❌ Could not stage row for {table_name}: {e}\nValues: {values}")
+                actions[position] = 'FAILED'
+
+            batch_id = batch_id_of(df)
+            if batch_id is not None:
+                hashed_columns = business_columns(table_name)
+                capture_pre_images(cursor, batch_id, table_name, unique_column, f"""
+                    FROM {table_name} AS target
+                    JOIN {source} AS source ON target.{unique_column} = source.{unique_column}
+                    WHERE {row_hash_expression('source', hashed_columns)} <> {row_hash_expression('target', hashed_columns)}
+                """)
+
+            if is_local_backend():
+                written = upsert_without_merge(cursor, table_name, columns, unique_column)
+            else:
+                cursor.execute(generate_merge_query(table_name, columns, unique_column))
+                written = cursor.fetchall()
+            for action, position in written:
+                actions[position] = action
+
+            if batch_id is not None:
+                inserted_keys = [key for key, action in zip(df[unique_column], actions) if action == 'INSERT']
+                record_inserted_keys(cursor, batch_id, table_name, unique_column, inserted_keys)
+
+            cursor.execute(f"DROP TABLE IF EXISTS {source}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"Upsert into {table_name} failed, batch rolled back: {e}")
+            actions = ['FAILED'] * len(df)
+
+    outcomes = pd.DataFrame({unique_column: df[unique_column].values, '_action': actions}, index=df.index)
+    return outcomes
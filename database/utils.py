@@ -1,3 +1,5 @@
+from constants import BLOCKING_KEY_COLUMNS, LOAD_METADATA_COLUMNS, TABLE_CONFIGS
+from database.backend import is_local_backend
 import re
 
 def extract_operating_name(company_name):
@@ -17,4 +19,23 @@ def extract_operating_name(company_name):
         if match:
             return match.group(1).strip()
     
-    return company_name
\ No newline at end of file
+    return company_name
+
+def business_columns(table_name):
+    """Columns of a table config that carry content, i.e. everything except load metadata and derived match keys."""
+    return [col for col in TABLE_CONFIGS[table_name]['columns']
+            if col not in LOAD_METADATA_COLUMNS and col not in BLOCKING_KEY_COLUMNS]
+
+def row_hash_expression(alias, columns):
+    """
+    T-SQL expression that hashes the given columns of a row.
+
+    FOR JSON with INCLUDE_NULL_VALUES keeps NULLs and column positions distinct, unlike plain
+    concatenation, and renders both sides identically as long as the column types match.
+    The local backend uses the equivalent row_hash() function registered on its connections.
+    """
+    if is_local_backend():
+        return f"row_hash({', '.join(f'{alias}.{col}' for col in columns)})"
+    select_list = ', '.join(f"{alias}.{col} AS {col}" for col in columns)
+    return (f"HASHBYTES('SHA2_256', (SELECT {select_list} "
+            f"FOR JSON PATH, WITHOUT_ARRAY_WRAPPER, INCLUDE_NULL_VALUES))")
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from constants import RUN_REPORT_DIR
+import json
+import logging
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+# Totals per span name and per counter for the current run, shared by every thread
+_spans = {}
+_counters = {}
+_lock = threading.Lock()
+# Each thread's open spans, innermost last, so human wait and rows land on the right spans
+_local = threading.local()
+_run = {'started_at': datetime.now(), 'started': time.perf_counter(), 'human_seconds': 0.0}
+# (on_start, on_end) callables run around every human wait on the waiting thread, e.g. to pause a profiler
+_wait_hooks = []
+
+def open_spans():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def reset():
+    """Forget everything recorded so far and start timing a new run."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _run.update(started_at=datetime.now(), started=time.perf_counter(), human_seconds=0.0)
+
+@contextmanager
+def span(name):
+    """
+    Time a block under name. Calls, wall time, human wait inside the block, rows and bytes
+    add up across every block with the same name, on any thread.
+    """
+    frame = {'human_seconds': 0.0, 'rows': 0, 'bytes': 0}
+    stack = open_spans()
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield frame
+    finally:
+        seconds = time.perf_counter() - started
+        stack.pop()
+        with _lock:
+            totals = _spans.setdefault(name, {'calls': 0, 'seconds': 0.0, 'human_seconds': 0.0, 'rows': 0, 'bytes': 0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals['human_seconds'] += frame['human_seconds']
+            totals['rows'] += frame['rows']
+            totals['bytes'] += frame['bytes']
+
+def traced(name=None):
+    """Decorator running every call of a function inside span(name), the function's name by default."""
+    def decorate(function):
+        span_name = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record_rows(rows):
+    """Credit rows to the innermost open span, for its rows per second."""
+    stack = open_spans()
+    if stack:
+        stack[-1]['rows'] += rows
+
+def record_bytes(nbytes):
+    """Credit bytes transferred to every open span on this thread."""
+    for frame in open_spans():
+        frame['bytes'] += nbytes
+
+def count(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+@contextmanager
+def human_wait(charge_run=True):
+    """
+    Mark a block spent waiting on the operator (a prompt or a key press).
+
+    The time is charged to every open span on this thread as human time, so reports can show
+    machine time without it. Pass charge_run=False for waits that overlap a prompt on another
+    thread, so the run total doesn't count the same seconds twice.
+    """
+    for on_start, _ in _wait_hooks:
+        on_start()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        for _, on_end in _wait_hooks:
+            on_end()
+        for frame in open_spans():
+            frame['human_seconds'] += seconds
+        if charge_run:
+            with _lock:
+                _run['human_seconds'] += seconds
+
+def add_wait_hooks(on_start, on_end):
+    _wait_hooks.append((on_start, on_end))
+
+def remove_wait_hooks(on_start, on_end):
+    _wait_hooks.remove((on_start, on_end))
+
+def ask(prompt):
+    """input() that is reported as human wait."""
+    with human_wait():
+        return input(prompt)
+
+def span_report(totals):
+    machine_seconds = max(totals['seconds'] - totals['human_seconds'], 0.0)
+    report = {
+        'calls': totals['calls'],
+        'wall_seconds': round(totals['seconds'], 4),
+        'human_seconds': round(totals['human_seconds'], 4),
+        'machine_seconds': round(machine_seconds, 4),
+    }
+    if totals['rows']:
+        report['rows'] = totals['rows']
+        report['rows_per_second'] = round(totals['rows'] / machine_seconds, 1) if machine_seconds else None
+    if totals['bytes']:
+        report['bytes'] = totals['bytes']
+    return report
+
+def run_report(batch_id):
+    """The run so far as a dict: overall wall, human and machine time, then every span and counter."""
+    with _lock:
+        wall_seconds = time.perf_counter() - _run['started']
+        return {
+            'batch_id': str(batch_id),
+            'started_at': _run['started_at'].isoformat(),
+            'wall_seconds': round(wall_seconds, 4),
+            'human_seconds': round(_run['human_seconds'], 4),
+            'machine_seconds': round(wall_seconds - _run['human_seconds'], 4),
+            'spans': {name: span_report(totals) for name, totals in sorted(_spans.items())},
+            'counters': dict(sorted(_counters.items())),
+        }
+
+def write_run_report(batch_id, directory=RUN_REPORT_DIR):
+    """Write the run report for a batch to run_<batch_id>.json and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"run_{batch_id}.json")
+    with open(path, 'w') as file:
+        json.dump(run_report(batch_id), file, indent=4)
+    logging.info(f"Wrote run report to {path}")
+    return path
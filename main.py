@@ -1,44 +1,114 @@
+from api.backfill import extract_backfill
+from api.extract_snapshot import read_extract_snapshot, write_extract_snapshot
 from api.joins import process_join_tables
-from api.program import filter_program_applications, get_program_ID, get_program_applications, process_program_applications
+from api.program import combine_extracts, extract_programs, get_program_ID, get_program_applications
 from api.utils import print_intro, choose_fiscal_year, remove_duplicates
-from database.connection import backup_db
-from database.sync import sync_investment_data, sync_people_info_data, sync_voucher_company_data
+from constants import BACKFILL_WORKERS, DEDUP_POLICY, PROGRAM_CONFIGS, years
+from database.blocking import BLOCKING_TABLES, add_blocking_columns, backfill_blocking_keys
+from database.connection import backup_db, batch_stage, batch_transaction, close_pool, connect_to_db, use_backend
+from database.review import apply_review_decisions, write_review_queue
+from database.rollback import rollback_batch
+from database.schema import memory_report
+from database.sync import run_table_syncs, sync_investment_data, sync_people_info_data, sync_voucher_company_data
 from datetime import datetime
+from instrumentation import reset, span, write_run_report
+from profiling import profile_stage, start_profiling, stop_profiling
+import argparse
 import uuid
 import logging
 logging.getLogger('azure.core.pipeline.policies.http_logging_policy').setLevel(logging.WARNING)
 
 
 
-def main():
-    batch_id = uuid.uuid4()
-    loaded_at = datetime.now()
-
-    print_intro()
-    fiscal_year = choose_fiscal_year()
-    program_name = 'Innovation Voucher Fund'
-    ivf_program_id = get_program_ID(program_name)
-    responses = get_program_applications(ivf_program_id)
-    applications = filter_program_applications(responses, fiscal_year)
-    investment_df, people_info_df, voucher_company_df = process_program_applications(applications)
-    
-    # Remove duplicates within the current batch first
-    investment_df = remove_duplicates(investment_df)
-    people_info_df = remove_duplicates(people_info_df)
-    voucher_company_df = remove_duplicates(voucher_company_df)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load SMApply applications into the staging database.")
+    parser.add_argument('--unattended', action='store_true',
+                        help="Resolve duplicates with DEDUP_POLICY and write uncertain matches to a review queue")
+    parser.add_argument('--fiscal-year', help="Fiscal year to load instead of choosing it interactively")
+    parser.add_argument('--program', action='append', choices=sorted(PROGRAM_CONFIGS),
+                        help="Program to extract (repeat to load several programs in one batch; default IVF)")
+    parser.add_argument('--audit', action='store_true',
+                        help="Write before/after snapshots of updated people and companies to the audit directory")
+    parser.add_argument('--scoped-fetch', action='store_true',
+                        help="Only read existing people/companies that share an email, last name, name or city with the batch")
+    parser.add_argument('--blocked-fetch', action='store_true',
+                        help="Only read existing people/companies sharing a name prefix, Soundex code, trigram "
+                             "signature or email with the batch, in one query per table (instead of --scoped-fetch or --snapshot; "
+                             "needs --build-blocking-keys to have run once)")
+    parser.add_argument('--build-blocking-keys', action='store_true',
+                        help="Add the match key columns and indexes to people and companies if missing, fill in "
+                             "the keys of rows that lack them or whose name changed since, and exit")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="Match duplicates against the local snapshot, refreshed incrementally from LoadedAt")
+    parser.add_argument('--snapshot-full-refresh', action='store_true',
+                        help="Rebuild the local snapshot from scratch before matching (implies --snapshot)")
+    parser.add_argument('--atomic', action='store_true',
+                        help="Load the whole batch in one transaction with a savepoint per stage; roll back on any failure")
+    parser.add_argument('--rollback-batch', metavar='BATCH_ID',
+                        help="Undo everything a previous batch loaded, using the pre-images captured during its sync, and exit")
+    parser.add_argument('--apply-review', metavar='PATH',
+                        help="Apply the reviewed decisions in a review queue file and exit")
+    parser.add_argument('--backfill', nargs='*', metavar='FISCAL_YEAR',
+                        help="Load several fiscal years as one batch (all known years if none are given), "
+                             "extracting them in parallel worker processes")
+    parser.add_argument('--backfill-workers', type=int, default=BACKFILL_WORKERS,
+                        help=f"Worker processes for --backfill (default {BACKFILL_WORKERS})")
+    parser.add_argument('--memory-report', action='store_true',
+                        help="Print the batch DataFrames' memory with compact dtypes against all-object columns")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="Profile the extract, normalize, dedup, sync and join stages into DIR: .pstats, "
+                             "top allocation sites and collapsed stacks per stage, without operator wait time "
+                             "(backfill worker processes are not profiled)")
+    parser.add_argument('--replay', metavar='BATCH_ID_OR_DIR',
+                        help="Skip extraction and load a previous batch's extract snapshot again, as a new batch")
+    parser.add_argument('--no-extract-snapshot', action='store_true',
+                        help="Don't save the extracted DataFrames and raw payloads under the extracts directory")
+    parser.add_argument('--local-db', metavar='PATH',
+                        help="Load into a local SQLite database with the staging schema instead of Azure SQL")
+    args = parser.parse_args()
+    args.program = args.program or ['IVF']
+    return args
 
-    # Backup database
-    #backup_db()
+def load_batch(investment_df, people_info_df, voucher_company_df, batch_id, loaded_at, args, review_queue):
+    """Sync the three batch DataFrames, concurrently unless run atomically, then link them."""
+    interactive = not args.unattended
+    policy = DEDUP_POLICY if args.unattended else None
 
-    sync_investment_data(investment_df, 'IVF', batch_id, loaded_at)
-
-    people_insert_df, people_skip_df, people_update_df = sync_people_info_data(
-        people_info_df, 
-        batch_id,
-        loaded_at,
-        interactive=True,
-        similarity_threshold=0.75
-    )
+    # The three tables don't depend on each other; only the link stage needs all of them.
+    # A batch transaction shares one connection, so atomic runs sync them one at a time.
+    results = run_table_syncs({
+        'investment_sync': lambda: sync_investment_data(investment_df, batch_id, loaded_at),
+        'people_sync': lambda: sync_people_info_data(
+            people_info_df, 
+            batch_id,
+            loaded_at,
+            interactive=interactive,
+            similarity_threshold=0.75,
+            policy=policy,
+            review_queue=review_queue,
+            audit=args.audit,
+            scoped_fetch=args.scoped_fetch,
+            use_snapshot=args.snapshot or args.snapshot_full_refresh,
+            full_refresh=args.snapshot_full_refresh,
+            blocked_fetch=args.blocked_fetch
+        ),
+        'company_sync': lambda: sync_voucher_company_data(
+            voucher_company_df, 
+            batch_id,
+            loaded_at,
+            interactive=interactive,
+            similarity_threshold=0.75,
+            policy=policy,
+            review_queue=review_queue,
+            audit=args.audit,
+            scoped_fetch=args.scoped_fetch,
+            use_snapshot=args.snapshot or args.snapshot_full_refresh,
+            full_refresh=args.snapshot_full_refresh,
+            blocked_fetch=args.blocked_fetch
+        ),
+    }, concurrent=not args.atomic)
+    people_insert_df, people_skip_df, people_update_df = results['people_sync']
+    company_insert_df, company_skip_df, company_update_df = results['company_sync']
 
     print("\n=== DEBUG: People Update DataFrame ===")
     if not people_update_df.empty:
@@ -51,14 +121,6 @@ def main():
     else:
         print("No people updates")
 
-    company_insert_df, company_skip_df, company_update_df = sync_voucher_company_data(
-        voucher_company_df, 
-        batch_id,
-        loaded_at,
-        interactive=True,
-        similarity_threshold=0.75
-    )
-
     print("\n=== DEBUG: Company Update DataFrame ===")
     if not company_update_df.empty:
         debug_columns = ['CompanyName', 'Address']
@@ -70,12 +132,114 @@ def main():
     else:
         print("No company updates")
 
-    process_join_tables(
-        investment_df, 
-        people_insert_df, people_skip_df, people_update_df, 
-        company_insert_df, company_skip_df, company_update_df,
-        batch_id, loaded_at
-    )
+    with batch_stage('join_tables'), profile_stage('join'):
+        process_join_tables(
+            investment_df, 
+            people_insert_df, people_skip_df, people_update_df, 
+            company_insert_df, company_skip_df, company_update_df,
+            batch_id, loaded_at
+        )
+
+def extract(args, batch_id):
+    """Extract the batch from SMApply and, unless turned off, save it for --replay."""
+    programs = [PROGRAM_CONFIGS[key] for key in args.program]
+    fiscal_years = (args.backfill or years) if args.backfill is not None else [args.fiscal_year or choose_fiscal_year()]
+    payloads = []
+    with span('extract'), profile_stage('extract'):
+        if args.backfill is not None:
+            # Years run in parallel worker processes; programs one after another
+            extracts = []
+            for program in programs:
+                responses = get_program_applications(get_program_ID(program['name']))
+                extracts.append(extract_backfill(responses, fiscal_years, program, args.backfill_workers, payloads))
+            investment_df, people_info_df, voucher_company_df = combine_extracts(extracts)
+        else:
+            investment_df, people_info_df, voucher_company_df = extract_programs(programs, fiscal_years[0], payloads)
+
+    if not args.no_extract_snapshot:
+        path = write_extract_snapshot(batch_id, investment_df, people_info_df, voucher_company_df, payloads,
+                                      args.program, fiscal_years)
+        print(f"💾 Extract saved to {path} (load it again with: python main.py --replay {batch_id})")
+    return investment_df, people_info_df, voucher_company_df
+
+def build_blocking_keys():
+    conn = connect_to_db(False)
+    if not conn:
+        logging.error("Could not connect to DB")
+        return
+    try:
+        add_blocking_columns(conn)
+        for table_name in BLOCKING_TABLES:
+            written = backfill_blocking_keys(table_name, conn)
+            print(f"🔑 {table_name}: wrote match keys for {written} missing or stale row(s)")
+    finally:
+        conn.close()
+        close_pool()
+
+def main():
+    args = parse_args()
+    if args.local_db:
+        use_backend('sqlite', args.local_db)
+    if args.rollback_batch:
+        rollback_batch(args.rollback_batch)
+        return
+    if args.apply_review:
+        apply_review_decisions(args.apply_review)
+        return
+    if args.build_blocking_keys:
+        build_blocking_keys()
+        return
+
+    batch_id = uuid.uuid4()
+    loaded_at = datetime.now()
+    review_queue = []
+    reset()
+    if args.profile:
+        start_profiling(args.profile)
+
+    print_intro()
+    print(f"Batch ID: {batch_id} (undo with: python main.py --rollback-batch {batch_id})")
+    if args.replay:
+        with span('extract'):
+            manifest, investment_df, people_info_df, voucher_company_df = read_extract_snapshot(args.replay)
+        args.program = manifest['programs']
+        print(f"🔁 Replaying extract of batch {manifest['batch_id']} ({manifest['created_at']}): "
+              f"{manifest['rows']['investment']} investment(s) for {', '.join(manifest['programs'])}")
+    else:
+        investment_df, people_info_df, voucher_company_df = extract(args, batch_id)
+    
+    # Remove duplicates within the current batch first
+    with profile_stage('normalize'):
+        investment_df = remove_duplicates(investment_df)
+        people_info_df = remove_duplicates(people_info_df)
+        voucher_company_df = remove_duplicates(voucher_company_df)
+
+    if args.memory_report:
+        memory_report({'Investment': investment_df, 'PeopleInfo': people_info_df, 'VoucherCompany': voucher_company_df})
+
+    # Full database backup; rows touched by this batch can also be undone with --rollback-batch
+    #backup_db()
+
+    if args.atomic and not args.unattended:
+        logging.warning("--atomic keeps one transaction open while duplicates are resolved; "
+                        "combine it with --unattended to keep the transaction short")
+
+    try:
+        with span('load'):
+            if args.atomic:
+                with batch_transaction():
+                    load_batch(investment_df, people_info_df, voucher_company_df, batch_id, loaded_at, args, review_queue)
+            else:
+                load_batch(investment_df, people_info_df, voucher_company_df, batch_id, loaded_at, args, review_queue)
+    finally:
+        close_pool()
+        write_run_report(batch_id)
+        stop_profiling()
+
+    review_path = write_review_queue(review_queue, batch_id, loaded_at, investment_df)
+    if review_path:
+        print(f"\n📝 {len(review_queue)} record(s) need review. Fill in 'decision' in {review_path} "
+              f"and run: python main.py --apply-review {review_path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
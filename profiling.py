@@ -0,0 +1,179 @@
+from collections import Counter
+from contextlib import contextmanager
+from constants import PROFILE_SAMPLE_INTERVAL, PROFILE_TOP_N
+from instrumentation import add_wait_hooks, remove_wait_hooks
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+
+logging.basicConfig(level=logging.INFO)
+
+# The active StageProfiler while --profile is on; profile_stage() does nothing otherwise
+_profiler = None
+
+class StageProfiler:
+    """
+    Profile named pipeline stages with cProfile, tracemalloc and a stack sampler.
+
+    cProfile only sees the thread that enabled it, so each thread entering a stage gets its own
+    profile, and a stage entered inside another pauses the outer one; profiles of the same stage
+    are merged when written. A sampler thread records the stacks of threads inside a stage for
+    the collapsed-stack file. Human waits pause both. Allocations are the growth between entering
+    and leaving a stage, so stages running at the same time on other threads blur into each other.
+    """
+
+    def __init__(self, directory, top_n=PROFILE_TOP_N, interval=PROFILE_SAMPLE_INTERVAL):
+        self.directory = directory
+        self.top_n = top_n
+        self.interval = interval
+        self.profiles = {}
+        self.allocations = {}
+        self.samples = {}
+        # Thread id -> stage currently sampled on that thread (absent while paused)
+        self.active = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, name='profile-sampler', daemon=True)
+
+    def enable(self, profile):
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; a stage overlapping one on
+            # another thread then only gets stack samples and allocations
+            pass
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def start(self):
+        tracemalloc.start()
+        add_wait_hooks(self.pause, self.resume)
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+        remove_wait_hooks(self.pause, self.resume)
+        tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name):
+        stack = self.stack()
+        if stack:
+            stack[-1][1].disable()
+            self.active.pop(threading.get_ident(), None)
+        snapshot = self.snapshot()
+        self.active[threading.get_ident()] = name
+        profile = cProfile.Profile()
+        stack.append((name, profile))
+        self.enable(profile)
+        try:
+            yield
+        finally:
+            profile.disable()
+            stack.pop()
+            self.active.pop(threading.get_ident(), None)
+            self.record(name, profile, self.snapshot().compare_to(snapshot, 'lineno'))
+            if stack:
+                self.active[threading.get_ident()] = stack[-1][0]
+                self.enable(stack[-1][1])
+
+    def snapshot(self):
+        """Current allocations, leaving out the profiler's own (including other threads' snapshots)."""
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    def record(self, name, profile, allocation_diffs):
+        with self.lock:
+            self.profiles.setdefault(name, []).append(profile)
+            sites = self.allocations.setdefault(name, Counter())
+            for diff in allocation_diffs:
+                if diff.size_diff > 0:
+                    sites[str(diff.traceback[0])] += diff.size_diff
+
+    def pause(self):
+        stack = self.stack()
+        if stack:
+            stack[-1][1].disable()
+            self.active.pop(threading.get_ident(), None)
+
+    def resume(self):
+        stack = self.stack()
+        if stack:
+            self.active[threading.get_ident()] = stack[-1][0]
+            self.enable(stack[-1][1])
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, name in list(self.active.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                calls = []
+                while frame is not None:
+                    code = frame.f_code
+                    calls.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                with self.lock:
+                    self.samples.setdefault(name, Counter())[';'.join(reversed(calls))] += 1
+
+    def write(self):
+        """Write <stage>.pstats, <stage>.allocations.txt and <stage>.collapsed for every stage."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, profiles in self.profiles.items():
+            base = os.path.join(self.directory, name)
+            # A profile that never got the hook has no stats and can't be loaded
+            profiles = [profile for profile in profiles if profile.getstats()]
+            if profiles:
+                stats = pstats.Stats(profiles[0])
+                for profile in profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(f"{base}.pstats")
+
+            with open(f"{base}.allocations.txt", 'w') as file:
+                file.write(f"Top {self.top_n} allocation sites in {name} (growth while the stage ran)\n")
+                for site, size in self.allocations[name].most_common(self.top_n):
+                    file.write(f"{size / 1024:12.1f} KiB  {site}\n")
+
+            with open(f"{base}.collapsed", 'w') as file:
+                for stack, hits in sorted(self.samples.get(name, {}).items()):
+                    file.write(f"{stack} {hits}\n")
+        return sorted(self.profiles)
+
+def start_profiling(directory):
+    """Start profiling stages marked with profile_stage() until stop_profiling()."""
+    global _profiler
+    _profiler = StageProfiler(directory)
+    _profiler.start()
+
+def stop_profiling():
+    """Stop profiling and write every stage's files; does nothing if profiling isn't on."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return
+    profiler.stop()
+    stages = profiler.write()
+    print(f"📈 Profiles for {', '.join(stages) or 'no stages'} written to {profiler.directory} "
+          f"(view with: python -m pstats {os.path.join(profiler.directory, '<stage>.pstats')})")
+
+@contextmanager
+def profile_stage(name):
+    """Profile the block as stage name while --profile is on."""
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
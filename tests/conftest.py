@@ -0,0 +1,165 @@
+import re
+import pytest
+from database import backend
+from database.connection import close_pool, use_backend
+
+# Statements that open a transaction when none is open while IMPLICIT_TRANSACTIONS is ON.
+# A SELECT only counts when it reads a table; SELECT @@TRANCOUNT does not.
+IMPLICIT_OPENERS = ('ALTER', 'CREATE', 'DELETE', 'DROP', 'INSERT', 'MERGE', 'TRUNCATE', 'UPDATE')
+WRITES = ('DELETE', 'INSERT', 'MERGE', 'UPDATE')
+
+
+class ServerError(Exception):
+    pass
+
+
+class ImplicitTransactionSession:
+    """
+    SQL Server's side of a pyodbc connection with autocommit off, which the ODBC driver runs
+    with IMPLICIT_TRANSACTIONS ON. Tracks @@TRANCOUNT and savepoints; writes become durable
+    only when the outermost transaction commits.
+    """
+
+    def __init__(self):
+        self.trancount = 0
+        self.pending = []
+        self.durable = []
+        self.savepoints = []
+        self.statements = []
+
+    def run_batch(self, batch, rows=None):
+        result = None
+        for statement in [part.strip() for part in batch.split(';')]:
+            if statement:
+                result = self.run(statement, rows)
+        return result
+
+    def run(self, statement, rows=None):
+        self.statements.append(statement)
+        upper = ' '.join(statement.split()).upper()
+        if upper.startswith('DECLARE'):
+            return None
+        guard = re.match(r'IF\s+@@TRANCOUNT\s*=\s*0\s+(.*)', statement, re.IGNORECASE | re.DOTALL)
+        if guard:
+            return self.run(guard.group(1), rows) if self.trancount == 0 else None
+        if upper == 'SELECT @@TRANCOUNT':
+            return [(self.trancount,)]
+        if upper.startswith('BEGIN TRAN'):
+            # The implicit transaction opens first, then BEGIN nests inside it
+            self.trancount += 2 if self.trancount == 0 else 1
+            return None
+        if upper.startswith('SAVE TRAN'):
+            if self.trancount == 0:
+                raise ServerError("Msg 628: Cannot issue SAVE TRANSACTION when there is no active transaction")
+            self.savepoints.append((upper.split()[-1], len(self.pending)))
+            return None
+        if upper.startswith('ROLLBACK TRAN') and len(upper.split()) == 3:
+            name = upper.split()[-1]
+            position = max(i for i, (saved, _) in enumerate(self.savepoints) if saved == name)
+            del self.pending[self.savepoints[position][1]:]
+            del self.savepoints[position + 1:]
+            return None
+        if upper.startswith('COMMIT'):
+            self.commit()
+            return None
+
+        if self.trancount == 0 and (upper.startswith(IMPLICIT_OPENERS) or
+                                    (upper.startswith('SELECT') and ' FROM ' in f" {upper} ")):
+            self.trancount = 1
+        if upper.startswith(WRITES):
+            for row in rows or [()]:
+                if 'fail' in row:
+                    raise ServerError(f"Row rejected: {row}")
+                self.pending.append((statement, row))
+        return []
+
+    def commit(self):
+        # What the driver sends for SQLEndTran(SQL_COMMIT): IF @@TRANCOUNT > 0 COMMIT TRAN
+        if self.trancount == 0:
+            return
+        self.trancount -= 1
+        if self.trancount == 0:
+            self.durable.extend(self.pending)
+            self.pending, self.savepoints = [], []
+
+    def rollback(self):
+        self.trancount = 0
+        self.pending, self.savepoints = [], []
+
+
+class EmulatedCursor:
+    def __init__(self, session):
+        self.session = session
+        self.results = []
+        self.fast_executemany = False
+
+    def execute(self, query, *params):
+        self.results = self.session.run_batch(query) or []
+        return self
+
+    def executemany(self, query, rows):
+        self.session.run_batch(query, rows)
+        return self
+
+    def fetchone(self):
+        return self.results.pop(0) if self.results else None
+
+    def fetchall(self):
+        results, self.results = self.results, []
+        return results
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # pyodbc commits when a cursor's `with` block exits without an error
+        if exc_type is None:
+            self.session.commit()
+        self.close()
+
+
+class EmulatedConnection:
+    """A pyodbc-shaped connection with autocommit off on top of an ImplicitTransactionSession."""
+
+    def __init__(self):
+        self.session = ImplicitTransactionSession()
+        self.autocommit = False
+
+    def cursor(self):
+        return EmulatedCursor(self.session)
+
+    def commit(self):
+        self.session.commit()
+
+    def rollback(self):
+        self.session.rollback()
+
+    def close(self):
+        pass
+
+    def trancount(self):
+        return self.cursor().execute("SELECT @@TRANCOUNT").fetchone()[0]
+
+
+@pytest.fixture
+def server_conn(monkeypatch):
+    """An emulated SQL Server connection, with the SQL Server dialect selected."""
+    monkeypatch.setitem(backend._backend, 'name', 'azure')
+    return EmulatedConnection()
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    """
+    A fresh local SQLite staging database for the test, run from tmp_path so review queues and
+    snapshots land there too; the configured backend comes back afterwards.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(backend._backend, 'name', backend._backend['name'])
+    monkeypatch.setitem(backend._backend, 'path', backend._backend['path'])
+    use_backend('sqlite', str(tmp_path / 'staging.sqlite3'))
+    yield
+    close_pool()
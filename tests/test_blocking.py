@@ -0,0 +1,45 @@
+import pandas as pd
+from database.blocking import backfill_blocking_keys, company_match_keys, get_blocking_candidates
+from database.connection import connect_to_db
+
+
+def write_companies(names):
+    conn = connect_to_db(False)
+    with conn.cursor() as cursor:
+        cursor.executemany("INSERT INTO staging.VoucherCompany (CompanyID, CompanyName) VALUES (?, ?)",
+                           list(enumerate(names, 1)))
+    conn.commit()
+    return conn
+
+
+def stored_keys(conn, company_id):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT MatchName, BlockPrefix, BlockPhonetic, BlockTrigram "
+                       "FROM staging.VoucherCompany WHERE CompanyID = ?", company_id)
+        return tuple(cursor.fetchone())
+
+
+def test_backfill_fills_missing_keys_once(local_db):
+    conn = write_companies(['Fundy Lobster Ltd.', 'Quantum Spruce Inc'])
+
+    assert backfill_blocking_keys('staging.VoucherCompany', conn) == 2
+    assert stored_keys(conn, 1) == company_match_keys('Fundy Lobster Ltd.')
+    assert backfill_blocking_keys('staging.VoucherCompany', conn) == 0
+    conn.close()
+
+
+def test_backfill_recomputes_keys_of_renamed_rows(local_db):
+    conn = write_companies(['Fundy Lobster Ltd.', 'Quantum Spruce Inc'])
+    backfill_blocking_keys('staging.VoucherCompany', conn)
+    # Renamed by a writer that doesn't keep the match keys
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE staging.VoucherCompany SET CompanyName = 'Granite Harbour Labs' WHERE CompanyID = 1")
+    conn.commit()
+
+    batch = pd.DataFrame({'CompanyName': ['Granite Harbour Labs']})
+    assert get_blocking_candidates('staging.VoucherCompany', batch, conn).empty
+
+    assert backfill_blocking_keys('staging.VoucherCompany', conn) == 1
+    assert stored_keys(conn, 1) == company_match_keys('Granite Harbour Labs')
+    assert get_blocking_candidates('staging.VoucherCompany', batch, conn)['CompanyID'].tolist() == [1]
+    conn.close()
@@ -0,0 +1,51 @@
+import pandas as pd
+from api.coerce import coerce_extracted
+from constants import numeric_columns
+
+
+def raw_investments(**columns):
+    rows = len(next(iter(columns.values())))
+    base = {column: [None] * rows for column in ['AmtRqstd', 'AmtAwarded', 'ApplDate', 'DecisionDate', 'Email']}
+    base.update({column: [None] * rows for column in numeric_columns})
+    base.update(columns)
+    return pd.DataFrame(base)
+
+
+def test_money_parses_and_unparseable_amounts_load_as_zero():
+    investment_df = raw_investments(AmtRqstd=['$1,250.00', 'about 5k', None], AmtAwarded=['4000', '', None])
+
+    investment_df, _, _, counts = coerce_extracted(investment_df, pd.DataFrame(), pd.DataFrame())
+
+    assert investment_df['AmtRqstd'].tolist() == [1250.0, 0.0, 0.0]
+    assert investment_df['TotalLevAmt'].tolist() == [1000.0, 0.0, 0.0]
+    assert investment_df['PrivSectorLev'].tolist() == [1000.0, 0.0, 0.0]
+    # Blanks are missing, not unparseable
+    assert counts == {'AmtRqstd': 1}
+
+
+def test_dates_try_each_format_then_iso():
+    investment_df = raw_investments(
+        ApplDate=['2024-03-15T10:30:00', '15/03/2024'],
+        DecisionDate=['2024-04-01', '2024-04-01T09:00:00'],
+    )
+
+    investment_df, _, _, counts = coerce_extracted(investment_df, pd.DataFrame(), pd.DataFrame())
+
+    assert investment_df['ApplDate'].tolist()[0] == pd.Timestamp('2024-03-15 10:30:00')
+    assert pd.isna(investment_df['ApplDate'].iat[1])
+    assert investment_df['DecisionDate'].tolist() == [pd.Timestamp('2024-04-01'), pd.Timestamp('2024-04-01 09:00:00')]
+    assert counts == {'ApplDate': 1}
+
+
+def test_emails_and_incorporation_dates():
+    investment_df = raw_investments(Email=['PI: Anne.Cormier@UNB.ca ', 'none given'])
+    people_info_df = pd.DataFrame({'Email': ['<luc@unb.ca>', None]})
+    voucher_company_df = pd.DataFrame({'IncorporationDate': ['2019/06/30', '06/30/2019', 'last year', None]})
+
+    investment_df, people_info_df, voucher_company_df, counts = coerce_extracted(
+        investment_df, people_info_df, voucher_company_df)
+
+    assert investment_df['Email'].tolist() == ['anne.cormier@unb.ca', None]
+    assert people_info_df['Email'].tolist() == ['luc@unb.ca', None]
+    assert voucher_company_df['IncorporationDate'].tolist()[:2] == [pd.Timestamp('2019-06-30')] * 2
+    assert counts == {'IncorporationDate': 1}
@@ -0,0 +1,54 @@
+import pytest
+from database import connection
+from database.backend import OPEN_TRANSACTION_SQL
+from database.connection import batch_stage, batch_transaction, connect_to_db
+
+INSERT = "INSERT INTO staging.PeopleInfo (Email) VALUES (?)"
+
+
+@pytest.fixture
+def batch_conn(server_conn, monkeypatch):
+    """server_conn checked out by batch_transaction() and released to a fresh pool, which rolls back leftovers."""
+    monkeypatch.setattr(connection, '_pool', [])
+    monkeypatch.setattr(connection, 'checkout_connection', lambda autocommit: server_conn)
+    return server_conn
+
+
+def test_batch_opens_implicit_transaction_before_first_savepoint(batch_conn):
+    with batch_transaction():
+        with batch_stage('people_sync'):
+            connect_to_db(False).cursor().execute(INSERT, 'x@y.com')
+
+    statements = batch_conn.session.statements
+    assert statements[0] == OPEN_TRANSACTION_SQL.split('; ')[0]
+    assert statements.index('SAVE TRANSACTION people_sync') < statements.index(INSERT)
+    assert not any(statement.upper().startswith('BEGIN') for statement in statements)
+
+
+def test_batch_commit_survives_release(batch_conn):
+    with batch_transaction():
+        with batch_stage('people_sync'):
+            connect_to_db(False).cursor().execute(INSERT, 'x@y.com')
+        with batch_stage('company_sync'):
+            conn = connect_to_db(False)
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE staging.VoucherCompany SET City = ?", 'Moncton')
+            conn.commit()
+            conn.close()
+
+    # release_connection has rolled back by now; only what the batch committed is left
+    assert batch_conn.trancount() == 0
+    assert [statement.split()[0] for statement, _ in batch_conn.session.durable] == ['INSERT', 'UPDATE']
+
+
+def test_failed_stage_rolls_back_the_whole_batch(batch_conn):
+    with pytest.raises(RuntimeError):
+        with batch_transaction():
+            with batch_stage('people_sync'):
+                connect_to_db(False).cursor().execute(INSERT, 'x@y.com')
+            with batch_stage('join_tables'):
+                connect_to_db(False).rollback()
+
+    assert 'ROLLBACK TRANSACTION join_tables' in batch_conn.session.statements
+    assert batch_conn.trancount() == 0
+    assert batch_conn.session.durable == []
@@ -0,0 +1,39 @@
+import uuid
+from datetime import datetime
+import pandas as pd
+import pytest
+from constants import DEDUP_POLICY
+from database.connection import connect_to_db
+from database.duplicates import resolve_by_policy
+from database.sync import sync_voucher_company_data
+
+
+@pytest.mark.parametrize('similarity, decision', [
+    (1.0, 'link'), (0.95, 'link'), (0.94, 'review'), (0.8, 'review'), (0.79, 'insert'),
+])
+def test_policy_bands(similarity, decision):
+    assert resolve_by_policy([{'similarity': similarity}], DEDUP_POLICY) == decision
+
+
+def test_unattended_company_sync_follows_the_bands(local_db):
+    conn = connect_to_db(False)
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO staging.VoucherCompany (CompanyID, CompanyName, Address, City, Province) "
+                       "VALUES (1, 'Fundy Lobster Ltd.', '1 Main St', 'Moncton', 'NB')")
+    conn.commit()
+    conn.close()
+
+    batch = pd.DataFrame({
+        # Same company with another suffix, a typo scoring in the review band, and a new company
+        'CompanyName': ['Fundy Lobster Inc', 'Fundy Lobstre Ltd', 'Quantum Spruce Inc'],
+        'Address': ['1 Main St'] * 3, 'City': ['Moncton'] * 3, 'Province': ['NB'] * 3,
+    })
+    review_queue = []
+    insert_df, skip_df, update_df = sync_voucher_company_data(
+        batch, str(uuid.uuid4()), datetime.now(), interactive=False, policy=DEDUP_POLICY, review_queue=review_queue)
+
+    assert skip_df['CompanyName'].tolist() == ['Fundy Lobster Inc']
+    assert skip_df['_matched_existing_id'].tolist() == [1]
+    assert insert_df['CompanyName'].tolist() == ['Quantum Spruce Inc']
+    assert update_df.empty
+    assert [(item['record']['CompanyName'], item['target_id']) for item in review_queue] == [('Fundy Lobstre Ltd', 1)]
@@ -0,0 +1,33 @@
+from database.insert import execute_chunked
+
+QUERY = "INSERT INTO staging.ProjectAsgmt (RefNum, PersonID) VALUES (?, ?)"
+
+
+def test_chunked_insert_commits_completely(server_conn):
+    rows = [(f"R{i}", i) for i in range(10)]
+    cursor = server_conn.cursor()
+    failed = execute_chunked(cursor, QUERY, rows, chunk_size=4)
+    server_conn.commit()
+
+    assert failed == []
+    assert server_conn.trancount() == 0
+    assert [row for _, row in server_conn.session.durable] == rows
+
+
+def test_chunked_insert_isolates_failed_rows(server_conn):
+    rows = [("R1", 1), ("R2", 'fail'), ("R3", 3), ("R4", 4)]
+    cursor = server_conn.cursor()
+    failed = execute_chunked(cursor, QUERY, rows, chunk_size=4)
+    server_conn.commit()
+
+    assert [(position, row) for position, row, _ in failed] == [(1, ("R2", 'fail'))]
+    assert server_conn.trancount() == 0
+    assert [row for _, row in server_conn.session.durable] == [("R1", 1), ("R3", 3), ("R4", 4)]
+
+
+def test_chunked_insert_never_nests_a_transaction(server_conn):
+    cursor = server_conn.cursor()
+    execute_chunked(cursor, QUERY, [("R1", 1)])
+
+    assert not any(statement.upper().startswith('BEGIN') for statement in server_conn.session.statements)
+    assert server_conn.trancount() == 1
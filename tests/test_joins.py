@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+from api.joins import process_join_tables
+from database import connection
+
+
+@pytest.fixture
+def pooled_server_conn(server_conn, monkeypatch):
+    """server_conn handed out by connect_to_db and returned to a fresh pool, which rolls back leftovers."""
+    monkeypatch.setattr(connection, '_pool', [])
+    monkeypatch.setattr(connection, 'checkout_connection', lambda autocommit: server_conn)
+    return server_conn
+
+
+def test_people_and_company_links_commit_together(pooled_server_conn):
+    investment_df = pd.DataFrame({'RefNum': ['R1', 'R2'], 'Email': ['a@x.ca', 'b@x.ca'],
+                                  'CompanyName': ['Acme', 'Beta']})
+    people_insert_df = pd.DataFrame({'Email': ['a@x.ca', 'b@x.ca'], '_inserted_id': [1, 2]})
+    company_insert_df = pd.DataFrame({'CompanyName': ['Acme', 'Beta'], '_inserted_id': [7, 8]})
+
+    process_join_tables(investment_df, people_insert_df, pd.DataFrame(), pd.DataFrame(),
+                        company_insert_df, pd.DataFrame(), pd.DataFrame(), 'batch', None)
+
+    session = pooled_server_conn.session
+    assert session.trancount == 0
+    linked = [(statement.split()[2], row[:2]) for statement, row in session.durable]
+    assert linked == [('staging.ProjectAsgmt', ('R1', 1)), ('staging.ProjectAsgmt', ('R2', 2)),
+                      ('staging.CompanyAsgmt', ('R1', 7)), ('staging.CompanyAsgmt', ('R2', 8))]
@@ -0,0 +1,70 @@
+import json
+import uuid
+from datetime import datetime
+import pandas as pd
+from database.connection import connect_to_db
+from database.review import apply_review_decisions, queue_for_review, write_review_queue
+
+
+def person_match(person_id, first_name, last_name, email, similarity):
+    return {'person_id': person_id, 'existing_first_name': first_name, 'existing_last_name': last_name,
+            'email': email, 'similarity': similarity}
+
+
+def fetch_rows(query):
+    conn = connect_to_db(False)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            return [tuple(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_apply_review_writes_decided_items_and_links_only_them(local_db):
+    conn = connect_to_db(False)
+    with conn.cursor() as cursor:
+        cursor.executemany("INSERT INTO staging.PeopleInfo (PersonID, FirstName, LastName, Email) VALUES (?, ?, ?, ?)",
+                           [(1, 'Anne', 'Cormier', 'anne@unb.ca'), (2, 'Marc', 'Landry', 'marc@unb.ca')])
+    conn.commit()
+    conn.close()
+
+    anne = person_match(1, 'Anne', 'Cormier', 'anne@unb.ca', 0.9)
+    review_queue = []
+    queue_for_review(review_queue, 'person', {'FirstName': 'Anne', 'LastName': 'Cormeir', 'Email': 'a.cormier@unb.ca'}, [anne])
+    queue_for_review(review_queue, 'person', {'FirstName': 'Luc', 'LastName': 'Gallant', 'Email': 'luc@unb.ca'}, [anne])
+    queue_for_review(review_queue, 'person', {'FirstName': 'Julie', 'LastName': 'Doucet', 'Email': 'julie@unb.ca'}, [anne])
+    queue_for_review(review_queue, 'person', {'FirstName': 'Ryan', 'LastName': 'Savoie', 'Email': 'ryan@unb.ca'}, [anne])
+    review_queue[0]['decision'] = 'update'
+    review_queue[1]['decision'] = 'insert'
+    # Points at a person that doesn't exist, so the update can't be applied
+    review_queue[2].update(decision='update', target_id=99)
+
+    investments = pd.DataFrame({'RefNum': ['R1', 'R2', 'R3'],
+                                'Email': ['a.cormier@unb.ca', 'luc@unb.ca', 'marc@unb.ca']})
+    path = write_review_queue(review_queue, uuid.uuid4(), datetime.now(), investments)
+
+    apply_review_decisions(path)
+
+    with open(path) as file:
+        items = json.load(file)['items']
+    assert [bool(item.get('applied_at')) for item in items] == [True, True, False, False]
+    assert fetch_rows("SELECT PersonID, LastName, Email FROM staging.PeopleInfo ORDER BY PersonID") == [
+        (1, 'Cormeir', 'a.cormier@unb.ca'), (2, 'Landry', 'marc@unb.ca'), (3, 'Gallant', 'luc@unb.ca')]
+    # R3's person is in the database but wasn't part of the review, so it isn't linked here
+    assert fetch_rows("SELECT RefNum, PersonID FROM staging.ProjectAsgmt ORDER BY RefNum") == [('R1', 1), ('R2', 3)]
+
+
+def test_apply_review_twice_writes_nothing_again(local_db):
+    review_queue = []
+    queue_for_review(review_queue, 'person', {'FirstName': 'Luc', 'LastName': 'Gallant', 'Email': 'luc@unb.ca'},
+                     [person_match(1, 'Luc', 'Galant', 'lgallant@unb.ca', 0.9)])
+    review_queue[0]['decision'] = 'insert'
+    path = write_review_queue(review_queue, uuid.uuid4(), datetime.now(),
+                              pd.DataFrame({'RefNum': ['R1'], 'Email': ['luc@unb.ca']}))
+
+    apply_review_decisions(path)
+    apply_review_decisions(path)
+
+    assert fetch_rows("SELECT Email FROM staging.PeopleInfo") == [('luc@unb.ca',)]
+    assert fetch_rows("SELECT RefNum FROM staging.ProjectAsgmt") == [('R1',)]
@@ -0,0 +1,71 @@
+import uuid
+from datetime import datetime
+import pandas as pd
+import pytest
+from api.joins import process_join_tables
+from conftest import EmulatedConnection
+from database import connection, rollback
+from database.connection import batch_transaction, connect_to_db
+from database.sync import stamp_batch, sync_investment_data
+from database.update import update_existing_records_by_id
+
+
+def test_pre_image_table_is_created_outside_the_batch(server_conn, monkeypatch):
+    ddl_conn = EmulatedConnection()
+    monkeypatch.setattr(rollback, '_pre_image_table_ready', False)
+    monkeypatch.setattr(rollback, 'open_connection', lambda autocommit: ddl_conn)
+    monkeypatch.setattr(connection, '_pool', [])
+    monkeypatch.setattr(connection, 'checkout_connection', lambda autocommit: server_conn)
+
+    with pytest.raises(RuntimeError):
+        with batch_transaction():
+            rollback.prepare_pre_image_table()
+            raise RuntimeError("sync failed")
+
+    assert any('CREATE TABLE staging.BatchPreImage' in statement for statement in ddl_conn.session.statements)
+    assert ddl_conn.trancount() == 0
+    assert not any('CREATE TABLE' in statement for statement in server_conn.session.statements)
+    assert rollback._pre_image_table_ready
+
+
+def fetch_rows(query):
+    conn = connect_to_db(False)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            return [tuple(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_rollback_batch_restores_pre_images(local_db):
+    conn = connect_to_db(False)
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO staging.PeopleInfo (PersonID, FirstName, LastName, Email) "
+                       "VALUES (1, 'Anne', 'Cormier', 'anne@unb.ca')")
+    conn.commit()
+    conn.close()
+    sync_investment_data(pd.DataFrame({'RefNum': ['R1'], 'ApplTitle': ['Tidal sensors'], 'ResearchFundID': ['IVF']}),
+                         str(uuid.uuid4()), datetime.now())
+    before = (fetch_rows("SELECT * FROM staging.Investment"), fetch_rows("SELECT * FROM staging.PeopleInfo"))
+
+    batch_id, loaded_at = str(uuid.uuid4()), datetime.now()
+    investments = pd.DataFrame({'RefNum': ['R1', 'R2'], 'ApplTitle': ['Tidal power', 'Spruce budworm'],
+                                'ResearchFundID': ['IVF', 'IVF'], 'Email': ['anne@unb.ca', 'anne@unb.ca']})
+    sync_investment_data(investments, batch_id, loaded_at)
+    people_update_df = stamp_batch(pd.DataFrame({'FirstName': ['Anne'], 'LastName': ['Cormier-Leger'],
+                                                 'Email': ['anne@unb.ca'], '_update_target_id': [1]}),
+                                   'staging.PeopleInfo', batch_id, loaded_at)
+    conn = connect_to_db(False)
+    update_existing_records_by_id(people_update_df, 'staging.PeopleInfo', conn)
+    conn.close()
+    empty = pd.DataFrame()
+    process_join_tables(investments, empty, empty, people_update_df, empty, empty, empty, batch_id, loaded_at)
+    assert fetch_rows("SELECT LastName FROM staging.PeopleInfo") == [('Cormier-Leger',)]
+    assert len(fetch_rows("SELECT * FROM staging.ProjectAsgmt")) == 2
+
+    assert rollback.rollback_batch(batch_id)
+
+    assert (fetch_rows("SELECT * FROM staging.Investment"), fetch_rows("SELECT * FROM staging.PeopleInfo")) == before
+    assert fetch_rows("SELECT * FROM staging.ProjectAsgmt") == []
+    assert fetch_rows(f"SELECT * FROM {rollback.PRE_IMAGE_TABLE} WHERE BatchID = '{batch_id}'") == []
@@ -0,0 +1,45 @@
+import uuid
+from datetime import datetime
+import pandas as pd
+from database.connection import connect_to_db
+from database.sync import sync_investment_data
+
+
+def investments(refnums, titles):
+    return pd.DataFrame({'RefNum': refnums, 'ApplTitle': titles, 'ResearchFundID': ['IVF'] * len(refnums)})
+
+
+def stored_investments():
+    conn = connect_to_db(False)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT RefNum, ApplTitle FROM staging.Investment ORDER BY RefNum")
+            return [tuple(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_upsert_reports_every_outcome(local_db):
+    first = sync_investment_data(investments(['R1', 'R2'], ['Tidal sensors', 'Lobster traceability']),
+                                 str(uuid.uuid4()), datetime.now())
+    assert first['_action'].tolist() == ['INSERT', 'INSERT']
+
+    # R3 appears twice with different case; the last row wins, like the database's collation
+    second = sync_investment_data(
+        investments(['R1', 'R2', 'R3', 'r3'], ['Tidal sensors', 'Lobster tracing', 'Spruce budworm', 'Spruce budworm II']),
+        str(uuid.uuid4()), datetime.now())
+
+    assert second['_action'].tolist() == ['UNCHANGED', 'UPDATE', 'DUPLICATE', 'INSERT']
+    assert stored_investments() == [('R1', 'Tidal sensors'), ('R2', 'Lobster tracing'), ('r3', 'Spruce budworm II')]
+
+
+def test_unchanged_rows_keep_their_batch(local_db):
+    first_batch = str(uuid.uuid4())
+    sync_investment_data(investments(['R1'], ['Tidal sensors']), first_batch, datetime.now())
+    sync_investment_data(investments(['R1'], ['Tidal sensors']), str(uuid.uuid4()), datetime.now())
+
+    conn = connect_to_db(False)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT BatchID FROM staging.Investment")
+        assert cursor.fetchone()[0] == first_batch
+    conn.close()